@@ -0,0 +1,23 @@
+"""
+Helpers shared by the benchmark scripts
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from musical_bingo_maker.cards import CARDS_PER_PAGE, DeckConfig  # noqa: E402
+
+TEMPLATE_PATH = os.path.join(ROOT, "template.jpg")
+FONT_PATH = os.path.join(ROOT, "JandaManateeSolid.ttf")
+
+
+def synthetic_config(num_sheets, seed=1):
+    """Song pools just large enough for num_sheets unique sheets"""
+    canciones_ganadoras = [f"Ganadora {i + 1}" for i in range(6)]
+    # A third of the cards have 5 ganadoras and 1 filler: 6 * fillers of them can exist
+    num_fillers = max(20, num_sheets * CARDS_PER_PAGE // 18 + 1)
+    canciones = [f"Canción de relleno {i + 1}" for i in range(num_fillers)]
+    return DeckConfig(canciones, canciones_ganadoras, num_sheets=num_sheets, seed=seed, max_canciones=num_fillers)
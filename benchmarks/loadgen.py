@@ -0,0 +1,149 @@
+"""
+Throughput and latency of the deck generation server under concurrent jobs
+
+Each client posts a job, streams its PDF until the end and posts the next one.
+A fraction of the jobs are urgent (priority 1) so the effect of the priority
+queue shows in their latency. Latency runs from the POST to the last byte of
+the PDF; first byte is when the first page arrived.
+
+Usage:
+    python benchmarks/loadgen.py --spawn --workers 4 --jobs 40 --concurrency 8 --sheets 10
+    python benchmarks/loadgen.py --url http://127.0.0.1:8080 --jobs 100 --urgent 0.2
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+from common import FONT_PATH, ROOT, TEMPLATE_PATH, synthetic_config
+
+
+async def request(host, port, method, path, body=None, on_chunk=None):
+    """Send one HTTP request and return (status, body); on_chunk is called as chunks of a chunked body arrive"""
+    reader, writer = await asyncio.open_connection(host, port)
+    data = b"" if body is None else json.dumps(body).encode("utf-8")
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding") == "chunked":
+        content = bytearray()
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            if size == 0:
+                break
+            chunk = await reader.readexactly(size + 2)
+            content += chunk[:-2]
+            if on_chunk is not None:
+                on_chunk(chunk)
+    else:
+        content = await reader.readexactly(int(headers["content-length"]))
+    writer.close()
+    return status, bytes(content)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+async def client(host, port, jobs, args, results):
+    config = synthetic_config(args.sheets)
+    while jobs:
+        priority = jobs.pop()
+        start = time.perf_counter()
+        first_byte = []
+        status, body = await request(host, port, "POST", "/jobs", {
+            "canciones": config.canciones,
+            "canciones_ganadoras": config.canciones_ganadoras,
+            "sheets": args.sheets,
+            "priority": priority,
+            "render_mode": args.render_mode,
+            "image_format": args.image_format,
+        })
+        if status != 202:
+            raise RuntimeError(f"POST /jobs failed with {status}: {body.decode('utf-8', 'replace')}")
+        job = json.loads(body)
+        status, pdf = await request(host, port, "GET", job["links"]["pdf"],
+                                    on_chunk=lambda _: first_byte or first_byte.append(time.perf_counter()))
+        if status != 200 or not pdf.rstrip().endswith(b"%%EOF"):
+            raise RuntimeError(f"Job {job['id']} returned an incomplete PDF")
+        end = time.perf_counter()
+        results.append({"priority": priority, "latency": end - start,
+                        "first_byte": (first_byte[0] if first_byte else end) - start, "bytes": len(pdf)})
+
+
+async def run(args):
+    url = urlsplit(args.url)
+    rng = random.Random(args.seed)
+    jobs = [1 if rng.random() < args.urgent else 0 for _ in range(args.jobs)]
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(url.hostname, url.port, jobs, args, results) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    
+    print(f"{len(results)} jobs of {args.sheets} sheets in {elapsed:.2f} s: "
+          f"{len(results) / elapsed:.2f} jobs/s, {len(results) * args.sheets / elapsed:.1f} pages/s, "
+          f"{sum(result['bytes'] for result in results) / elapsed / 2 ** 20:.1f} MiB/s")
+    print(f"{'priority':>8} {'jobs':>5} {'p50 (s)':>8} {'p95 (s)':>8} {'max (s)':>8} "
+          f"{'first byte p50':>15} {'first byte p95':>15}")
+    for priority in sorted({result["priority"] for result in results}, reverse=True):
+        latencies = [result["latency"] for result in results if result["priority"] == priority]
+        first_bytes = [result["first_byte"] for result in results if result["priority"] == priority]
+        print(f"{priority:>8} {len(latencies):>5} {percentile(latencies, 0.5):>8.2f} "
+              f"{percentile(latencies, 0.95):>8.2f} {max(latencies):>8.2f} "
+              f"{percentile(first_bytes, 0.5):>15.2f} {percentile(first_bytes, 0.95):>15.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--spawn", action="store_true", help="start a server on --url for the run")
+    parser.add_argument("--workers", type=int, default=2, help="render workers of the spawned server")
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--sheets", type=int, default=10)
+    parser.add_argument("--urgent", type=float, default=0.2, help="fraction of jobs with priority 1")
+    parser.add_argument("--render-mode", default="raster")
+    parser.add_argument("--image-format", default="PNG")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.sheets < 1:
+        parser.error("--sheets must be at least 1")
+    
+    server = None
+    if args.spawn:
+        url = urlsplit(args.url)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "musical_bingo_maker.server", "--host", url.hostname, "--port", str(url.port),
+             "--workers", str(args.workers), "--template", TEMPLATE_PATH, "--font", FONT_PATH,
+             "--songs", "", "--max-sheets", str(args.sheets)],
+            cwd=ROOT, stdout=subprocess.PIPE, text=True,
+        )
+        # The server prints a line once its workers are warm
+        print(server.stdout.readline().strip())
+    try:
+        asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+
+
+if __name__ == "__main__":
+    main()
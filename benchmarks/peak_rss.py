@@ -0,0 +1,80 @@
+"""
+Peak memory of a whole generation run, at several deck sizes
+
+Each run happens in a fresh process, which reports its own peak RSS. With
+--stream the pages are generated, rendered and written through the bounded
+pipeline in PDF parts; without it the whole deck is built first and written
+through a single reportlab canvas.
+
+Usage:
+    python benchmarks/peak_rss.py --render-mode vector --sheets 15 500 2000
+    python benchmarks/peak_rss.py --render-mode raster --image-format JPEG --sheets 15 100 300
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import FONT_PATH, TEMPLATE_PATH, synthetic_config
+from musical_bingo_maker.cards import generate, iter_pages
+from musical_bingo_maker.render import create_pdf_with_images
+
+
+def peak_rss_mib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_child(args):
+    config = synthetic_config(args.child)
+    pages = iter_pages(config) if args.stream else generate(config).pages
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        create_pdf_with_images(
+            TEMPLATE_PATH,
+            pages,
+            os.path.join(tmp, "deck.pdf"),
+            render_mode=args.render_mode,
+            image_format=args.image_format,
+            font_path=FONT_PATH,
+            verbose=False,
+            part_size=args.part_size if args.stream else None,
+        )
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(os.path.join(tmp, "deck.pdf"))
+    print(json.dumps({"sheets": args.child, "peak_rss_mib": round(peak_rss_mib(), 1),
+                      "seconds": round(elapsed, 2), "pdf_mib": round(size / 2 ** 20, 2)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sheets", type=int, nargs="+", default=[15, 500, 2000])
+    parser.add_argument("--render-mode", default="vector")
+    parser.add_argument("--image-format", default="JPEG")
+    parser.add_argument("--part-size", type=int, default=64)
+    parser.add_argument("--no-stream", dest="stream", action="store_false",
+                        help="build the whole deck and write one canvas, for comparison")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child is not None:
+        run_child(args)
+        return
+    
+    print(f"{'sheets':>8} {'peak RSS (MiB)':>15} {'seconds':>9} {'PDF (MiB)':>10}")
+    for num_sheets in args.sheets:
+        command = [sys.executable, __file__, "--child", str(num_sheets), "--render-mode", args.render_mode,
+                   "--image-format", args.image_format, "--part-size", str(args.part_size)]
+        if not args.stream:
+            command.append("--no-stream")
+        result = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+        print(f"{result['sheets']:>8} {result['peak_rss_mib']:>15} {result['seconds']:>9} {result['pdf_mib']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Time each stage of a generation run separately, at several deck sizes
+
+Stages:
+    generate   - sampling the unique cards of the whole deck
+    fit_text   - fitting every distinct song title of the deck, with a cold cache
+    atlas      - drawing the distinct titles of the sample pages into a TileAtlas (fit_text warm)
+    draw       - pasting the titles of the sample pages from the atlas onto the template, as page_pdf does
+    encode     - PNG encoding of the sample pages
+    pdf_draw   - reportlab drawImage of the sample pages
+    pdf_save   - reportlab save of the sample pages
+
+The page stages run on the first --pages pages of each deck, so a 10k sheet
+deck doesn't take hours; their per-call times are what to compare. Results are
+written as JSON, and --compare reports the stages that got slower than a
+previous run.
+
+Usage:
+    python benchmarks/stages.py --output bench.json
+    python benchmarks/stages.py --sheets 15 500 --compare bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from common import FONT_PATH, ROOT, TEMPLATE_PATH, synthetic_config
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from musical_bingo_maker.cards import generate
+from musical_bingo_maker.layout import CARDS_PER_PAGE, fit_text, page_layout
+from musical_bingo_maker.render import create_image_with_text, fit_image_on_page, page_image_reader, template_size
+from musical_bingo_maker.tilecache import TileAtlas, distinct_cells
+
+STAGES = ("generate", "fit_text", "atlas", "draw", "encode", "pdf_draw", "pdf_save")
+
+
+@contextlib.contextmanager
+def timed(timings, stage, calls):
+    """Add the time spent in the block to timings[stage], keeping the fastest repeat"""
+    start = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - start
+    if stage not in timings or seconds < timings[stage]["seconds"]:
+        timings[stage] = {"seconds": seconds, "calls": calls}
+
+
+def bench_size(num_sheets, num_pages, repeat):
+    """Time every stage for one deck size"""
+    timings = {}
+    for _ in range(repeat):
+        config = synthetic_config(num_sheets)
+        with timed(timings, "generate", num_sheets * CARDS_PER_PAGE):
+            deck = generate(config)
+
+        img_width, img_height = template_size(TEMPLATE_PATH)
+        card_layout = page_layout(TEMPLATE_PATH, img_width, img_height)
+        cell_width, cell_height = card_layout.cells[0][0][2:]
+        titles = sorted({song for page in deck.pages for card in page for song in card})
+        fit_text.cache_clear()
+        with timed(timings, "fit_text", len(titles)):
+            for title in titles:
+                fit_text(title, cell_width, cell_height, FONT_PATH)
+
+        sample = deck.pages[:num_pages]
+        cells = distinct_cells(card_layout, sample)
+        atlas = TileAtlas()
+        with timed(timings, "atlas", len(cells)):
+            atlas.prerender(cells, FONT_PATH)
+
+        with timed(timings, "draw", len(sample)):
+            images = [create_image_with_text(TEMPLATE_PATH, page, FONT_PATH, atlas) for page in sample]
+
+        with timed(timings, "encode", len(images)):
+            encoded = []
+            for image in images:
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG", compress_level=6)
+                encoded.append((buffer.getvalue(), image.size, image.mode))
+
+        x, y, width, height = fit_image_on_page(img_width, img_height, A4)
+        c = canvas.Canvas(io.BytesIO(), pagesize=A4)
+        with timed(timings, "pdf_draw", len(encoded)):
+            for img_bytes, size, mode in encoded:
+                c.drawImage(page_image_reader(img_bytes, size, mode, "PNG"), x, y, width=width, height=height)
+                c.showPage()
+        with timed(timings, "pdf_save", len(encoded)):
+            c.save()
+
+    for timing in timings.values():
+        timing["ms_per_call"] = timing["seconds"] * 1000 / max(timing["calls"], 1)
+    return timings
+
+
+def run_metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def print_results(results):
+    print(f"{'sheets':>8} {'stage':<10} {'calls':>8} {'seconds':>9} {'ms/call':>10}")
+    for num_sheets, timings in results.items():
+        for stage in STAGES:
+            timing = timings[stage]
+            print(f"{num_sheets:>8} {stage:<10} {timing['calls']:>8} {timing['seconds']:>9.3f} "
+                  f"{timing['ms_per_call']:>10.3f}")
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the per-call change of every stage against a baseline run
+
+    Returns:
+        List of (sheets, stage) that got slower by more than threshold
+    """
+    regressions = []
+    print(f"\n{'sheets':>8} {'stage':<10} {'before':>10} {'after':>10} {'change':>8}")
+    for num_sheets, timings in results.items():
+        for stage in STAGES:
+            before = baseline.get(num_sheets, {}).get(stage)
+            if before is None:
+                continue
+            after = timings[stage]["ms_per_call"]
+            change = after / before["ms_per_call"] - 1 if before["ms_per_call"] else 0.0
+            flag = ""
+            if change > threshold:
+                regressions.append((num_sheets, stage))
+                flag = "  slower"
+            print(f"{num_sheets:>8} {stage:<10} {before['ms_per_call']:>10.3f} {after:>10.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sheets", type=int, nargs="+", default=[15, 500, 10000])
+    parser.add_argument("--pages", type=int, default=4, help="pages rendered per deck size (default: 4)")
+    parser.add_argument("--repeat", type=int, default=3, help="keep the fastest of this many runs (default: 3)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="flag stages more than this fraction slower per call (default: 0.15)")
+    args = parser.parse_args()
+
+    results = {}
+    for num_sheets in args.sheets:
+        results[str(num_sheets)] = bench_size(num_sheets, args.pages, args.repeat)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": run_metadata(), "pages": args.pages, "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
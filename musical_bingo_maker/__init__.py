@@ -0,0 +1,76 @@
+"""
+Musical Bingo Maker: generate unique musical bingo cards and print them to PDF
+
+Typical use from Python, e.g. to make many decks in one process:
+
+    from musical_bingo_maker import DeckConfig, generate, create_pdf_with_images
+
+    deck = generate(DeckConfig(canciones, canciones_ganadoras, num_sheets=15, seed=1))
+    create_pdf_with_images("template.jpg", deck.pages, "musical-bingo-cards.pdf")
+"""
+from .analysis import (
+    DeckReport,
+    analyze_deck,
+    analyze_pages,
+    check_for_duplicate_cards,
+    print_duplicate_report,
+    print_song_usage_summary,
+    verify_deck,
+)
+from .callorder import early_cards, repair_early_cards
+from .cardexport import card_svg, export_cards, render_card
+from .cards import Deck, DeckConfig, UniqueCardSampler, generate, iter_pages, shard_pages
+from .compact import CompactDeck, compact_deck, load_deck
+from .cli import load_song_pools, main
+from .incremental import build_incremental
+from .layout import CardLayout, PageLayout, fit_text, layout_text, load_layout, page_layout, wrap_text
+from .pdfmerge import merge_pdfs
+from .render import create_image_with_text, create_pdf_with_images, render_page
+from .simulation import GameSimulator, SimulationReport, print_simulation_report, simulate_deck
+from .tilecache import TileAtlas, TileCache
+
+__version__ = "1.0.0"
+
+__all__ = [
+    "CardLayout",
+    "CompactDeck",
+    "Deck",
+    "DeckConfig",
+    "DeckReport",
+    "GameSimulator",
+    "PageLayout",
+    "SimulationReport",
+    "TileAtlas",
+    "TileCache",
+    "UniqueCardSampler",
+    "analyze_deck",
+    "analyze_pages",
+    "build_incremental",
+    "card_svg",
+    "check_for_duplicate_cards",
+    "compact_deck",
+    "create_image_with_text",
+    "create_pdf_with_images",
+    "early_cards",
+    "export_cards",
+    "fit_text",
+    "generate",
+    "iter_pages",
+    "layout_text",
+    "load_deck",
+    "load_layout",
+    "load_song_pools",
+    "main",
+    "merge_pdfs",
+    "page_layout",
+    "print_duplicate_report",
+    "print_simulation_report",
+    "print_song_usage_summary",
+    "render_card",
+    "render_page",
+    "repair_early_cards",
+    "shard_pages",
+    "simulate_deck",
+    "verify_deck",
+    "wrap_text",
+]
@@ -0,0 +1,533 @@
+"""
+Deck statistics and checks: song usage, card uniqueness and the winning card
+
+analyze_pages does all the work in one pass and returns a DeckReport; the
+print_* functions and the checks only format a report, so large decks can be
+analyzed without printing anything. With NumPy installed, analyze_deck checks
+large decks with the batch functions instead (see analyze_ids).
+"""
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .batch import duplicate_cards, song_usage
+from .compact import CompactDeck
+
+# Decks of at least this many cards are analyzed with NumPy, when it is installed
+BATCH_ANALYSIS_CARDS = 10000
+
+
+@dataclass
+class DeckReport:
+    """
+    Statistics of a deck of bingo cards
+
+    Card locations are (page, card) tuples numbered from 1.
+
+    Attributes:
+        total_cards: Number of cards analyzed
+        unique_cards: Number of different sets of songs among the cards
+        duplicate_groups: Locations of the cards sharing each repeated set of songs,
+                          with the songs of each group in duplicate_songs
+        duplicate_songs: Sorted songs of each duplicate group
+        exact_duplicate_groups: Locations of the cards sharing the same songs
+                                with the same repetitions
+        winner_locations: Cards whose songs are exactly the canciones_ganadoras
+        song_counts: Number of card slots filled with each song
+        internal_duplicates: Cards with a song more than once, mapped to those songs
+        min_songs_per_card: Fewest different songs on a card
+        max_songs_per_card: Most different songs on a card
+        avg_songs_per_card: Average number of different songs on a card
+        canciones: Songs of the canciones pool, if given
+        canciones_ganadoras: Songs of the canciones_ganadoras pool, if given
+    """
+    total_cards: int = 0
+    unique_cards: int = 0
+    duplicate_groups: List[List[Tuple[int, int]]] = field(default_factory=list)
+    duplicate_songs: List[List[str]] = field(default_factory=list)
+    exact_duplicate_groups: List[List[Tuple[int, int]]] = field(default_factory=list)
+    winner_locations: List[Tuple[int, int]] = field(default_factory=list)
+    song_counts: Counter = field(default_factory=Counter)
+    internal_duplicates: Dict[Tuple[int, int], List[str]] = field(default_factory=dict)
+    min_songs_per_card: int = 0
+    max_songs_per_card: int = 0
+    avg_songs_per_card: float = 0.0
+    canciones: List[str] = field(default_factory=list)
+    canciones_ganadoras: List[str] = field(default_factory=list)
+
+    @property
+    def total_slots(self):
+        return sum(self.song_counts.values())
+
+    @property
+    def winner_count(self):
+        return len(self.winner_locations)
+
+    @property
+    def all_unique(self):
+        return not self.duplicate_groups
+
+    @property
+    def ok(self):
+        """True if the cards are unique and exactly one of them is the winner"""
+        return not self.exact_duplicate_groups and self.winner_count == 1
+
+    def pool_usage(self):
+        """
+        Split the song slots between the song pools
+
+        Returns:
+            Tuple (used_from_ganadoras, used_from_canciones, ganadora_slots, cancion_slots)
+            with the sets of songs used from each pool and the slots they fill
+        """
+        ganadoras = set(self.canciones_ganadoras)
+        canciones = set(self.canciones)
+        used_from_ganadoras = set()
+        used_from_canciones = set()
+        ganadora_slots = 0
+        cancion_slots = 0
+        for song, count in self.song_counts.items():
+            if song in ganadoras:
+                used_from_ganadoras.add(song)
+                ganadora_slots += count
+            elif song in canciones:
+                used_from_canciones.add(song)
+                cancion_slots += count
+        return used_from_ganadoras, used_from_canciones, ganadora_slots, cancion_slots
+
+    def usage_spread(self):
+        """
+        How evenly the songs of each pool are used
+
+        Returns:
+            Dict of pool name ("canciones_ganadoras", "canciones") to (fewest, most)
+            uses of a song of that pool, among the songs used at all; None for an unused pool
+        """
+        pools = {"canciones_ganadoras": set(self.canciones_ganadoras), "canciones": set(self.canciones)}
+        counts = {pool: [] for pool in pools}
+        for song, count in self.song_counts.items():
+            for pool, songs in pools.items():
+                if song in songs:
+                    counts[pool].append(count)
+                    break
+        return {pool: (min(values), max(values)) if values else None for pool, values in counts.items()}
+
+
+class _SongIds(dict):
+    """Song to integer id mapping that gives new songs the next free id"""
+
+    def __missing__(self, song):
+        song_id = self[song] = len(self)
+        return song_id
+
+
+def analyze_pages(pages, canciones=(), canciones_ganadoras=()):
+    """
+    Collect the statistics of a deck in a single pass over its cards
+
+    Songs are interned to integer ids, so each card reduces to a bitmask of its
+    songs (for set equality and the winner check) and a sorted tuple of ids
+    (for exact duplicates), and the slot counts are a Counter over the ids.
+
+    Args:
+        pages: List of pages, where each page is a list of cards,
+               and each card is a list of songs
+        canciones: Songs of the canciones pool, for the pool usage
+        canciones_ganadoras: Songs of the winning card; without them no winner is looked for
+
+    Returns:
+        DeckReport
+    """
+    song_ids = _SongIds()
+    winner_mask = 0
+    for song in canciones_ganadoras:
+        winner_mask |= 1 << song_ids[song]
+
+    first_by_mask = {}
+    groups_by_mask = {}
+    first_by_signature = {}
+    groups_by_signature = {}
+    winner_locations = []
+    internal_duplicate_cards = []
+    all_ids = []
+    # Number of cards with each number of different songs
+    songs_per_card = Counter()
+
+    for page_idx, page in enumerate(pages, 1):
+        for card_idx, card in enumerate(page, 1):
+            location = (page_idx, card_idx)
+            card_ids = list(map(song_ids.__getitem__, card))
+            all_ids.extend(card_ids)
+
+            mask = 0
+            for song_id in card_ids:
+                mask |= 1 << song_id
+            num_songs = bin(mask).count("1")
+            songs_per_card[num_songs] += 1
+            if num_songs != len(card_ids):
+                internal_duplicate_cards.append((location, card_ids))
+            if mask == winner_mask and winner_mask:
+                winner_locations.append(location)
+
+            first = first_by_mask.setdefault(mask, location)
+            if first is not location:
+                groups_by_mask.setdefault(mask, [first]).append(location)
+
+            signature = tuple(sorted(card_ids))
+            first = first_by_signature.setdefault(signature, location)
+            if first is not location:
+                groups_by_signature.setdefault(signature, [first]).append(location)
+
+    total_cards = sum(songs_per_card.values())
+    songs = list(song_ids)
+    id_counts = Counter(all_ids)
+    song_counts = Counter({songs[song_id]: count for song_id, count in id_counts.items()})
+
+    # List the groups in the order their first card appears
+    duplicate_masks = sorted(groups_by_mask, key=lambda mask: groups_by_mask[mask][0])
+    duplicate_songs = []
+    for mask in duplicate_masks:
+        duplicate_songs.append(sorted(songs[i] for i in range(len(songs)) if mask >> i & 1))
+
+    internal_duplicates = {}
+    for location, card_ids in internal_duplicate_cards:
+        card_counts = Counter(card_ids)
+        internal_duplicates[location] = [songs[i] for i, count in card_counts.items() if count > 1]
+
+    return DeckReport(
+        total_cards=total_cards,
+        unique_cards=len(first_by_mask),
+        duplicate_groups=[groups_by_mask[mask] for mask in duplicate_masks],
+        duplicate_songs=duplicate_songs,
+        exact_duplicate_groups=sorted(groups_by_signature.values()),
+        winner_locations=winner_locations,
+        song_counts=song_counts,
+        internal_duplicates=internal_duplicates,
+        min_songs_per_card=min(songs_per_card, default=0),
+        max_songs_per_card=max(songs_per_card, default=0),
+        avg_songs_per_card=sum(n * count for n, count in songs_per_card.items()) / max(total_cards, 1),
+        canciones=list(canciones),
+        canciones_ganadoras=list(canciones_ganadoras),
+    )
+
+
+def analyze_ids(ids, songs, cards_per_page, canciones=(), canciones_ganadoras=()):
+    """
+    Collect the statistics of a deck of song ids with NumPy
+
+    Cards are checked with batch.duplicate_cards and songs counted with
+    batch.song_usage, so only the cards with a problem are looked at one by
+    one. The report is the same as analyze_pages gives for the songs.
+
+    Args:
+        ids: Integer array with one row of song ids per card, pages one after the other
+        songs: Titles of the songs, indexed by song id
+        cards_per_page: Cards on each page, to locate the cards
+        canciones: Songs of the canciones pool, for the pool usage
+        canciones_ganadoras: Songs of the winning card; without them no winner is looked for
+
+    Returns:
+        DeckReport
+
+    Raises:
+        RuntimeError: If NumPy is not installed
+    """
+    if np is None:
+        raise RuntimeError("analyze_ids needs NumPy")
+    ids = np.asarray(ids, dtype=np.intp)
+    total_cards, width = ids.shape
+    num_songs = len(songs)
+
+    def location(row):
+        return (row // cards_per_page + 1, row % cards_per_page + 1)
+
+    rows = np.sort(ids, axis=1)
+    repeated = np.zeros(rows.shape, dtype=bool)
+    repeated[:, 1:] = rows[:, 1:] == rows[:, :-1]
+    songs_per_card = width - np.count_nonzero(repeated, axis=1)
+    # Each card as its set of songs: repeats become num_songs, which is no song, and sort last
+    set_rows = np.where(repeated, num_songs, rows)
+    set_rows.sort(axis=1)
+
+    duplicate_groups = _equal_row_groups(set_rows) if duplicate_cards(set_rows).size else []
+    exact_groups = _equal_row_groups(rows) if duplicate_cards(rows).size else []
+
+    winner_locations = []
+    song_index = {song: song_id for song_id, song in enumerate(songs)}
+    winner_ids = sorted({song_index.get(song, -1) for song in canciones_ganadoras})
+    if winner_ids and winner_ids[0] >= 0 and len(winner_ids) <= width:
+        winner_row = np.full(width, num_songs, dtype=np.intp)
+        winner_row[:len(winner_ids)] = winner_ids
+        winner_locations = [location(row)
+                            for row in np.flatnonzero(np.all(set_rows == winner_row, axis=1)).tolist()]
+
+    # Count the songs in order of first appearance, as analyze_pages does
+    usage = song_usage(ids, num_songs)
+    used, first_slots = np.unique(ids, return_index=True)
+    song_counts = Counter({songs[song_id]: int(usage[song_id])
+                           for song_id in used[np.argsort(first_slots)].tolist()})
+
+    internal_duplicates = {}
+    for row in np.flatnonzero(songs_per_card < width).tolist():
+        card_counts = Counter(ids[row].tolist())
+        internal_duplicates[location(row)] = [songs[i] for i, count in card_counts.items() if count > 1]
+
+    return DeckReport(
+        total_cards=total_cards,
+        unique_cards=total_cards - sum(len(group) - 1 for group in duplicate_groups),
+        duplicate_groups=[[location(row) for row in group] for group in duplicate_groups],
+        duplicate_songs=[sorted(songs[i] for i in set_rows[group[0]].tolist() if i < num_songs)
+                         for group in duplicate_groups],
+        exact_duplicate_groups=[[location(row) for row in group] for group in exact_groups],
+        winner_locations=winner_locations,
+        song_counts=song_counts,
+        internal_duplicates=internal_duplicates,
+        min_songs_per_card=int(songs_per_card.min(initial=width)) if total_cards else 0,
+        max_songs_per_card=int(songs_per_card.max(initial=0)),
+        avg_songs_per_card=int(songs_per_card.sum()) / max(total_cards, 1),
+        canciones=list(canciones),
+        canciones_ganadoras=list(canciones_ganadoras),
+    )
+
+
+def _equal_row_groups(rows):
+    """Groups of equal rows, each a list of ascending row indices, in order of their first row"""
+    columns = tuple(rows[:, column] for column in reversed(range(rows.shape[1])))
+    # lexsort is stable, so equal rows stay in order
+    order = np.lexsort(columns).tolist()
+    sorted_rows = rows[order]
+    groups = []
+    for position in np.flatnonzero(np.all(sorted_rows[1:] == sorted_rows[:-1], axis=1)).tolist():
+        if groups and groups[-1][-1] == order[position]:
+            groups[-1].append(order[position + 1])
+        else:
+            groups.append([order[position], order[position + 1]])
+    return sorted(groups)
+
+
+def _deck_ids(deck):
+    """(ids, songs, cards_per_page) of a deck to analyze with NumPy, or None to analyze its pages"""
+    if np is None:
+        return None
+    if isinstance(deck, CompactDeck):
+        return deck.ids, deck.songs, deck.cards_per_page
+    if deck.num_cards < BATCH_ANALYSIS_CARDS:
+        return None
+    cards_per_page = len(deck.pages[0])
+    width = len(deck.pages[0][0]) if cards_per_page else 0
+    if not width or any(len(page) != cards_per_page or any(len(card) != width for card in page)
+                        for page in deck.pages):
+        return None
+    song_ids = {}
+    ids = np.fromiter((song_ids.setdefault(song, len(song_ids))
+                       for page in deck.pages for card in page for song in card),
+                      dtype=np.intp, count=deck.num_cards * width)
+    return ids.reshape(deck.num_cards, width), list(song_ids), cards_per_page
+
+
+def analyze_deck(deck):
+    """
+    Collect the statistics of a Deck or a CompactDeck
+
+    With NumPy installed, a CompactDeck and a Deck of at least
+    BATCH_ANALYSIS_CARDS cards are analyzed by analyze_ids.
+
+    Args:
+        deck: Deck or CompactDeck to analyze
+
+    Returns:
+        DeckReport
+    """
+    deck_ids = _deck_ids(deck)
+    if deck_ids is not None:
+        return analyze_ids(*deck_ids, deck.canciones, deck.canciones_ganadoras)
+    return analyze_pages(deck.pages, deck.canciones, deck.canciones_ganadoras)
+
+
+def _location_str(location):
+    return f"Page {location[0]}, Card {location[1]}"
+
+
+def print_duplicate_report(report):
+    """
+    Print the duplicate card analysis and the song statistics of a report
+
+    Args:
+        report: DeckReport
+    """
+    total_cards = report.total_cards
+    print(f"\n=== COMPREHENSIVE DUPLICATE CARD ANALYSIS ===")
+    print(f"Total cards analyzed: {total_cards}")
+    print(f"Unique card combinations: {report.unique_cards}")
+    print(f"Duplicate groups found: {len(report.duplicate_groups)}")
+
+    if report.duplicate_groups:
+        print(f"\n⚠️ WARNING: Found {len(report.duplicate_groups)} sets of duplicate cards:")
+        print(f"{'='*60}")
+
+        duplicate_count = 0
+        for group_idx, (songs, locations) in enumerate(zip(report.duplicate_songs, report.duplicate_groups), 1):
+            duplicate_count += len(locations)
+            print(f"\nDuplicate Group #{group_idx}:")
+            print(f"  Songs: {songs}")
+            print(f"  Found in {len(locations)} locations:")
+
+            for location in locations:
+                print(f"    - {_location_str(location)}")
+
+        print(f"\n{'='*60}")
+        print(f"Summary: {duplicate_count} total cards are duplicates")
+        print(f"Affected cards: {duplicate_count} out of {total_cards} ({duplicate_count/total_cards*100:.1f}%)")
+
+        # Provide recommendations
+        print(f"\n💡 RECOMMENDATIONS:")
+        print(f"   • Increase song variety in your song pools")
+        print(f"   • Reduce the number of cards if song pool is limited")
+        print(f"   • Ensure the card generation algorithm creates more unique combinations")
+
+    else:
+        print(f"\n✅ SUCCESS: All {total_cards} cards are unique!")
+        print(f"   No duplicate cards found across all pages.")
+
+    if not total_cards:
+        print(f"={'='*50}")
+        return
+
+    # Additional statistics
+    print(f"\n📊 DETAILED STATISTICS:")
+
+    total_song_slots = report.total_slots
+    song_usage = report.song_counts
+    most_used_songs = sorted(song_usage.items(), key=lambda x: x[1], reverse=True)[:5]
+    least_used_songs = sorted(song_usage.items(), key=lambda x: x[1])[:5]
+
+    print(f"   • Total song slots across all cards: {total_song_slots}")
+    print(f"   • Different songs used: {len(song_usage)}")
+    print(f"   • Average uses per song: {total_song_slots/len(song_usage):.1f}")
+
+    print(f"\n   Most frequently used songs:")
+    for song, count in most_used_songs:
+        percentage = (count / total_song_slots) * 100
+        print(f"     - '{song}': {count} times ({percentage:.1f}%)")
+
+    print(f"\n   Least frequently used songs:")
+    for song, count in least_used_songs:
+        percentage = (count / total_song_slots) * 100
+        print(f"     - '{song}': {count} times ({percentage:.1f}%)")
+
+    print(f"\n   Songs per card: min={report.min_songs_per_card}, max={report.max_songs_per_card}, "
+          f"avg={report.avg_songs_per_card:.1f}")
+
+    if report.internal_duplicates:
+        print(f"\n⚠️ Cards with internal duplicates (same song twice): {len(report.internal_duplicates)}")
+        for location, duplicated_songs in report.internal_duplicates.items():
+            print(f"   - {_location_str(location)}: {duplicated_songs}")
+    else:
+        print(f"\n✅ No cards have internal song duplicates")
+
+    print(f"={'='*50}")
+
+
+def check_for_duplicate_cards(text_variations, verbose=True):
+    """
+    Comprehensive function to check for duplicate bingo cards across all pages.
+    Two cards are considered duplicates if they contain the same songs, regardless of order.
+
+    Args:
+        text_variations: List of pages, where each page is a list of cards,
+                        and each card is a list of songs
+        verbose: Print the analysis and the song statistics
+
+    Returns:
+        True if no duplicates were found
+    """
+    report = analyze_pages(text_variations)
+    if verbose:
+        print_duplicate_report(report)
+    return report.all_unique
+
+
+def print_song_usage_summary(deck, report=None):
+    """
+    Print how many songs and card slots come from each song pool
+
+    Args:
+        deck: Deck to summarize
+        report: DeckReport of the deck, if already computed
+    """
+    if report is None:
+        report = analyze_deck(deck)
+    canciones = deck.canciones
+    canciones_ganadoras = deck.canciones_ganadoras
+
+    used_from_ganadoras, used_from_canciones, total_ganadora_slots, total_cancion_slots = report.pool_usage()
+    total_slots = total_ganadora_slots + total_cancion_slots
+    ganadora_percentage = (total_ganadora_slots / total_slots) * 100 if total_slots else 0.0
+
+    print(f"\n=== OPTIMIZED SONG USAGE SUMMARY ===")
+    print(f"Total different songs used: {len(used_from_canciones) + len(used_from_ganadoras)}")
+    print(f"Songs from 'canciones': {len(used_from_canciones)} out of {len(canciones)} available ({len(used_from_canciones)}/{len(canciones)} = {len(used_from_canciones)/len(canciones)*100:.1f}%)")
+    print(f"Songs from 'canciones_ganadoras': {len(used_from_ganadoras)} out of {len(canciones_ganadoras)} available")
+    print(f"")
+    print(f"SLOT USAGE OPTIMIZATION:")
+    print(f"Total song slots: {total_slots}")
+    print(f"Slots filled with canciones_ganadoras: {total_ganadora_slots} ({ganadora_percentage:.1f}%)")
+    print(f"Slots filled with canciones: {total_cancion_slots} ({100-ganadora_percentage:.1f}%)")
+    print(f"")
+    print(f"Songs from 'canciones' used: {sorted(list(used_from_canciones))}")
+    print(f"")
+    print(f"USAGE SPREAD (uses of each song, fewest to most):")
+    for pool, spread in report.usage_spread().items():
+        if spread is not None:
+            print(f"{pool}: {spread[0]} to {spread[1]} (spread {spread[1] - spread[0]})")
+    print("=====================================")
+
+
+def verify_deck(deck, report=None, verbose=True):
+    """
+    Check that all the cards are unique and that exactly one card is the winner
+
+    Args:
+        deck: Deck to verify
+        report: DeckReport of the deck, if already computed
+        verbose: Print the results of the checks
+
+    Returns:
+        True if the deck passes both checks
+    """
+    if report is None:
+        report = analyze_deck(deck)
+    if not verbose:
+        return report.ok
+
+    print(f"\n=== CARD UNIQUENESS VERIFICATION ===")
+    print(f"Total cards generated: {report.total_cards}")
+    print(f"Unique card combinations: {report.total_cards - sum(len(g) - 1 for g in report.exact_duplicate_groups)}")
+
+    if report.exact_duplicate_groups:
+        print(f"⚠ WARNING: Found {len(report.exact_duplicate_groups)} duplicate card combinations:")
+        for locations in report.exact_duplicate_groups:
+            page, card = locations[0]
+            location_str = ", ".join([f"Page {p} Card {c}" for p, c in locations])
+            print(f"  - Duplicate found at: {location_str}")
+            print(f"    Songs: {sorted(deck.pages[page - 1][card - 1])}")
+    else:
+        print("✓ SUCCESS: All cards are unique!")
+
+    for location in report.winner_locations:
+        print(f"WINNER FOUND: {_location_str(location)}")
+
+    print(f"\nWINNER VERIFICATION: {report.winner_count} card(s) contain ALL canciones_ganadoras")
+    if report.winner_count == 1:
+        print("✓ SUCCESS: Exactly one winning card exists!")
+    else:
+        print("⚠ WARNING: There should be exactly one winning card!")
+
+    print("======================================")
+
+    return report.ok
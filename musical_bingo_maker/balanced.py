@@ -0,0 +1,228 @@
+"""
+Balanced decks: every song of a pool used as evenly as the cards allow
+
+Songs are dealt like playing cards from a shoe that is reshuffled each time it
+runs out, one shoe for the canciones_ganadoras and one for the fillers, so the
+songs dealt least are always next and the usage of any two songs of a pool
+differs by at most one. A card whose songs were already dealt together is
+replaced by the cheapest other hand from the next few songs of each shoe,
+which keeps every card unique at the cost of a slightly larger spread.
+"""
+import itertools
+import random
+
+from .cards import CARDS_PER_PAGE, SONGS_PER_CARD, _comb, derive_seed, ganadoras_for_card
+
+# Songs beyond the needed ones looked at when a hand repeats an earlier card,
+# doubled until a new card turns up or the whole pool has been looked at
+_EXTRA_CANDIDATES = 2
+
+
+class SongShoe:
+    """
+    Deal songs least used first, in random order among equally used ones
+    
+    The shoe holds the songs not dealt yet in the current round, and a new
+    shuffled round goes under them whenever more are needed.
+    """
+    
+    def __init__(self, songs, rng):
+        """
+        Args:
+            songs: Distinct songs to deal
+            rng: random.Random used to shuffle each round
+        """
+        self.songs = list(songs)
+        self.rng = rng
+        # Next song to deal at the end
+        self._stack = []
+    
+    def candidates(self, count):
+        """
+        Get the next count distinct songs, in the order they would be dealt
+        
+        Returns:
+            List of (song, position in the shoe) pairs; fewer than count if the pool is smaller
+        """
+        count = min(count, len(self.songs))
+        result = []
+        seen = set()
+        position = len(self._stack) - 1
+        while len(result) < count:
+            if position < 0:
+                # Put a new round under the songs left
+                new_round = self.songs.copy()
+                self.rng.shuffle(new_round)
+                self._stack[:0] = new_round
+                position += len(new_round)
+                result = [(song, song_position + len(new_round)) for song, song_position in result]
+            song = self._stack[position]
+            if song not in seen:
+                seen.add(song)
+                result.append((song, position))
+            position -= 1
+        return result
+    
+    def take(self, positions):
+        """Remove the songs at these positions, from candidates, from the shoe"""
+        for position in sorted(positions, reverse=True):
+            del self._stack[position]
+
+
+def _hands(ganadora_candidates, num_ganadoras, filler_candidates, num_fillers, full_fillers):
+    """
+    Hands from the candidates, with the sets of their songs, roughly cheapest first
+    
+    The canciones_ganadoras vary fastest: each is used thousands of times, so
+    dealing one out of turn shifts their balance far less than a filler's.
+    Filler sets in full_fillers, already dealt with every set of ganadoras, are skipped.
+    """
+    ganadora_hands = [(hand, frozenset(song for song, _ in hand))
+                      for hand in itertools.combinations(ganadora_candidates, num_ganadoras)]
+    for filler_hand in itertools.combinations(filler_candidates, num_fillers):
+        filler_songs = frozenset(song for song, _ in filler_hand)
+        if filler_songs in full_fillers:
+            continue
+        for ganadora_hand, ganadora_songs in ganadora_hands:
+            yield ganadora_hand, filler_hand, (ganadora_songs, filler_songs)
+
+
+class BalancedCardDealer:
+    """
+    Deal unique cards that use the songs of each pool evenly
+    
+    Cards have no song twice, so a kind of card with k canciones_ganadoras has
+    C(len(ganadoras), k) * C(len(fillers), card_size - k) possible cards.
+    """
+    
+    def __init__(self, ganadoras, fillers, rng, card_size=SONGS_PER_CARD):
+        """
+        Args:
+            ganadoras: Songs of the winning card
+            fillers: Songs used to fill the remaining slots
+            rng: random.Random that decides the order of the songs
+            card_size: Number of songs on a card
+        """
+        self.ganadoras = list(ganadoras)
+        ganadoras_set = set(self.ganadoras)
+        self.fillers = [song for song in dict.fromkeys(fillers) if song not in ganadoras_set]
+        self.card_size = card_size
+        self.rng = rng
+        self._ganadora_shoe = SongShoe(self.ganadoras, rng)
+        self._filler_shoe = SongShoe(self.fillers, rng)
+        self._dealt = set()
+        # Per number of ganadoras: how many cards each set of fillers was dealt in,
+        # and the sets that can't be dealt again because they were dealt with every set of ganadoras
+        self._filler_uses = {}
+        self._full_fillers = {}
+    
+    def capacity(self, num_ganadoras):
+        """Number of different cards with num_ganadoras canciones_ganadoras"""
+        return _comb(len(self.ganadoras), num_ganadoras) * _comb(len(self.fillers), self.card_size - num_ganadoras)
+    
+    def winner(self):
+        """Deal the winning card, with every canciones_ganadoras in their original order"""
+        self._dealt.add((frozenset(self.ganadoras), frozenset()))
+        self._ganadora_shoe.take([position for _, position in
+                                  self._ganadora_shoe.candidates(len(self.ganadoras))])
+        return self.ganadoras.copy()
+    
+    def deal(self, num_ganadoras):
+        """
+        Deal a card that has not been dealt before
+        
+        Args:
+            num_ganadoras: Number of canciones_ganadoras on the card
+        
+        Returns:
+            List of songs, the canciones_ganadoras first, each group in random order
+        
+        Raises:
+            ValueError: If every card of this kind has already been dealt
+        """
+        num_fillers = self.card_size - num_ganadoras
+        filler_uses = self._filler_uses.setdefault(num_ganadoras, {})
+        full_fillers = self._full_fillers.setdefault(num_ganadoras, set())
+        ganadora_sets = _comb(len(self.ganadoras), num_ganadoras)
+        extra = _EXTRA_CANDIDATES
+        while True:
+            ganadora_candidates = self._ganadora_shoe.candidates(num_ganadoras + extra)
+            filler_candidates = self._filler_shoe.candidates(num_fillers + extra)
+            for ganadora_hand, filler_hand, key in _hands(ganadora_candidates, num_ganadoras,
+                                                          filler_candidates, num_fillers, full_fillers):
+                if key not in self._dealt:
+                    self._dealt.add(key)
+                    filler_songs = key[1]
+                    filler_uses[filler_songs] = filler_uses.get(filler_songs, 0) + 1
+                    if filler_uses[filler_songs] == ganadora_sets:
+                        full_fillers.add(filler_songs)
+                    self._ganadora_shoe.take([position for _, position in ganadora_hand])
+                    self._filler_shoe.take([position for _, position in filler_hand])
+                    card_ganadoras = [song for song, _ in ganadora_hand]
+                    card_fillers = [song for song, _ in filler_hand]
+                    self.rng.shuffle(card_ganadoras)
+                    self.rng.shuffle(card_fillers)
+                    return card_ganadoras + card_fillers
+            if len(ganadora_candidates) == len(self.ganadoras) and len(filler_candidates) == len(self.fillers):
+                raise ValueError(f"All {self.capacity(num_ganadoras)} unique cards with {num_ganadoras} "
+                                 f"canciones_ganadoras are used")
+            extra *= 2
+
+
+def check_capacity(dealer, num_sheets, cards_per_page=CARDS_PER_PAGE):
+    """
+    Check that a dealer has enough cards of every kind for a deck
+    
+    Raises:
+        ValueError: If the song pools cannot produce enough unique cards
+    """
+    num_cards = num_sheets * cards_per_page
+    for first_card in range(1, min(num_cards, 4)):
+        num_ganadoras = ganadoras_for_card(first_card)
+        count = len(range(first_card, num_cards, 3))
+        capacity = dealer.capacity(num_ganadoras)
+        if count > capacity:
+            raise ValueError(f"Cannot make {num_sheets} balanced sheets: {count} cards with {num_ganadoras} "
+                             f"canciones_ganadoras are needed but only {capacity} unique ones exist "
+                             f"without repeating a song on a card")
+
+
+def balanced_pages(ganadoras, fillers, num_sheets, seed, pages, cards_per_page=CARDS_PER_PAGE):
+    """
+    Deal a balanced deck, keeping the requested pages
+    
+    Each card depends on the ones before it, so the pages before the
+    requested ones are dealt too, and then left out.
+    
+    Args:
+        ganadoras: Songs of the winning card
+        fillers: Songs used to fill the cards
+        num_sheets: Number of pages of the whole deck
+        seed: Seed of the deck
+        pages: Page numbers (from 1) to keep
+        cards_per_page: Cards on each page
+    
+    Returns:
+        Iterator over the kept pages in increasing order, where each page is
+        a list of cards, and each card is a list of songs
+    
+    Raises:
+        ValueError: If the song pools cannot produce enough unique cards
+    """
+    dealer = BalancedCardDealer(ganadoras, fillers, random.Random(derive_seed(seed, "balanced")))
+    check_capacity(dealer, num_sheets, cards_per_page)
+    return _deal_pages(dealer, set(pages), cards_per_page)
+
+
+def _deal_pages(dealer, wanted, cards_per_page):
+    """Generator behind balanced_pages"""
+    last_page = max(wanted, default=0)
+    for page_num in range(1, last_page + 1):
+        page_cards = []
+        for card_number in range((page_num - 1) * cards_per_page, page_num * cards_per_page):
+            if card_number == 0:
+                page_cards.append(dealer.winner())
+            else:
+                page_cards.append(dealer.deal(ganadoras_for_card(card_number)))
+        if page_num in wanted:
+            yield page_cards
@@ -0,0 +1,275 @@
+"""
+Vectorized deck generation and checks with NumPy, for decks of millions of cards
+
+The cards of a run of card numbers are computed at once, as an array with one
+row of song ids per card, and are the same cards UniqueCardSampler.card gives
+one at a time. Song ids index UniqueCardSampler.songs: the canciones_ganadoras
+first, then the fillers.
+
+NumPy is optional: iter_pages uses this module when it is installed (see
+supports) and draws the cards one at a time otherwise.
+"""
+import functools
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .cards import (
+    CARDS_PER_PAGE,
+    _comb,
+    deck_sampler,
+    derive_seed,
+    ganadoras_for_card,
+    new_seed,
+)
+
+# Largest capacity whose permutation and ranks fit the uint64 and int64 arithmetic here
+_MAX_CAPACITY = 1 << 62
+
+# Kinds of non-winner cards, each with the first card number of its kind (ganadoras_for_card has period 3)
+_KIND_FIRST_CARDS = (1, 2, 3)
+
+
+def supports(sampler):
+    """Whether the cards of a sampler can be computed here"""
+    if np is None or len(sampler.ganadoras) != sampler.card_size:
+        return False
+    for first_card in _KIND_FIRST_CARDS:
+        num_ganadoras = ganadoras_for_card(first_card)
+        num_fillers = sampler.card_size - num_ganadoras
+        if sampler.capacity(num_ganadoras) >= _MAX_CAPACITY:
+            return False
+        if _comb(len(sampler.fillers) + num_fillers - 1, num_fillers) >= _MAX_CAPACITY:
+            return False
+    return True
+
+
+def mix64(values):
+    """cards.mix64 of every element of a uint64 array"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def permute(permutation, positions):
+    """
+    Look up many positions of a KeyedPermutation at once
+    
+    Args:
+        permutation: KeyedPermutation with a size under 2 ** 62
+        positions: int64 array of positions in range(permutation.size)
+    
+    Returns:
+        int64 array of permutation[position] for every position
+    """
+    if permutation.size <= 1:
+        return np.zeros(len(positions), dtype=np.int64)
+    half_bits = np.uint64(permutation.half_bits)
+    mask = np.uint64(permutation.mask)
+    round_keys = [np.uint64(round_key) for round_key in permutation.round_keys]
+    
+    def encrypt(values):
+        left, right = values >> half_bits, values & mask
+        for round_key in round_keys:
+            left, right = right, left ^ (mix64(right ^ round_key) & mask)
+        return (left << half_bits) | right
+    
+    size = np.uint64(permutation.size)
+    values = encrypt(positions.astype(np.uint64))
+    # Cycle walking, on fewer values each time
+    outside = np.flatnonzero(values >= size)
+    while outside.size:
+        values[outside] = encrypt(values[outside])
+        outside = outside[values[outside] >= size]
+    return values.astype(np.int64)
+
+
+@functools.lru_cache(maxsize=64)
+def _binomials(n, k):
+    """int64 array of C(m, k) for m in range(n + 1)"""
+    if k == 0:
+        return np.ones(n + 1, dtype=np.int64)
+    # Hockey stick identity: C(m, k) is the sum of C(j, k - 1) for j < m
+    values = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(_binomials(n, k - 1)[:-1], out=values[1:])
+    return values
+
+
+def _unrank_combinations(ranks, n, k):
+    """cards._unrank_combination of every rank of an int64 array, as an array of shape (len(ranks), k)"""
+    combinations = np.empty((len(ranks), k), dtype=np.int64)
+    element = np.zeros(len(ranks), dtype=np.int64)
+    ranks = ranks.copy()
+    for slot, remaining in enumerate(range(k, 0, -1)):
+        if remaining == 1:
+            # One subset per element left
+            combinations[:, slot] = element + ranks
+            break
+        # counts[e] = C(n - e, remaining) never increases, so the largest e with
+        # counts[element] - counts[e] <= rank is one before the first e whose
+        # count is below counts[element] - rank
+        counts = _binomials(n, remaining)[::-1]
+        total = counts[element]
+        chosen = np.searchsorted(-counts, ranks - total, side="right") - 1
+        ranks -= total - counts[chosen]
+        combinations[:, slot] = chosen
+        element = chosen + 1
+    return combinations
+
+
+def _in_key_order(ids, keys):
+    """Sort the ids of each row by their keys"""
+    return np.take_along_axis(ids, np.argsort(keys, axis=1, kind="stable"), axis=1)
+
+
+def card_ids(sampler, card_numbers, shuffle_seed):
+    """
+    Song ids of the cards with the given numbers, as iter_pages draws them
+    
+    Args:
+        sampler: UniqueCardSampler of the deck, for which supports() is true
+        card_numbers: int64 array of card numbers (0 is the winning card)
+        shuffle_seed: Seed of the order of the songs on each card, see card_order_key
+    
+    Returns:
+        int32 array of shape (len(card_numbers), sampler.card_size)
+    
+    Raises:
+        ValueError: If some card number is past the cards of its kind
+    """
+    card_numbers = np.asarray(card_numbers, dtype=np.int64)
+    card_size = sampler.card_size
+    num_ganadoras_total = len(sampler.ganadoras)
+    ids = np.empty((len(card_numbers), card_size), dtype=np.int32)
+    ids[card_numbers == 0] = np.arange(card_size, dtype=np.int32)
+    
+    for first_card in _KIND_FIRST_CARDS:
+        rows = np.flatnonzero((card_numbers != 0) & (card_numbers % 3 == first_card % 3))
+        if not rows.size:
+            continue
+        numbers = card_numbers[rows]
+        num_ganadoras = ganadoras_for_card(first_card)
+        num_fillers = card_size - num_ganadoras
+        
+        # kind_position of every card, and its index among the cards of the kind
+        positions = (numbers - 1) // 3
+        permutation = sampler.permutation(num_ganadoras)
+        if positions.max() >= permutation.size:
+            raise ValueError(f"All {permutation.size} unique cards with {num_ganadoras} "
+                             f"canciones_ganadoras are used")
+        indices = permute(permutation, positions)
+        
+        # UniqueCardSampler.card_at
+        filler_count = _comb(len(sampler.fillers) + num_fillers - 1, num_fillers)
+        ganadora_ranks, filler_ranks = np.divmod(indices, filler_count)
+        card_ganadoras = _unrank_combinations(ganadora_ranks, num_ganadoras_total, num_ganadoras)
+        card_fillers = (_unrank_combinations(filler_ranks, len(sampler.fillers) + num_fillers - 1, num_fillers)
+                        - np.arange(num_fillers) + num_ganadoras_total)
+        
+        # Order of the songs: slot i goes by mix64(card_order_key + i)
+        order_keys = mix64(np.uint64(shuffle_seed) ^ numbers.astype(np.uint64))
+        keys = mix64(order_keys[:, None] + np.arange(card_size, dtype=np.uint64))
+        ids[rows, :num_ganadoras] = _in_key_order(card_ganadoras, keys[:, :num_ganadoras])
+        ids[rows, num_ganadoras:] = _in_key_order(card_fillers, keys[:, num_ganadoras:])
+    return ids
+
+
+def _page_card_numbers(pages, cards_per_page):
+    pages = np.asarray(pages, dtype=np.int64)
+    return ((pages - 1)[:, None] * cards_per_page + np.arange(cards_per_page)).ravel()
+
+
+def page_cards(sampler, shuffle_seed, pages, cards_per_page=CARDS_PER_PAGE):
+    """
+    Cards of some pages, as lists of songs
+    
+    Returns:
+        List of pages, where each page is a list of cards, and each card is a list of songs
+    """
+    songs = sampler.songs
+    cards = [[songs[song_id] for song_id in row]
+             for row in card_ids(sampler, _page_card_numbers(pages, cards_per_page), shuffle_seed).tolist()]
+    return [cards[i:i + cards_per_page] for i in range(0, len(cards), cards_per_page)]
+
+
+def sample_cards(config, pages=None):
+    """
+    Generate the cards of a deck as song ids, without making lists of songs
+    
+    Args:
+        config: DeckConfig
+        pages: Page numbers (from 1) to generate (default: all of them)
+    
+    Returns:
+        Tuple (ids, songs): int32 array with one row per card, pages one after
+        the other, of the same cards iter_pages gives, and the list of songs
+        the ids index
+    
+    Raises:
+        ValueError: If the song pools cannot produce enough unique cards
+        RuntimeError: If NumPy is not installed or can't handle these song pools
+    """
+    seed = new_seed() if config.seed is None else config.seed
+    if pages is None:
+        pages = range(1, config.num_sheets + 1)
+    sampler = deck_sampler(config, seed)
+    if not supports(sampler):
+        raise RuntimeError("Batch generation needs NumPy, 6 canciones_ganadoras and fewer than 2 ** 62 cards")
+    card_numbers = _page_card_numbers(pages, config.cards_per_page)
+    return card_ids(sampler, card_numbers, derive_seed(seed, "songs")), sampler.songs
+
+
+def duplicate_cards(ids):
+    """
+    Find the cards that have the same songs as an earlier card, in any order
+    
+    Args:
+        ids: Integer array with one row of song ids per card
+    
+    Returns:
+        Sorted int64 array of the rows that repeat an earlier row
+    """
+    rows = np.sort(ids, axis=1)
+    width = rows.shape[1]
+    bits = max(1, int(rows.max(initial=0)).bit_length())
+    if bits * width <= 63:
+        # Pack each card into one integer, which sorts much faster than rows
+        keys = np.zeros(len(rows), dtype=np.int64)
+        for column in range(width):
+            keys = (keys << bits) | rows[:, column].astype(np.int64)
+    else:
+        # Hash each card to 64 bits; cards are compared in full below, so collisions don't matter
+        keys = np.zeros(len(rows), dtype=np.uint64)
+        for column in range(width):
+            keys = mix64(keys ^ rows[:, column].astype(np.uint64))
+    sorted_keys = np.sort(keys)
+    repeated_keys = np.unique(sorted_keys[1:][sorted_keys[1:] == sorted_keys[:-1]])
+    if not repeated_keys.size:
+        return np.zeros(0, dtype=np.int64)
+    
+    # The few cards with a repeated key, sorted by songs and then by row:
+    # all but the first of each run of equal cards repeat an earlier one
+    candidates = np.flatnonzero(np.isin(keys, repeated_keys))
+    candidate_rows = rows[candidates]
+    order = np.lexsort((candidates,) + tuple(candidate_rows[:, column] for column in reversed(range(width))))
+    candidates, candidate_rows = candidates[order], candidate_rows[order]
+    later = np.all(candidate_rows[1:] == candidate_rows[:-1], axis=1)
+    return np.sort(candidates[1:][later])
+
+
+def song_usage(ids, num_songs):
+    """
+    Count how many times each song is used
+    
+    Args:
+        ids: Integer array of song ids
+        num_songs: Number of songs
+    
+    Returns:
+        int64 array of the count of each song id
+    """
+    return np.bincount(np.asarray(ids).ravel(), minlength=num_songs)
@@ -0,0 +1,183 @@
+"""
+Planned call orders: make sure no card can be complete before the winning card
+
+The host plans the order of the songs to call, with every canciones_ganadoras
+and the fillers played in between. The winning card is complete on the call of
+the last canciones_ganadoras, so any other card whose songs are all called by
+then would win first or tie. Each song maps to a bitset of the cards that have
+it (a Python int with one bit per card), so the cards that still miss a song
+are the OR of the bitsets of the songs not called yet, and finding the early
+cards takes one pass over the songs whatever the size of the deck.
+"""
+import itertools
+import random
+
+from .cards import MAX_CANCIONES
+
+
+def winning_call(call_order, canciones_ganadoras):
+    """
+    Number of songs called (from 1) when the winning card is complete
+    
+    Raises:
+        ValueError: If some canciones_ganadoras is not in the call order
+    """
+    positions = {}
+    for position, song in enumerate(call_order, 1):
+        positions.setdefault(song, position)
+    missing = [song for song in canciones_ganadoras if song not in positions]
+    if missing:
+        raise ValueError(f"The call order never calls these canciones_ganadoras: {missing}")
+    return max((positions[song] for song in canciones_ganadoras), default=0)
+
+
+def song_card_bitsets(text_variations):
+    """
+    Index the cards of a deck by song
+    
+    Args:
+        text_variations: List of pages, where each page is a list of cards,
+                         and each card is a list of songs
+    
+    Returns:
+        Tuple (bitsets, locations): bitsets maps each song to an int with bit i
+        set if card i has it, and locations[i] is the (page, card) location
+        (numbered from 1) of card i
+    """
+    bitsets = {}
+    locations = []
+    for page_idx, page in enumerate(text_variations, 1):
+        for card_idx, card in enumerate(page, 1):
+            bit = 1 << len(locations)
+            locations.append((page_idx, card_idx))
+            for song in card:
+                bitsets[song] = bitsets.get(song, 0) | bit
+    return bitsets, locations
+
+
+def _set_bits(bits):
+    """Indices of the set bits of an int, lowest first"""
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+
+def early_cards(text_variations, call_order, canciones_ganadoras):
+    """
+    Find the cards complete no later than the winning card
+    
+    Cards with exactly the canciones_ganadoras are the winning card itself and
+    are left out; verify_deck checks that there is only one.
+    
+    Args:
+        text_variations: List of pages, where each page is a list of cards,
+                         and each card is a list of songs
+        call_order: Songs in the order the host plans to call them
+        canciones_ganadoras: Songs of the winning card
+    
+    Returns:
+        Sorted list of (page, card) locations numbered from 1
+    
+    Raises:
+        ValueError: If some canciones_ganadoras is not in the call order
+    """
+    called = set(call_order[:winning_call(call_order, canciones_ganadoras)])
+    bitsets, locations = song_card_bitsets(text_variations)
+    all_cards = (1 << len(locations)) - 1
+    
+    # Cards still missing a song when the winning card is complete
+    waiting = 0
+    for song, bits in bitsets.items():
+        if song not in called:
+            waiting |= bits
+    ganadoras = set(canciones_ganadoras)
+    winners = all_cards
+    for song, bits in bitsets.items():
+        if song not in ganadoras:
+            winners &= ~bits
+    for song in ganadoras:
+        winners &= bitsets.get(song, 0)
+    return [locations[i] for i in _set_bits(all_cards & ~waiting & ~winners)]
+
+
+def repair_early_cards(text_variations, call_order, canciones, canciones_ganadoras, rng=random,
+                       max_canciones=MAX_CANCIONES):
+    """
+    Resample the cards that could be complete before the winning card
+    
+    Each early card gets one of its fillers replaced by a filler called after
+    the winning card is complete (or never), so it can't be complete first.
+    The replacement is chosen so that the card stays different from every
+    other card, as a multiset of songs like the deck compares them; when no
+    filler does that with the card's canciones_ganadoras, another set of as
+    many canciones_ganadoras is tried. Other cards are left as they are.
+    
+    Args:
+        text_variations: Pages of the deck, changed in place
+        call_order: Songs in the order the host plans to call them
+        canciones: Songs available to fill the cards
+        canciones_ganadoras: Songs of the winning card
+        rng: random.Random to choose the replacement fillers with
+        max_canciones: Fillers are taken from the first max_canciones canciones, the pool the deck was dealt from
+    
+    Returns:
+        List of the (page, card) locations of the repaired cards
+    
+    Raises:
+        ValueError: If some canciones_ganadoras is not in the call order, or an
+                    early card can't be repaired because every card it could
+                    become already exists
+    """
+    locations = early_cards(text_variations, call_order, canciones_ganadoras)
+    if not locations:
+        return []
+    called = set(call_order[:winning_call(call_order, canciones_ganadoras)])
+    ganadoras = set(canciones_ganadoras)
+    unique_ganadoras = list(dict.fromkeys(canciones_ganadoras))
+    late_fillers = [song for song in dict.fromkeys(canciones[:max_canciones]) if song not in called and song not in ganadoras]
+    rng.shuffle(late_fillers)
+    existing = {_card_key(card) for page in text_variations for card in page}
+    
+    for page, card_idx in locations:
+        card = text_variations[page - 1][card_idx - 1]
+        ganadora_slots = [slot for slot, song in enumerate(card) if song in ganadoras]
+        filler_slots = [slot for slot, song in enumerate(card) if song not in ganadoras]
+        if not filler_slots:
+            raise ValueError(f"Page {page} Card {card_idx} has only canciones_ganadoras and can't be repaired")
+        slot = rng.choice(filler_slots)
+        card_ganadoras = [card[slot] for slot in ganadora_slots]
+        other_ganadoras = [list(combination)
+                           for combination in itertools.combinations(unique_ganadoras, len(ganadora_slots))
+                           if set(combination) != set(card_ganadoras)]
+        rng.shuffle(other_ganadoras)
+        start = rng.randrange(len(late_fillers)) if late_fillers else 0
+        repaired = _repaired_card(card, slot, ganadora_slots, [card_ganadoras] + other_ganadoras,
+                                  late_fillers, start, existing)
+        if repaired is None:
+            raise ValueError(f"Page {page} Card {card_idx} can be complete before the winning card and every "
+                             f"card it could become instead already exists")
+        existing.discard(_card_key(card))
+        existing.add(_card_key(repaired))
+        card[:] = repaired
+    return locations
+
+
+def _card_key(card):
+    """Songs of a card as a multiset, so cards with the same songs in another order are the same card"""
+    return tuple(sorted(card))
+
+
+def _repaired_card(card, slot, ganadora_slots, ganadora_choices, fillers, start, existing):
+    """First new card with one of ganadora_choices and one of fillers (from fillers[start] on) in slot, or None"""
+    for card_ganadoras in ganadora_choices:
+        repaired = card.copy()
+        for ganadora_slot, song in zip(ganadora_slots, card_ganadoras):
+            repaired[ganadora_slot] = song
+        for filler in itertools.chain(fillers[start:], fillers[:start]):
+            if filler in repaired:
+                continue
+            repaired[slot] = filler
+            if _card_key(repaired) not in existing:
+                return repaired
+    return None
@@ -0,0 +1,229 @@
+"""
+Single cards: render one card of a page on its own, as a PNG image or an SVG
+
+A card is drawn on the part of the template under it only, so reprinting a
+replacement card fits and draws six titles instead of a page's worth. SVG
+cards embed that part of the template as an image and the font, and set the
+titles as text, placed with the same layout as the raster pages.
+
+export_cards writes a file per card, e.g. cards/0000/page000001-card1.png,
+from a pool of threads. The files are spread over directories of
+shard_size cards so no directory grows too large for a deck of millions.
+"""
+from PIL import ImageDraw
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape, quoteattr
+import base64
+import contextlib
+import functools
+import io
+import os
+
+from .layout import FALLBACK_FONT_SIZE, layout_text, page_layout
+from .profiling import stage
+from .render import DEFAULT_FONT_PATH, bounded_map, cached_template, draw_card_texts, template_size
+from .tilecache import TileAtlas
+
+# File formats of exported cards
+CARD_FORMATS = ("PNG", "SVG")
+
+# Cards per output directory of export_cards
+DEFAULT_SHARD_SIZE = 1000
+
+# JPEG quality of the template under the text of SVG cards
+SVG_BACKGROUND_QUALITY = 90
+
+
+def _card_box(template_path, card_idx):
+    """Page layout of a template, and the (x0, y0, width, height) of one card on it"""
+    card_layout = page_layout(template_path, *template_size(template_path))
+    if not 0 <= card_idx < len(card_layout.card_boxes):
+        raise IndexError(f"Card {card_idx + 1} is not on the template, which has "
+                         f"{len(card_layout.card_boxes)} cards per page")
+    return card_layout, card_layout.card_boxes[card_idx]
+
+
+def _card_background(template_path, box):
+    """The part of the template under a card"""
+    x0, y0, width, height = box
+    return cached_template(template_path).crop((x0, y0, x0 + width, y0 + height))
+
+
+def render_card(template_path, card_songs, card_idx=0, font_path=DEFAULT_FONT_PATH, tile_cache=None):
+    """
+    Render one card with its song titles, cropped from the template
+
+    Args:
+        template_path: Path to the template image
+        card_songs: Songs of the card
+        card_idx: Position of the card on the page (from 0), which decides the part of the template it is drawn on
+        font_path: Path to the font file
+        tile_cache: Optional TileCache the titles are pasted from
+
+    Returns:
+        PIL Image with the same pixels as the card on a rendered page
+
+    Raises:
+        IndexError: If the template has no card at card_idx
+    """
+    card_layout, box = _card_box(template_path, card_idx)
+    image = _card_background(template_path, box)
+    draw_card_texts(image, ImageDraw.Draw(image), card_layout.cells[card_idx],
+                    card_songs[:card_layout.layout.songs_per_card], font_path, tile_cache, origin=box[:2])
+    return image
+
+
+@functools.lru_cache(maxsize=4)
+def _font_face(font_path):
+    """@font-face rule embedding a font in an SVG"""
+    with open(font_path, "rb") as f:
+        data = base64.b64encode(f.read()).decode("ascii")
+    return f"@font-face {{ font-family: 'card'; src: url(data:font/ttf;base64,{data}) format('truetype'); }}"
+
+
+def card_svg(template_path, card_songs, card_idx=0, font_path=DEFAULT_FONT_PATH):
+    """
+    Render one card as an SVG document, with the song titles as text
+
+    Args:
+        As for render_card
+
+    Returns:
+        SVG document as a string
+
+    Raises:
+        IndexError: If the template has no card at card_idx
+    """
+    card_layout, box = _card_box(template_path, card_idx)
+    x0, y0, width, height = box
+    with stage("encode"):
+        background = io.BytesIO()
+        _card_background(template_path, box).convert("RGB").save(background, format="JPEG",
+                                                                  quality=SVG_BACKGROUND_QUALITY)
+    try:
+        font_face = _font_face(font_path)
+    except OSError:
+        font_face = ""
+
+    texts = []
+    for (cell_x0, cell_y0, cell_width, cell_height), inner_text in zip(
+            card_layout.cells[card_idx], card_songs[:card_layout.layout.songs_per_card]):
+        with stage("fit"):
+            best_font, placed_lines = layout_text(inner_text, cell_x0 - x0, cell_y0 - y0, cell_width, cell_height,
+                                                  font_path)
+        if not placed_lines:
+            continue
+        # PIL positions lines by their top (ascender), SVG text by the baseline
+        ascent = best_font.getmetrics()[0]
+        font_size = getattr(best_font, "size", FALLBACK_FONT_SIZE)
+        for text_x, text_y, line in placed_lines:
+            texts.append(f'<text x="{text_x}" y="{text_y + ascent}" font-size="{font_size}">{escape(line)}</text>')
+
+    background_uri = "data:image/jpeg;base64," + base64.b64encode(background.getvalue()).decode("ascii")
+    return "\n".join([
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}">',
+        f"<style>{font_face} text {{ font-family: 'card', sans-serif; fill: #fff; white-space: pre; }}</style>",
+        f'<image width="{width}" height="{height}" href={quoteattr(background_uri)}/>',
+        *texts,
+        "</svg>",
+        "",
+    ])
+
+
+def card_path(output_dir, page_number, card_number, cards_per_page, card_format="PNG",
+              shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Path of the file of a card in export_cards' output
+
+    Args:
+        output_dir: Output directory
+        page_number: Page of the card (from 1)
+        card_number: Position of the card on its page (from 1)
+        cards_per_page: Cards on each page
+        card_format: "PNG" or "SVG"
+        shard_size: Cards per subdirectory
+    """
+    shard = ((page_number - 1) * cards_per_page + card_number - 1) // shard_size
+    return os.path.join(output_dir, f"{shard:04d}", f"page{page_number:06d}-card{card_number}.{card_format.lower()}")
+
+
+def _write_card(task):
+    """Thread pool entry point of export_cards: render a card and write it to its file"""
+    template_path, card_songs, card_idx, output_path, card_format, png_compress_level, font_path, tile_cache = task
+    if card_format == "SVG":
+        data = card_svg(template_path, card_songs, card_idx, font_path).encode("utf-8")
+    else:
+        image = render_card(template_path, card_songs, card_idx, font_path, tile_cache)
+        with stage("encode"):
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG", compress_level=png_compress_level)
+            data = buffer.getvalue()
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def export_cards(template_path, text_variations, output_dir, card_format="PNG", first_page=1, cards=None,
+                 workers=4, shard_size=DEFAULT_SHARD_SIZE, png_compress_level=6, font_path=DEFAULT_FONT_PATH,
+                 verbose=True, tile_cache=None):
+    """
+    Write each card of a deck to a file of its own
+
+    Args:
+        template_path: Path to the template image
+        text_variations: Pages, as for create_pdf_with_images (any iterable)
+        output_dir: Directory of the card files, spread over subdirectories (see card_path)
+        card_format: "PNG" or "SVG"
+        first_page: Number of the first of text_variations, when the pages are part of a larger deck
+        cards: Optional collection of (page, card) locations, numbered from 1, to write only those
+        workers: Threads rendering and writing cards
+        shard_size: Cards per subdirectory
+        png_compress_level: zlib level (0-9) of PNG cards
+        font_path: Path to the font file
+        verbose: Print the progress every 1000 cards
+        tile_cache: Optional TileCache the titles of PNG cards are pasted from (default: a
+                    TileAtlas shared by the threads, so each title is drawn once)
+
+    Returns:
+        List of the paths written, in order of page and card
+
+    Raises:
+        ValueError: If card_format is unknown
+        IndexError: If a card is not on the template
+    """
+    if card_format not in CARD_FORMATS:
+        raise ValueError(f"Unknown card format {card_format!r}, expected one of {CARD_FORMATS}")
+    cards_per_page = len(page_layout(template_path, *template_size(template_path)).card_boxes)
+    wanted = None if cards is None else set(cards)
+    if tile_cache is None:
+        tile_cache = TileAtlas()
+
+    def tasks():
+        for page_number, page in enumerate(text_variations, first_page):
+            for card_idx, card_songs in enumerate(page):
+                if wanted is not None and (page_number, card_idx + 1) not in wanted:
+                    continue
+                output_path = card_path(output_dir, page_number, card_idx + 1, cards_per_page, card_format,
+                                        shard_size)
+                yield (template_path, card_songs, card_idx, output_path, card_format, png_compress_level,
+                       font_path, tile_cache)
+
+    paths = []
+    with contextlib.ExitStack() as stack:
+        if workers > 1:
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=workers))
+            written = bounded_map(executor, _write_card, tasks(), 4 * workers)
+        else:
+            written = map(_write_card, tasks())
+        for path in written:
+            paths.append(path)
+            if verbose and len(paths) % 1000 == 0:
+                print(f"Exported {len(paths)} cards...")
+    if verbose:
+        print(f"Exported {len(paths)} {card_format} cards to {output_dir}")
+    return paths
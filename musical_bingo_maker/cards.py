@@ -0,0 +1,493 @@
+"""
+Bingo card generation: unique cards drawn from the song pools, laid out in pages
+"""
+from dataclasses import dataclass, replace
+from typing import List, Optional
+import functools
+import hashlib
+import random
+
+from .layout import CARDS_PER_PAGE, SONGS_PER_CARD
+from .profiling import stage
+
+# Use up to this many different canciones to fill the cards
+MAX_CANCIONES = 20
+
+# Pages generated together when NumPy is installed, for decks of at least BATCH_MIN_PAGES pages
+# (both ways give the same cards, smaller decks don't pay for importing NumPy)
+BATCH_PAGES = 1024
+BATCH_MIN_PAGES = 32
+
+_MASK64 = (1 << 64) - 1
+
+
+@functools.lru_cache(maxsize=65536)
+def _comb(n, k):
+    """Binomial coefficient (math.comb is not available before Python 3.8), cached for unranking"""
+    if k < 0 or k > n:
+        return 0
+    k = min(k, n - k)
+    result = 1
+    for i in range(1, k + 1):
+        result = result * (n - k + i) // i
+    return result
+
+
+def _unrank_combination(rank, n, k):
+    """Get the k-subset of range(n) at the given position in lexicographic order"""
+    combination = []
+    element = 0
+    for remaining in range(k, 0, -1):
+        # The subsets whose next element is in [element, e) number
+        # C(n - element, remaining) - C(n - e, remaining): binary search
+        # for the largest e with no more of them than rank
+        total = _comb(n - element, remaining)
+        low, high = element, n - remaining
+        while low < high:
+            middle = (low + high + 1) // 2
+            if total - _comb(n - middle, remaining) <= rank:
+                low = middle
+            else:
+                high = middle - 1
+        rank -= total - _comb(n - low, remaining)
+        combination.append(low)
+        element = low + 1
+    return combination
+
+
+def _unrank_multiset(rank, n, k):
+    """Get the k-multiset of range(n) at the given position (stars and bars over the k-subsets of n+k-1)"""
+    return [element - i for i, element in enumerate(_unrank_combination(rank, n + k - 1, k))]
+
+
+def ganadoras_for_card(card_number):
+    """Number of canciones_ganadoras on a non-winner card: 3, 4 or 5, never all 6"""
+    return 3 + (card_number % 3)
+
+
+def kind_position(card_number):
+    """Number of non-winner cards before card_number with as many canciones_ganadoras as it"""
+    # ganadoras_for_card cycles with period 3 from card 1
+    return (card_number - 1) // 3
+
+
+def new_seed():
+    """A random seed, for decks that should differ each time but still be reproducible"""
+    return random.SystemRandom().randrange(2 ** 32)
+
+
+def derive_seed(seed, *labels):
+    """Independent 64-bit seed for one use of a deck seed, e.g. derive_seed(seed, "cards")"""
+    data = repr((seed,) + labels).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def mix64(value):
+    """Scramble a 64-bit integer (the SplitMix64 finalizer); batch.mix64 does the same to arrays"""
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def card_order_key(shuffle_seed, card_number):
+    """Key of the order of the songs on a card, see UniqueCardSampler.card"""
+    return mix64(shuffle_seed ^ card_number)
+
+
+def _sorted_by(items, keys):
+    return [items[i] for i in sorted(range(len(items)), key=keys.__getitem__)]
+
+
+class KeyedPermutation:
+    """
+    A pseudorandom permutation of range(size), evaluated one position at a time
+
+    A Feistel network, whose rounds mix64 the right half with a round key,
+    permutes the integers of the smallest even bit width that holds size.
+    Positions that land outside range(size) are encrypted again until they
+    fall inside (cycle walking), which is at most 4 times as many rounds on
+    average and still a permutation of range(size). It needs no memory, and
+    any position can be looked up without the ones before it, so separate
+    processes can draw disjoint cards from the same key.
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, size, key):
+        """
+        Args:
+            size: Number of positions, at most 2 ** 128
+            key: Any value with a stable repr, e.g. an int
+        """
+        if size > 1 << 128:
+            raise ValueError(f"Cannot permute {size} positions, at most 2 ** 128")
+        self.size = size
+        # Bits of each half of a value, and the keys of the rounds (batch uses them too)
+        self.half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+        self.mask = (1 << self.half_bits) - 1
+        self.round_keys = [derive_seed(key, "round", round_number) for round_number in range(self.ROUNDS)]
+
+    def _encrypt(self, value):
+        left, right = value >> self.half_bits, value & self.mask
+        for round_key in self.round_keys:
+            left, right = right, left ^ (mix64(right ^ round_key) & self.mask)
+        return (left << self.half_bits) | right
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.size:
+            raise IndexError(f"Position {position} out of range({self.size})")
+        if self.size == 1:
+            return 0
+        value = self._encrypt(position)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+
+class UniqueCardSampler:
+    """
+    Draw distinct bingo cards without replacement
+
+    A card with k canciones_ganadoras is a k-subset of the ganadoras plus a multiset
+    of filler songs for the remaining slots, so the cards of each kind can be counted
+    and numbered directly. The numbers of each kind are shuffled by a KeyedPermutation,
+    so the n-th card of a kind costs the same whatever was drawn before, memory stays
+    constant, and samplers with the same key agree on every card.
+    """
+
+    def __init__(self, ganadoras, fillers, card_size=SONGS_PER_CARD, rng=random, key=None):
+        """
+        Args:
+            ganadoras: Songs of the winning card
+            fillers: Songs used to fill the remaining slots (may repeat within a card)
+            card_size: Number of songs on a card
+            rng: random.Random instance (or the random module) used to shuffle the songs of drawn cards
+            key: Key of the order of the cards (default: drawn from rng)
+        """
+        self.ganadoras = list(ganadoras)
+        ganadoras_set = set(self.ganadoras)
+        self.fillers = [song for song in dict.fromkeys(fillers) if song not in ganadoras_set]
+        self.card_size = card_size
+        self.rng = rng
+        self.key = rng.getrandbits(64) if key is None else key
+        self._drawn = {}
+        self._permutations = {}
+
+    @property
+    def songs(self):
+        """Every song, numbered as in batch: canciones_ganadoras first, then the fillers"""
+        return self.ganadoras + self.fillers
+
+    def capacity(self, num_ganadoras):
+        """Number of different cards with num_ganadoras canciones_ganadoras"""
+        num_fillers = self.card_size - num_ganadoras
+        return (_comb(len(self.ganadoras), num_ganadoras)
+                * _comb(len(self.fillers) + num_fillers - 1, num_fillers))
+
+    def card_at(self, num_ganadoras, index):
+        """Get the card with num_ganadoras canciones_ganadoras at position index of its kind"""
+        num_fillers = self.card_size - num_ganadoras
+        filler_count = _comb(len(self.fillers) + num_fillers - 1, num_fillers)
+        ganadora_rank, filler_rank = divmod(index, filler_count)
+
+        card_ganadoras = [self.ganadoras[i] for i in
+                          _unrank_combination(ganadora_rank, len(self.ganadoras), num_ganadoras)]
+        card_fillers = [self.fillers[i] for i in _unrank_multiset(filler_rank, len(self.fillers), num_fillers)]
+        return card_ganadoras, card_fillers
+
+    def permutation(self, num_ganadoras):
+        """KeyedPermutation giving the order of the cards with num_ganadoras canciones_ganadoras"""
+        permutation = self._permutations.get(num_ganadoras)
+        if permutation is None:
+            permutation = self._permutations[num_ganadoras] = KeyedPermutation(
+                self.capacity(num_ganadoras), (self.key, num_ganadoras))
+        return permutation
+
+    def card(self, num_ganadoras, position, order_key=None):
+        """
+        Get the card at a position of the shuffled order of its kind
+
+        Different positions always give different cards.
+
+        Args:
+            num_ganadoras: Number of canciones_ganadoras on the card
+            position: Position among the cards with num_ganadoras canciones_ganadoras
+            order_key: 64-bit key of the order of the songs (see card_order_key): the song
+                       in slot i goes by mix64(order_key + i). Default: shuffle with the rng
+
+        Returns:
+            List of songs, the canciones_ganadoras first, each group in random order
+
+        Raises:
+            ValueError: If position is past the number of cards of this kind
+        """
+        permutation = self.permutation(num_ganadoras)
+        if position >= len(permutation):
+            raise ValueError(f"All {len(permutation)} unique cards with {num_ganadoras} "
+                             f"canciones_ganadoras are used")
+
+        card_ganadoras, card_fillers = self.card_at(num_ganadoras, permutation[position])
+        if order_key is None:
+            self.rng.shuffle(card_ganadoras)
+            self.rng.shuffle(card_fillers)
+        else:
+            keys = [mix64((order_key + slot) & _MASK64) for slot in range(self.card_size)]
+            card_ganadoras = _sorted_by(card_ganadoras, keys[:num_ganadoras])
+            card_fillers = _sorted_by(card_fillers, keys[num_ganadoras:])
+        return card_ganadoras + card_fillers
+
+    def draw(self, num_ganadoras):
+        """
+        Draw a card that has not been drawn before
+
+        Args:
+            num_ganadoras: Number of canciones_ganadoras on the card
+
+        Returns:
+            List of songs, the canciones_ganadoras first, each group in random order
+
+        Raises:
+            ValueError: If every card of this kind has already been drawn
+        """
+        drawn = self._drawn.get(num_ganadoras, 0)
+        card = self.card(num_ganadoras, drawn)
+        self._drawn[num_ganadoras] = drawn + 1
+        return card
+
+
+@dataclass
+class DeckConfig:
+    """
+    Everything needed to generate a deck of bingo cards
+
+    Attributes:
+        canciones: Songs used to fill the cards
+        canciones_ganadoras: Songs of the single winning card
+        num_sheets: Number of pages, each with cards_per_page cards
+        seed: Seed of the deck (None for a different deck each time). Each page
+              depends only on the seed, the song pools and its number
+        max_canciones: Use at most this many songs from canciones
+        verbose: Print the generation progress and a per-card breakdown
+        balanced: Use the songs of each pool as evenly as possible and never twice on
+                  a card (see balanced.py). Pages then depend on the pages before them,
+                  so generating the last shard costs as much as the whole deck
+        cards_per_page: Cards on each page, from the layout of the template (see layout.load_layout)
+    """
+    canciones: List[str]
+    canciones_ganadoras: List[str]
+    num_sheets: int = 15
+    seed: Optional[int] = None
+    max_canciones: int = MAX_CANCIONES
+    verbose: bool = False
+    balanced: bool = False
+    cards_per_page: int = CARDS_PER_PAGE
+
+
+@dataclass
+class Deck:
+    """
+    A generated deck of bingo cards
+
+    Attributes:
+        pages: List of pages, where each page is a list of cards,
+               and each card is a list of songs
+        canciones: Songs available to fill the cards
+        canciones_ganadoras: Songs of the winning card
+        seed: Seed the deck was generated with
+        first_page: Number of the first page in pages, when the deck is a shard of a larger one
+    """
+    pages: List[List[List[str]]]
+    canciones: List[str]
+    canciones_ganadoras: List[str]
+    seed: Optional[int] = None
+    first_page: int = 1
+
+    @property
+    def num_cards(self):
+        return sum(len(page) for page in self.pages)
+
+
+def shard_pages(num_sheets, shard, num_shards):
+    """
+    Pages of one shard of a deck split into num_shards runs of consecutive pages
+
+    Args:
+        num_sheets: Number of pages of the whole deck
+        shard: Index of the shard, from 0
+        num_shards: Number of shards
+
+    Returns:
+        range of page numbers (from 1), empty if there are more shards than pages
+    """
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"Shard {shard} out of range({num_shards})")
+    return range(num_sheets * shard // num_shards + 1, num_sheets * (shard + 1) // num_shards + 1)
+
+
+def iter_pages(config, pages=None):
+    """
+    Generate the pages of a deck one at a time
+
+    The song pools are checked up front, so errors are raised by this call
+    rather than midway through the pages. Each page depends only on the seed,
+    the song pools and its number, so a deck can be generated in shards (see
+    shard_pages) on separate machines: with the same seed the shards put
+    together are the deck of a single run, and their cards are all different.
+
+    Args:
+        config: DeckConfig, with a seed if the pages are generated in shards
+        pages: Page numbers (from 1) to generate, in order (default: all of them)
+
+    Returns:
+        Iterator over pages, where each page is a list of cards,
+        and each card is a list of songs
+
+    Raises:
+        ValueError: If the song pools cannot produce enough unique cards
+    """
+    log = print if config.verbose else (lambda *args, **kwargs: None)
+    seed = new_seed() if config.seed is None else config.seed
+    if pages is None:
+        pages = range(1, config.num_sheets + 1)
+    else:
+        pages = list(pages)
+        if pages and (min(pages) < 1 or max(pages) > config.num_sheets):
+            raise ValueError(f"Page numbers must be between 1 and {config.num_sheets}")
+
+    if config.balanced:
+        # balanced imports this module, so it can't be imported at the top
+        from .balanced import balanced_pages
+
+        log(f"Strategy: Deal unique cards using every song of each pool evenly")
+        page_cards = balanced_pages(config.canciones_ganadoras, config.canciones[:config.max_canciones],
+                                    config.num_sheets, seed, pages, config.cards_per_page)
+        return _generate_pages(config, log, sorted(set(pages)), page_cards)
+
+    sampler = deck_sampler(config, seed, log)
+    return _generate_pages(config, log, pages,
+                           _page_cards(sampler, derive_seed(seed, "songs"), pages, config.cards_per_page))
+
+
+def deck_sampler(config, seed, log=None):
+    """
+    Get the UniqueCardSampler of a deck, checking that it has enough cards of every kind
+
+    Args:
+        config: DeckConfig
+        seed: Seed of the deck, instead of config.seed
+        log: Function to print the song pools and the needed cards with (default: don't)
+
+    Returns:
+        UniqueCardSampler
+
+    Raises:
+        ValueError: If the song pools cannot produce enough unique cards
+    """
+    log = log or (lambda *args, **kwargs: None)
+    canciones_ganadoras = list(config.canciones_ganadoras)
+
+    # Use more songs from "canciones" to ensure uniqueness, but still prioritize ganadoras
+    selected_canciones = list(config.canciones[:config.max_canciones])
+    all_available_songs = canciones_ganadoras + selected_canciones
+
+    log(f"Strategy: Create unique cards while maximizing canciones_ganadoras usage")
+    log(f"- Using ALL {len(canciones_ganadoras)} canciones_ganadoras: {canciones_ganadoras}")
+    log(f"- Using {len(selected_canciones)} from canciones: {selected_canciones}")
+    log(f"- Total song pool: {len(all_available_songs)} different songs")
+
+    # Index the space of possible cards so every card drawn is unique
+    sampler = UniqueCardSampler(canciones_ganadoras, selected_canciones, key=derive_seed(seed, "cards"))
+
+    # Fail fast if the deck needs more cards of some kind than can exist
+    num_cards = config.num_sheets * config.cards_per_page
+    required_cards = {}
+    for first_card in range(1, min(num_cards, 4)):
+        # ganadoras_for_card cycles with period 3 from card 1
+        required_cards[ganadoras_for_card(first_card)] = len(range(first_card, num_cards, 3))
+    for num_ganadoras, count in sorted(required_cards.items()):
+        capacity = sampler.capacity(num_ganadoras)
+        log(f"- Cards with {num_ganadoras} canciones_ganadoras: {count} needed, {capacity} possible")
+        if count > capacity:
+            raise ValueError(f"Cannot make {config.num_sheets} sheets: {count} cards with {num_ganadoras} "
+                             f"canciones_ganadoras are needed but only {capacity} unique ones exist")
+    return sampler
+
+
+def _page_cards(sampler, shuffle_seed, pages, cards_per_page):
+    """Cards of each page, computed a batch of pages at a time with NumPy when it is installed"""
+    batch = None
+    if len(pages) >= BATCH_MIN_PAGES:
+        # batch imports this module, so it can't be imported at the top
+        from . import batch
+
+    if batch is not None and batch.supports(sampler):
+        for start in range(0, len(pages), BATCH_PAGES):
+            with stage("generate"):
+                chunk = batch.page_cards(sampler, shuffle_seed, pages[start:start + BATCH_PAGES], cards_per_page)
+            yield from chunk
+        return
+
+    for page_num in pages:
+        page_cards = []
+        for card_number in range((page_num - 1) * cards_per_page, page_num * cards_per_page):
+            if card_number == 0:
+                # First card on the first page is the winning card
+                page_cards.append(sampler.ganadoras.copy())
+                continue
+            with stage("generate"):
+                page_cards.append(sampler.card(ganadoras_for_card(card_number), kind_position(card_number),
+                                               card_order_key(shuffle_seed, card_number)))
+        yield page_cards
+
+
+def _generate_pages(config, log, pages, page_cards_iter):
+    """Generator behind iter_pages"""
+    canciones_ganadoras = config.canciones_ganadoras
+
+    # Generate pages of bingo cards
+    for page_num, page_cards in zip(pages, page_cards_iter):
+        if page_num == 1:
+            log(f"Generating Page {page_num} with WINNING CARD...")
+            log(f"Page {page_num}: Card 1 (WINNING) contains all canciones_ganadoras: {canciones_ganadoras}")
+        else:
+            log(f"Generating Page {page_num}...")
+
+        # Check which canciones_ganadoras are in each card of this page
+        if config.verbose:
+            for card_idx, card_songs in enumerate(page_cards):
+                ganadoras_in_card = [song for song in canciones_ganadoras if song in card_songs]
+                if ganadoras_in_card:
+                    log(f"Page {page_num}, Card {card_idx + 1} contains {len(ganadoras_in_card)} "
+                        f"canciones_ganadoras: {ganadoras_in_card}")
+
+        yield page_cards
+
+
+def generate(config, pages=None):
+    """
+    Generate a deck of unique bingo cards with exactly one winning card
+
+    The first card of the first page has all canciones_ganadoras; every other
+    card has 3 to 5 of them and fills the rest with canciones.
+
+    Args:
+        config: DeckConfig
+        pages: Consecutive page numbers (from 1) to generate, e.g. a
+               shard_pages range (default: all of them)
+
+    Returns:
+        Deck, with the seed it was generated with even if config has none
+
+    Raises:
+        ValueError: If the song pools cannot produce enough unique cards
+    """
+    if config.seed is None:
+        config = replace(config, seed=new_seed())
+    if pages is None:
+        pages = range(1, config.num_sheets + 1)
+    return Deck(pages=list(iter_pages(config, pages)), canciones=list(config.canciones),
+                canciones_ganadoras=list(config.canciones_ganadoras), seed=config.seed,
+                first_page=pages[0] if len(pages) else 1)
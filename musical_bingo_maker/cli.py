@@ -0,0 +1,386 @@
+"""
+Command line interface: generate a deck from song pool files and write the PDF
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import random
+import sys
+
+from .analysis import analyze_deck, print_duplicate_report, print_song_usage_summary, verify_deck
+from .callorder import repair_early_cards
+from .cardexport import CARD_FORMATS, export_cards
+from .cards import DeckConfig, derive_seed, generate, iter_pages, shard_pages
+from .compact import CompactDeck, load_deck
+from .incremental import build_incremental, manifest_seed
+from .layout import SONGS_PER_CARD, load_layout
+from .pdfmerge import merge_pdfs
+from .profiling import profile_run
+from .simulation import print_simulation_report, simulate_deck
+from .tilecache import DEFAULT_TILE_CACHE_BYTES, DEFAULT_TILE_CACHE_DIR, TileCache
+from .render import (
+    DEFAULT_FONT_PATH,
+    DEFAULT_TEMPLATE_PATH,
+    PAGE_IMAGE_FORMATS,
+    RENDER_MODES,
+    create_pdf_with_images,
+)
+
+DEFAULT_SONGS_PATH = "songs.json"
+DEFAULT_OUTPUT_PATH = "musical-bingo-cards.pdf"
+
+# Pages per temporary PDF part when streaming
+DEFAULT_PART_SIZE = 64
+
+# Pool names used as JSON keys and as values of the CSV "pool" column
+SONG_POOLS = ("canciones", "canciones_ganadoras")
+
+
+def load_song_pools(path):
+    """
+    Read the song pools from a JSON or CSV file
+
+    JSON files hold an object with a list of titles under "canciones" and
+    another under "canciones_ganadoras". CSV files have a header with a
+    "song" column and a "pool" column naming the pool of each song.
+
+    Args:
+        path: Path to a .json or .csv file
+
+    Returns:
+        Tuple (canciones, canciones_ganadoras)
+
+    Raises:
+        ValueError: If the file format is not supported or a pool is missing
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        pools = {pool: list(data.get(pool, [])) for pool in SONG_POOLS}
+    elif extension == ".csv":
+        pools = {pool: [] for pool in SONG_POOLS}
+        with open(path, encoding="utf-8", newline="") as f:
+            for line_number, row in enumerate(csv.DictReader(f), 2):
+                pool = (row.get("pool") or "").strip()
+                if pool not in pools:
+                    raise ValueError(f"{path}:{line_number}: unknown pool {pool!r}, expected one of {SONG_POOLS}")
+                pools[pool].append(row["song"].strip())
+    else:
+        raise ValueError(f"Unsupported song file {path!r}, expected a .json or .csv file")
+
+    for pool, songs in pools.items():
+        if not songs:
+            raise ValueError(f"No songs in the {pool!r} pool of {path!r}")
+    return pools["canciones"], pools["canciones_ganadoras"]
+
+
+def load_call_order(path):
+    """
+    Read a planned call order: a JSON list of titles, or a text file with one title per line
+
+    Returns:
+        List of songs in the order they will be called
+
+    Raises:
+        ValueError: If a JSON file does not hold a list of titles
+    """
+    with open(path, encoding="utf-8") as f:
+        if os.path.splitext(path)[1].lower() == ".json":
+            songs = json.load(f)
+            if not isinstance(songs, list) or not all(isinstance(song, str) for song in songs):
+                raise ValueError(f"{path!r} should hold a JSON list of song titles")
+            return songs
+        return [line.strip() for line in f if line.strip()]
+
+
+def parse_shard(value):
+    """Parse a --shard value "K/N" into (shard index from 0, number of shards)"""
+    try:
+        shard, num_shards = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected K/N, e.g. 2/4, got {value!r}")
+    if not 1 <= shard <= num_shards:
+        raise argparse.ArgumentTypeError(f"shard {shard} is not between 1 and {num_shards}")
+    return shard - 1, num_shards
+
+
+def int_range(minimum, maximum):
+    """argparse type of an integer between minimum and maximum, both included"""
+    def parse(value):
+        try:
+            number = int(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected an integer, got {value!r}")
+        if not minimum <= number <= maximum:
+            raise argparse.ArgumentTypeError(f"{number} is not between {minimum} and {maximum}")
+        return number
+    return parse
+
+
+def parse_card(value):
+    """Parse a --card value "PAGE:CARD" into (page, card), both from 1"""
+    try:
+        page, card = (int(part) for part in value.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected PAGE:CARD, e.g. 12:3, got {value!r}")
+    if page < 1 or card < 1:
+        raise argparse.ArgumentTypeError(f"pages and cards are numbered from 1, got {value!r}")
+    return page, card
+
+
+def card_pages(cards, page_numbers, cards_per_page):
+    """
+    Smallest run of pages with all the --card locations
+
+    Raises:
+        ValueError: If a location is not in page_numbers or not on a page
+    """
+    for page, card in cards:
+        if page not in page_numbers:
+            raise ValueError(f"Page {page} is not in the deck (pages {page_numbers[0]} to {page_numbers[-1]})")
+        if card > cards_per_page:
+            raise ValueError(f"Card {page}:{card} is not on the page, which has {cards_per_page} cards")
+    pages = [page for page, _ in cards]
+    return range(min(pages), max(pages) + 1)
+
+
+def build_parser():
+    """Build the argument parser of the musical-bingo-maker command"""
+    parser = argparse.ArgumentParser(
+        prog="musical-bingo-maker",
+        description="Generate a PDF of unique musical bingo cards with exactly one winning card.",
+    )
+    parser.add_argument("--songs", default=DEFAULT_SONGS_PATH,
+                        help=f"JSON or CSV file with the song pools (default: {DEFAULT_SONGS_PATH})")
+    parser.add_argument("--sheets", type=int, default=15, help="number of pages to generate (default: 15)")
+    parser.add_argument("--seed", type=int, default=None, help="seed for a reproducible deck")
+    parser.add_argument("--balanced", action="store_true",
+                        help="use every song of each pool about equally often, and never twice on a card")
+    parser.add_argument("--simulate", type=int, default=0, metavar="GAMES",
+                        help="play GAMES random games against the deck and report when the first card "
+                             "is complete and how often cards tie")
+    parser.add_argument("--call-order", metavar="PATH",
+                        help="planned order of the songs to call (a JSON list or one title per line); cards "
+                             "that would be complete before the winning card get one filler replaced")
+    parser.add_argument("--save-deck", metavar="PATH",
+                        help="also save the cards to PATH in a compact binary format, to print them again "
+                             "with --load-deck")
+    parser.add_argument("--load-deck", metavar="PATH",
+                        help="print the cards saved with --save-deck instead of generating a deck "
+                             "(--songs, --sheets, --seed and --balanced are ignored)")
+    parser.add_argument("--export-cards", metavar="DIR",
+                        help="write each card to an image file of its own in DIR instead of writing a PDF")
+    parser.add_argument("--card-format", choices=CARD_FORMATS, default="PNG",
+                        help="file format of --export-cards: PNG images, or SVG with the titles as text "
+                             "(default: PNG)")
+    parser.add_argument("--card", type=parse_card, action="append", metavar="PAGE:CARD",
+                        help="only export this card, e.g. to reprint a replacement; repeat for more cards "
+                             "(needs --export-cards)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes rendering pages in parallel (default: one per CPU)")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT_PATH,
+                        help=f"output PDF path (default: {DEFAULT_OUTPUT_PATH})")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE_PATH,
+                        help=f"template image (default: {DEFAULT_TEMPLATE_PATH})")
+    parser.add_argument("--font", default=DEFAULT_FONT_PATH, help=f"TrueType font (default: {DEFAULT_FONT_PATH})")
+    parser.add_argument("--render-mode", choices=RENDER_MODES, default="raster",
+                        help="draw the song titles into page images or as PDF text (default: raster)")
+    parser.add_argument("--image-format", choices=PAGE_IMAGE_FORMATS, default="PNG",
+                        help="encoding of the raster page images (default: PNG)")
+    parser.add_argument("--jpeg-quality", type=int_range(1, 95), default=90,
+                        help="JPEG quality of the page images, 1-95 (default: 90)")
+    parser.add_argument("--png-compress-level", type=int_range(0, 9), default=6,
+                        help="PNG compression level of the page images, 0-9 (default: 6)")
+    parser.add_argument("--dpi", type=int_range(1, 2400), default=None,
+                        help="downsample the page images to this resolution at their printed size (1-2400)")
+    parser.add_argument("--stream", action="store_true",
+                        help="generate, render and write pages one at a time with flat memory use; "
+                             "skips the whole-deck checks")
+    parser.add_argument("--part-size", type=int, default=None,
+                        help=f"write the PDF in temporary parts of this many pages "
+                             f"(default: {DEFAULT_PART_SIZE} with --stream, otherwise a single part)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep a manifest and one PDF per page next to the output, and on later runs only "
+                             "render the pages whose cards changed (reuses the recorded seed unless --seed is given)")
+    parser.add_argument("--shard", type=parse_shard, metavar="K/N",
+                        help="only generate and write the K-th of N runs of consecutive pages (needs --seed); "
+                             "join the shards with --merge")
+    parser.add_argument("--merge", nargs="+", metavar="PDF",
+                        help="join the PDFs of the shards, in order, into the output instead of generating a deck")
+    parser.add_argument("--tile-cache", nargs="?", const=DEFAULT_TILE_CACHE_DIR, metavar="DIR",
+                        help=f"reuse the rendered song titles of raster pages across runs, "
+                             f"cached in DIR (default: {DEFAULT_TILE_CACHE_DIR})")
+    parser.add_argument("--tile-cache-size", type=int, default=DEFAULT_TILE_CACHE_BYTES // 2 ** 20, metavar="MIB",
+                        help=f"size limit of the tile cache in MiB (default: {DEFAULT_TILE_CACHE_BYTES // 2 ** 20})")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the count, total, p50 and p99 time of each stage at the end")
+    parser.add_argument("--profile-output", metavar="PATH", help="write cProfile stats of the run to PATH")
+    parser.add_argument("--trace-output", metavar="PATH",
+                        help="write the stage timings to PATH as a Chrome trace (chrome://tracing, Perfetto)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print errors")
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point of the musical-bingo-maker command
+
+    Args:
+        argv: Command line arguments (default: sys.argv[1:])
+
+    Returns:
+        Process exit code
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.sheets < 1:
+        parser.error("--sheets must be at least 1")
+    if args.card and not args.export_cards:
+        parser.error("--card needs --export-cards")
+    if args.incremental and args.export_cards:
+        parser.error("--incremental writes a PDF and can't be combined with --export-cards")
+    for option, value in (("--incremental", args.incremental), ("--simulate", args.simulate),
+                          ("--call-order", args.call_order), ("--save-deck", args.save_deck)):
+        if value and (args.stream or args.shard or args.card):
+            parser.error(f"{option} needs the whole deck and can't be combined with --stream, --shard or --card")
+    if args.card and args.shard:
+        parser.error("--card picks the pages itself and can't be combined with --shard")
+    if args.load_deck and args.shard:
+        parser.error("--load-deck prints the pages of the saved deck and can't be combined with --shard")
+    if args.shard and args.seed is None:
+        parser.error("--shard needs a --seed shared by all the shards")
+    if args.shard and not shard_pages(args.sheets, *args.shard):
+        parser.error(f"shard {args.shard[0] + 1}/{args.shard[1]} of {args.sheets} sheets has no pages")
+    if args.profile or args.profile_output or args.trace_output:
+        profiler = profile_run(report=args.profile, cprofile_path=args.profile_output,
+                               trace_path=args.trace_output)
+    else:
+        profiler = contextlib.nullcontext()
+    with profiler:
+        return _run(args)
+
+
+def _run(args):
+    """Generate the deck and write the PDF for main"""
+    verbose = not args.quiet
+
+    if args.merge:
+        try:
+            num_pages = merge_pdfs(args.merge, args.output)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        if verbose:
+            print(f"Merged {num_pages} pages into {args.output}")
+        return 0
+
+    part_size = args.part_size
+    if args.stream and part_size is None:
+        part_size = DEFAULT_PART_SIZE
+
+    seed = args.seed
+    if args.incremental and seed is None:
+        # Same seed as the previous build, so that only cards with swapped songs change
+        seed = manifest_seed(args.output)
+        if verbose:
+            print(f"Using seed {seed}")
+
+    try:
+        # A saved deck brings its own song pools
+        canciones, canciones_ganadoras = load_song_pools(args.songs) if not args.load_deck else ([], [])
+        layout = load_layout(args.template)
+        if layout.songs_per_card != SONGS_PER_CARD:
+            raise ValueError(f"The layout of {args.template!r} has {layout.songs_per_card} songs per card, "
+                             f"but cards have {SONGS_PER_CARD}")
+        config = DeckConfig(
+            canciones=canciones,
+            canciones_ganadoras=canciones_ganadoras,
+            num_sheets=args.sheets,
+            seed=seed,
+            verbose=verbose and not args.stream,
+            balanced=args.balanced,
+            cards_per_page=layout.cards_per_page,
+        )
+        page_numbers = shard_pages(args.sheets, *args.shard) if args.shard else range(1, args.sheets + 1)
+        if verbose and args.shard:
+            print(f"Shard {args.shard[0] + 1}/{args.shard[1]}: pages {page_numbers[0]} to {page_numbers[-1]}")
+        if args.card and not args.load_deck:
+            page_numbers = card_pages(args.card, page_numbers, layout.cards_per_page)
+        if args.load_deck:
+            saved = load_deck(args.load_deck)
+            if saved.cards_per_page != layout.cards_per_page:
+                raise ValueError(f"{args.load_deck!r} has {saved.cards_per_page} cards per page, but the layout "
+                                 f"of {args.template!r} has {layout.cards_per_page}")
+            page_numbers = range(saved.first_page, saved.first_page + saved.num_pages)
+            if args.card:
+                page_numbers = card_pages(args.card, page_numbers, layout.cards_per_page)
+            if verbose:
+                print(f"Loaded {saved.num_cards} cards on {saved.num_pages} pages from {args.load_deck}")
+            deck = None if args.stream else saved.to_deck(page_numbers)
+            pages = saved.iter_pages(page_numbers) if args.stream else deck.pages
+        elif args.stream:
+            deck = None
+            pages = iter_pages(config, page_numbers)
+        else:
+            deck = generate(config, page_numbers)
+            pages = deck.pages
+        if args.call_order:
+            rng = random.Random(derive_seed(deck.seed, "call order"))
+            repaired = repair_early_cards(deck.pages, load_call_order(args.call_order), deck.canciones,
+                                          deck.canciones_ganadoras, rng, config.max_canciones)
+            if verbose:
+                print(f"Call order: {len(repaired)} card(s) could be complete before the winning card "
+                      f"and got a filler called after it")
+        if args.save_deck:
+            CompactDeck.from_deck(deck).save(args.save_deck)
+            if verbose:
+                print(f"Saved {deck.num_cards} cards to {args.save_deck}")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    # One analysis pass serves all the checks and summaries; a shard can't be checked
+    # on its own, but its cards differ from those of the other shards by construction
+    # A saved deck is analyzed from its song ids, without the lists of songs
+    analyzed = saved if args.load_deck else deck
+    report = analyze_deck(analyzed) if verbose and deck is not None and not args.shard and not args.card else None
+    if report is not None:
+        print_song_usage_summary(deck, report)
+        verify_deck(deck, report)
+    if args.simulate > 0:
+        print_simulation_report(simulate_deck(deck, args.simulate))
+
+    tile_cache = TileCache(args.tile_cache, args.tile_cache_size * 2 ** 20) if args.tile_cache else None
+    if args.export_cards:
+        export_cards(args.template, pages, args.export_cards, card_format=args.card_format,
+                     first_page=page_numbers[0], cards=args.card, workers=args.workers,
+                     png_compress_level=args.png_compress_level, font_path=args.font, verbose=verbose,
+                     tile_cache=tile_cache)
+        if report is not None:
+            print_duplicate_report(report)
+        return 0
+
+    render_options = dict(
+        workers=args.workers,
+        render_mode=args.render_mode,
+        image_format=args.image_format,
+        jpeg_quality=args.jpeg_quality,
+        png_compress_level=args.png_compress_level,
+        dpi=args.dpi,
+        font_path=args.font,
+        verbose=verbose,
+        tile_cache=tile_cache,
+    )
+    if args.incremental:
+        build_incremental(args.template, deck, args.output, **render_options)
+    else:
+        create_pdf_with_images(args.template, pages, args.output, part_size=part_size,
+                               first_page=page_numbers[0], **render_options)
+
+    # Perform comprehensive duplicate checking
+    if report is not None:
+        print_duplicate_report(report)
+    return 0
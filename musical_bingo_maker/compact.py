@@ -0,0 +1,332 @@
+"""
+Compact decks: one table of songs, and the cards as packed song ids
+
+A Deck repeats the title of a song on every card that has it. A CompactDeck
+keeps each title once and the cards as a flat array of uint16 song ids, pages
+one after the other, so a million cards take 12 MB instead of the lists and
+strings of a Deck. It saves to a file that is that array behind a short
+header and the song table:
+
+    header      magic, version, cards per page, songs per card, pages, metadata size
+    metadata    UTF-8 JSON: songs, the pools as song ids, seed, first page
+    padding     to a multiple of 8 bytes
+    ids         little-endian uint16, one per song on a card
+
+load_deck maps the ids into memory instead of reading them, so opening a deck
+costs the same whatever its size and only the pages used are read from disk.
+"""
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from dataclasses import replace
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .batch import sample_cards
+from .cards import CARDS_PER_PAGE, Deck, generate, new_seed
+from .layout import SONGS_PER_CARD
+
+DECK_FORMAT_VERSION = 1
+
+# Largest song table whose ids fit the uint16 array
+MAX_SONGS = 1 << 16
+
+_MAGIC = b"MBDK"
+_HEADER = struct.Struct("<4sHHHQI")
+_ALIGNMENT = 8
+
+
+class CompactDeck:
+    """
+    A deck of bingo cards stored as song ids into a single table of songs
+
+    Songs of the pools that are on no card are still in the table, so the
+    pools survive a save and load.
+
+    Attributes:
+        songs: Titles of the songs, indexed by song id
+        canciones: Songs available to fill the cards
+        canciones_ganadoras: Songs of the winning card
+        seed: Seed the deck was generated with
+        first_page: Number of the first page, when the deck is a shard of a larger one
+        cards_per_page: Cards on each page
+        card_size: Songs on each card
+    """
+
+    def __init__(self, songs, ids, canciones=(), canciones_ganadoras=(), seed=None, first_page=1,
+                 cards_per_page=CARDS_PER_PAGE, card_size=SONGS_PER_CARD):
+        """
+        Args:
+            songs: Titles of the songs, indexed by song id
+            ids: Song ids of the cards, one card after the other, as a flat
+                 sequence, a NumPy array or a buffer of native uint16
+            canciones, canciones_ganadoras, seed, first_page, cards_per_page, card_size: As the attributes
+
+        Raises:
+            ValueError: If there are too many songs, a song id is out of range or the
+                        ids don't make whole pages
+        """
+        self.songs = list(songs)
+        known = set(self.songs)
+        for song in itertools.chain(canciones_ganadoras, canciones):
+            if song not in known:
+                known.add(song)
+                self.songs.append(song)
+        if len(self.songs) > MAX_SONGS:
+            raise ValueError(f"A compact deck holds at most {MAX_SONGS} songs, not {len(self.songs)}")
+        self.canciones = list(canciones)
+        self.canciones_ganadoras = list(canciones_ganadoras)
+        self.seed = seed
+        self.first_page = first_page
+        self.cards_per_page = cards_per_page
+        self.card_size = card_size
+        self._ids = _uint16_view(ids)
+
+        page_ids = cards_per_page * card_size
+        if page_ids <= 0 or len(self._ids) % page_ids:
+            raise ValueError(f"{len(self._ids)} song ids don't make pages of {cards_per_page} cards "
+                             f"of {card_size} songs")
+        largest = _max_id(self._ids)
+        if largest >= len(self.songs):
+            raise ValueError(f"Song id {largest} is out of range of the {len(self.songs)} songs")
+
+    @classmethod
+    def from_deck(cls, deck):
+        """
+        Intern the songs of a Deck
+
+        The song ids follow the canciones_ganadoras, then the canciones, then
+        any other song on the cards, in order of first appearance.
+
+        Raises:
+            ValueError: If the pages or the cards of the deck differ in size,
+                        or it has more than MAX_SONGS songs
+        """
+        song_ids = {}
+        for song in itertools.chain(deck.canciones_ganadoras, deck.canciones):
+            song_ids.setdefault(song, len(song_ids))
+        cards_per_page = len(deck.pages[0]) if deck.pages else CARDS_PER_PAGE
+        card_size = len(deck.pages[0][0]) if deck.pages and deck.pages[0] else SONGS_PER_CARD
+        ids = array("H")
+        for page_idx, page in enumerate(deck.pages, deck.first_page):
+            if len(page) != cards_per_page:
+                raise ValueError(f"Page {page_idx} has {len(page)} cards instead of {cards_per_page}")
+            for card_idx, card in enumerate(page, 1):
+                if len(card) != card_size:
+                    raise ValueError(f"Page {page_idx} Card {card_idx} has {len(card)} songs instead of {card_size}")
+                for song in card:
+                    song_id = song_ids.setdefault(song, len(song_ids))
+                    if song_id >= MAX_SONGS:
+                        raise ValueError(f"A compact deck holds at most {MAX_SONGS} songs")
+                    ids.append(song_id)
+        return cls(list(song_ids), ids, deck.canciones, deck.canciones_ganadoras, deck.seed, deck.first_page,
+                   cards_per_page, card_size)
+
+    @property
+    def num_pages(self):
+        return len(self._ids) // (self.cards_per_page * self.card_size)
+
+    @property
+    def num_cards(self):
+        return len(self._ids) // self.card_size
+
+    @property
+    def ids(self):
+        """
+        The cards as a read-only NumPy uint16 array with one row of song ids per card, without copying
+
+        Raises:
+            RuntimeError: If NumPy is not installed
+        """
+        if np is None:
+            raise RuntimeError("CompactDeck.ids needs NumPy")
+        return np.frombuffer(self._ids, dtype=np.uint16).reshape(self.num_cards, self.card_size)
+
+    def card(self, index):
+        """Songs of the card at index (from 0, across pages)"""
+        start = index * self.card_size
+        if not 0 <= start < len(self._ids):
+            raise IndexError(f"Card {index} out of range({self.num_cards})")
+        songs = self.songs
+        return [songs[song_id] for song_id in self._ids[start:start + self.card_size].tolist()]
+
+    def page(self, index):
+        """Cards of the page at index (from 0), each a list of songs"""
+        if not 0 <= index < self.num_pages:
+            raise IndexError(f"Page {index} out of range({self.num_pages})")
+        first_card = index * self.cards_per_page
+        return [self.card(card) for card in range(first_card, first_card + self.cards_per_page)]
+
+    def iter_pages(self, pages=None):
+        """
+        Iterate over the pages as lists of cards, each a list of songs, decoding one page at a time
+
+        Args:
+            pages: Page numbers, counted like first_page, to decode (default: all of them)
+        """
+        if pages is None:
+            pages = range(self.first_page, self.first_page + self.num_pages)
+        for page_number in pages:
+            yield self.page(page_number - self.first_page)
+
+    def to_deck(self, pages=None):
+        """
+        Deck with the same pools and seed
+
+        Args:
+            pages: Consecutive page numbers, counted like first_page, to keep (default: all of them)
+        """
+        if pages is None:
+            pages = range(self.first_page, self.first_page + self.num_pages)
+        return Deck(pages=list(self.iter_pages(pages)), canciones=list(self.canciones),
+                    canciones_ganadoras=list(self.canciones_ganadoras), seed=self.seed,
+                    first_page=pages[0] if len(pages) else self.first_page)
+
+    def save(self, path):
+        """Write the deck to a file load_deck can map back into memory"""
+        song_ids = {song: song_id for song_id, song in reversed(list(enumerate(self.songs)))}
+        metadata = json.dumps({
+            "songs": self.songs,
+            "canciones": [song_ids[song] for song in self.canciones],
+            "canciones_ganadoras": [song_ids[song] for song in self.canciones_ganadoras],
+            "seed": self.seed,
+            "first_page": self.first_page,
+        }, ensure_ascii=False).encode("utf-8")
+        header = _HEADER.pack(_MAGIC, DECK_FORMAT_VERSION, self.cards_per_page, self.card_size,
+                              self.num_pages, len(metadata))
+        padding = b"\0" * (-(len(header) + len(metadata)) % _ALIGNMENT)
+        ids = self._ids
+        if sys.byteorder != "little":
+            ids = array("H", ids)
+            ids.byteswap()
+
+        # Write a temporary file and rename it, so a reader never maps a half-written deck
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header + metadata + padding)
+            f.write(ids)
+        os.replace(tmp_path, path)
+
+
+def _uint16_view(ids):
+    """Flat memoryview of native uint16 of a sequence, NumPy array or buffer of song ids"""
+    if np is not None and isinstance(ids, np.ndarray):
+        if ids.size and (ids.min() < 0 or ids.max() >= MAX_SONGS):
+            raise ValueError(f"Song ids must be between 0 and {MAX_SONGS - 1}")
+        return memoryview(np.ascontiguousarray(ids, dtype=np.uint16).ravel())
+    if isinstance(ids, memoryview) and ids.format == "H" and ids.ndim == 1:
+        return ids
+    if not isinstance(ids, array) or ids.typecode != "H":
+        try:
+            ids = array("H", ids)
+        except OverflowError:
+            raise ValueError(f"Song ids must be between 0 and {MAX_SONGS - 1}")
+    return memoryview(ids)
+
+
+def _max_id(ids):
+    """Largest song id of a uint16 view, or -1 if it is empty"""
+    if not len(ids):
+        return -1
+    if np is not None:
+        return int(np.frombuffer(ids, dtype=np.uint16).max())
+    return max(ids)
+
+
+def load_deck(path, use_mmap=True):
+    """
+    Read a deck written by CompactDeck.save
+
+    Args:
+        path: File of the deck
+        use_mmap: Map the song ids into memory rather than reading them
+
+    Returns:
+        CompactDeck
+
+    Raises:
+        ValueError: If the file is not a deck, or of another format version
+    """
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size or header[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path!r} is not a musical bingo deck")
+        _, version, cards_per_page, card_size, num_pages, metadata_size = _HEADER.unpack(header)
+        if version != DECK_FORMAT_VERSION:
+            raise ValueError(f"{path!r} has deck format version {version}, "
+                             f"but this version reads {DECK_FORMAT_VERSION}")
+        try:
+            metadata = json.loads(f.read(metadata_size).decode("utf-8"))
+            songs = metadata["songs"]
+            canciones = [songs[song_id] for song_id in metadata["canciones"]]
+            canciones_ganadoras = [songs[song_id] for song_id in metadata["canciones_ganadoras"]]
+            seed = metadata["seed"]
+            first_page = metadata["first_page"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise ValueError(f"{path!r} is not a musical bingo deck: its metadata is damaged")
+        offset = _HEADER.size + metadata_size
+        offset += -offset % _ALIGNMENT
+        num_ids = num_pages * cards_per_page * card_size
+        if os.fstat(f.fileno()).st_size < offset + 2 * num_ids:
+            raise ValueError(f"{path!r} is truncated")
+
+        if use_mmap and num_ids and sys.byteorder == "little":
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            ids = memoryview(mapped)[offset:offset + 2 * num_ids].cast("H")
+        else:
+            f.seek(offset)
+            ids = array("H")
+            ids.frombytes(f.read(2 * num_ids))
+            if sys.byteorder != "little":
+                ids.byteswap()
+
+    return CompactDeck(
+        songs,
+        ids,
+        canciones=canciones,
+        canciones_ganadoras=canciones_ganadoras,
+        seed=seed,
+        first_page=first_page,
+        cards_per_page=cards_per_page,
+        card_size=card_size,
+    )
+
+
+def compact_deck(config, pages=None):
+    """
+    Generate a deck straight into a CompactDeck
+
+    With NumPy installed and random cards, the song ids come from
+    batch.sample_cards and no list of songs is made; otherwise the deck is
+    generated as usual and interned.
+
+    Args:
+        config: DeckConfig
+        pages: Consecutive page numbers (from 1) to generate (default: all of them)
+
+    Returns:
+        CompactDeck, with the seed it was generated with
+
+    Raises:
+        ValueError: If the song pools cannot produce enough unique cards
+    """
+    if pages is None:
+        pages = range(1, config.num_sheets + 1)
+    if config.seed is None:
+        config = replace(config, seed=new_seed())
+    if np is not None and not config.balanced:
+        try:
+            ids, songs = sample_cards(config, pages)
+        except RuntimeError:
+            pass
+        else:
+            return CompactDeck(songs, ids, config.canciones, config.canciones_ganadoras, config.seed,
+                               pages[0] if len(pages) else 1, config.cards_per_page, SONGS_PER_CARD)
+    return CompactDeck.from_deck(generate(config, pages))
@@ -0,0 +1,169 @@
+"""
+Incremental regeneration: only re-render the pages whose cards changed since the last run
+
+Next to the output PDF, build_incremental keeps a manifest with the seed, the
+song pools, the render settings and a hash of every page, plus a directory with
+a one-page PDF fragment per page. A rerun with the same seed generates the same
+cards, except those containing songs that were swapped, so only those pages are
+rendered again before the fragments are merged into the output.
+"""
+from reportlab.lib.pagesizes import A4
+import hashlib
+import json
+import os
+
+from .cards import new_seed
+from .pdfmerge import merge_pdfs
+from .profiling import stage
+from .layout import load_layout
+from .render import DEFAULT_FONT_PATH, write_page_pdfs
+from .tilecache import file_digest
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(output_pdf_path):
+    """Path of the manifest kept for an output PDF, e.g. cards.manifest.json for cards.pdf"""
+    return os.path.splitext(output_pdf_path)[0] + ".manifest.json"
+
+
+def fragments_dir(output_pdf_path):
+    """Directory of the one-page PDFs kept for an output PDF, e.g. cards.pages/ for cards.pdf"""
+    return os.path.splitext(output_pdf_path)[0] + ".pages"
+
+
+def load_manifest(output_pdf_path):
+    """
+    Read the manifest of an output PDF
+    
+    Returns:
+        Manifest dict, or None if there is none or it can't be used
+    """
+    try:
+        with open(manifest_path(output_pdf_path), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def manifest_seed(output_pdf_path):
+    """
+    Seed to regenerate the deck of an output PDF with
+    
+    Returns:
+        The seed recorded in its manifest, or a new random seed if there is none
+    """
+    manifest = load_manifest(output_pdf_path)
+    if manifest is not None and isinstance(manifest.get("seed"), int):
+        return manifest["seed"]
+    return new_seed()
+
+
+def _write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def page_hash(page, settings_digest):
+    """Hash of the cards of a page and the settings it is rendered with"""
+    data = json.dumps([settings_digest, page], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def build_incremental(template_path, deck, output_pdf_path, page_size=A4, workers=1, render_mode="raster",
+                      image_format="PNG", jpeg_quality=90, png_compress_level=6, dpi=None,
+                      font_path=DEFAULT_FONT_PATH, verbose=True, tile_cache=None):
+    """
+    Write the PDF of a deck, re-rendering only the pages that changed since the last build
+    
+    A page is reused when its cards and every render setting (including the
+    contents of the template and font files) are the same as recorded in the
+    manifest and its fragment is still there.
+    
+    Args:
+        template_path: Path to the template image
+        deck: Deck to print; give it the seed of the previous build (see manifest_seed)
+              so that unchanged cards come out the same
+        output_pdf_path: Path for the output PDF
+        Other arguments: As for create_pdf_with_images
+    
+    Returns:
+        List of the numbers (from 1) of the pages that were rendered
+    """
+    settings = {
+        "template": file_digest(template_path),
+        "font": file_digest(font_path),
+        "layout": load_layout(template_path).to_dict(),
+        "page_size": list(page_size),
+        "render_mode": render_mode,
+        "image_format": image_format,
+        "jpeg_quality": jpeg_quality,
+        "png_compress_level": png_compress_level,
+        "dpi": dpi,
+    }
+    settings_digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+    
+    manifest = load_manifest(output_pdf_path)
+    old_hashes = manifest.get("pages", []) if manifest else []
+    directory = fragments_dir(output_pdf_path)
+    os.makedirs(directory, exist_ok=True)
+    
+    hashes = [page_hash(page, settings_digest) for page in deck.pages]
+    paths = [os.path.join(directory, f"page-{i + 1:06d}.pdf") for i in range(len(hashes))]
+    changed = [i for i, h in enumerate(hashes)
+               if i >= len(old_hashes) or old_hashes[i] != h or not os.path.exists(paths[i])]
+    changed_set = set(changed)
+    
+    new_manifest = {
+        "version": MANIFEST_VERSION,
+        "seed": deck.seed,
+        "canciones": deck.canciones,
+        "canciones_ganadoras": deck.canciones_ganadoras,
+        "settings": settings,
+        "pages": hashes,
+    }
+    
+    if verbose:
+        print(f"{len(changed)} of {len(hashes)} pages changed since the last build")
+    if changed:
+        # Forget the pages about to be rewritten first, so an interrupted run
+        # can't leave a fragment that the manifest claims is something else
+        _write_json(manifest_path(output_pdf_path),
+                    dict(new_manifest, pages=[None if i in changed_set else h for i, h in enumerate(old_hashes)]))
+        write_page_pdfs(
+            template_path,
+            (deck.pages[i] for i in changed),
+            [paths[i] for i in changed],
+            page_numbers=[i + 1 for i in changed],
+            page_size=page_size,
+            workers=workers,
+            render_mode=render_mode,
+            image_format=image_format,
+            jpeg_quality=jpeg_quality,
+            png_compress_level=png_compress_level,
+            dpi=dpi,
+            font_path=font_path,
+            verbose=verbose,
+            tile_cache=tile_cache,
+        )
+    
+    # Fragments of pages beyond the end of a deck that got shorter
+    kept_names = {os.path.basename(path) for path in paths}
+    for name in os.listdir(directory):
+        if name.startswith("page-") and name not in kept_names:
+            os.remove(os.path.join(directory, name))
+    
+    tmp_path = output_pdf_path + ".tmp"
+    with stage("pdf_merge"):
+        merge_pdfs(paths, tmp_path)
+    os.replace(tmp_path, output_pdf_path)
+    _write_json(manifest_path(output_pdf_path), new_manifest)
+    
+    if verbose:
+        print(f"PDF created successfully: {output_pdf_path}")
+    return [i + 1 for i in changed]
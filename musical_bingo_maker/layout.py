@@ -0,0 +1,496 @@
+"""
+Card grid geometry and text fitting shared by the raster and vector renderers
+
+The geometry of a template comes from a layout file next to it (template.layout.json
+for template.jpg), or the built-in 2x4 grid of cards if there is none. A layout is
+compiled once per template size into a table of cell boxes, which is also cached
+next to the template (template.layout.cache.json), so drawing a page only looks
+the boxes up.
+"""
+from PIL import ImageFont
+from dataclasses import dataclass
+from typing import Tuple
+import contextlib
+import functools
+import json
+import os
+
+from .textmetrics import glyph_metrics
+
+# Card grid of the template: 2x4 cards per page, each with a 3x2 grid of songs
+# inside the blue box at a fixed offset from the top-left corner of the card
+GRID_COLS = 2
+GRID_ROWS = 4
+INNER_BOX_X_OFFSET = 45
+INNER_BOX_Y_OFFSET = 140
+INNER_BOX_WIDTH = 650
+INNER_BOX_HEIGHT = 330
+INNER_COLS = 3
+INNER_ROWS = 2
+
+# Bingo cards per page and songs per card
+CARDS_PER_PAGE = GRID_COLS * GRID_ROWS
+SONGS_PER_CARD = INNER_COLS * INNER_ROWS
+
+# Version of the layout and compiled layout files
+LAYOUT_VERSION = 1
+
+# Font sizes tried when fitting text into an inner cell
+MIN_FONT_SIZE = 8
+MAX_FONT_SIZE = 35  # Hard limit at 35px for better fit
+FALLBACK_FONT_SIZE = 10
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(font_path, size):
+    """
+    Load a TrueType font once per (path, size) and reuse it afterwards
+    
+    Args:
+        font_path: Path to the font file
+        size: Font size in pixels
+    
+    Returns:
+        PIL font object (the default bitmap font if the TrueType font fails)
+    """
+    try:
+        return ImageFont.truetype(font_path, size)
+    except:
+        # Fallback to default font if truetype font fails
+        return ImageFont.load_default()
+
+
+def wrap_text(text, font, max_width):
+    """
+    Greedily wrap text into lines that fit in max_width
+    
+    Args:
+        text: Text to wrap
+        font: PIL font used to measure the lines
+        max_width: Maximum line width in pixels
+    
+    Returns:
+        List of lines
+    """
+    metrics = glyph_metrics(font)
+    if metrics is None:
+        return _wrap_text_bbox(text, font, max_width)
+    
+    words = text.split()
+    lines = []
+    current_line = ""
+    current_pen = 0.0
+    
+    for word in words:
+        # Measure the candidate line from the cached glyph metrics, extending the
+        # pen position of the current line instead of laying out the whole line again
+        if current_line:
+            test_line = current_line + " " + word
+            test_pen = (current_pen + metrics.kerning(current_line[-1], " ") + metrics.advance(" ")
+                        + metrics.kerning(" ", word[0]) + metrics.pen(word))
+        else:
+            test_line = word
+            test_pen = metrics.pen(word)
+        
+        if metrics.fits(test_line, max_width, test_pen):
+            current_line = test_line
+            current_pen = test_pen
+        else:
+            if current_line:
+                lines.append(current_line)
+                current_line = word
+                current_pen = metrics.pen(word)
+            else:
+                # Single word is too long, add it anyway
+                lines.append(word)
+    
+    if current_line:
+        lines.append(current_line)
+    
+    return lines
+
+
+def _wrap_text_bbox(text, font, max_width):
+    """wrap_text for fonts without glyph metrics, measuring every candidate line with getbbox"""
+    words = text.split()
+    lines = []
+    current_line = ""
+    
+    for word in words:
+        test_line = current_line + (" " if current_line else "") + word
+        bbox = font.getbbox(test_line)
+        test_width = bbox[2] - bbox[0]
+        
+        if test_width <= max_width:
+            current_line = test_line
+        else:
+            if current_line:
+                lines.append(current_line)
+                current_line = word
+            else:
+                # Single word is too long, add it anyway
+                lines.append(word)
+    
+    if current_line:
+        lines.append(current_line)
+    
+    return lines
+
+
+def text_block_metrics(font, num_lines):
+    """
+    Compute the line height, line spacing and total height of a block of wrapped text
+    
+    Args:
+        font: PIL font used to draw the lines
+        num_lines: Number of lines in the block
+    
+    Returns:
+        Tuple (line_height, line_spacing, total_text_height)
+    """
+    line_bbox = font.getbbox("Ay")  # Use a sample for line height
+    line_height = line_bbox[3] - line_bbox[1]
+    line_spacing = line_height * 0.2  # Add some line spacing
+    total_text_height = num_lines * line_height + (num_lines - 1) * line_spacing
+    return line_height, line_spacing, total_text_height
+
+
+def _wrap_if_fits(text, font, cell_width, cell_height):
+    """Return the wrapped lines if text fits in the cell with this font, None otherwise"""
+    try:
+        wrapped_lines = wrap_text(text, font, cell_width * 0.9)
+        if not wrapped_lines:
+            return None
+        
+        # Check if all lines fit vertically
+        total_text_height = text_block_metrics(font, len(wrapped_lines))[2]
+        if total_text_height <= cell_height * 0.9:
+            return wrapped_lines
+    except:
+        pass
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def fit_text(text, cell_width, cell_height, font_path):
+    """
+    Find the largest font size at which text fits in a cell once wrapped
+    
+    Results are memoized per (text, cell size, font), so every song is only
+    fitted once no matter how many cards it appears on.
+    
+    Args:
+        text: Text to fit
+        cell_width: Cell width in pixels
+        cell_height: Cell height in pixels
+        font_path: Path to the font file
+    
+    Returns:
+        Tuple (font, lines) with the fitted PIL font and a tuple of wrapped lines
+    """
+    max_possible_size = min(cell_width, cell_height) // 4  # More conservative for multiline
+    max_possible_size = min(max_possible_size, MAX_FONT_SIZE)
+    
+    # Binary search for the largest size that fits: both the number of wrapped
+    # lines and the line height only grow with the font size
+    best_font = None
+    best_lines = []
+    low, high = MIN_FONT_SIZE, max_possible_size
+    while low <= high:
+        size = (low + high) // 2
+        test_font = load_font(font_path, size)
+        wrapped_lines = _wrap_if_fits(text, test_font, cell_width, cell_height)
+        if wrapped_lines is not None:
+            best_font = test_font
+            best_lines = wrapped_lines
+            low = size + 1
+        else:
+            high = size - 1
+    
+    if not best_font:
+        best_font = load_font(font_path, FALLBACK_FONT_SIZE)
+        best_lines = wrap_text(text, best_font, cell_width * 0.9)
+    
+    return best_font, tuple(best_lines)
+
+
+def layout_text(text, cell_x0, cell_y0, cell_width, cell_height, font_path):
+    """
+    Fit text into a cell and position each wrapped line, centered in the cell
+    
+    Args:
+        text: Text to lay out
+        cell_x0: Left edge of the cell in pixels
+        cell_y0: Top edge of the cell in pixels
+        cell_width: Cell width in pixels
+        cell_height: Cell height in pixels
+        font_path: Path to the font file
+    
+    Returns:
+        Tuple (font, placed_lines) where placed_lines is a list of (x, y, line)
+        with the top-left anchor of each line in pixels
+    """
+    best_font, best_lines = fit_text(text, cell_width, cell_height, font_path)
+    placed_lines = []
+    
+    if best_lines:
+        line_height, line_spacing, total_text_height = text_block_metrics(best_font, len(best_lines))
+        
+        # Start from the top of the centered text block
+        start_y = cell_y0 + (cell_height - total_text_height) // 2
+        
+        for line_idx, line in enumerate(best_lines):
+            line_bbox = best_font.getbbox(line)
+            line_width = line_bbox[2] - line_bbox[0]
+            
+            # Center each line horizontally
+            text_x = cell_x0 + (cell_width - line_width) // 2
+            text_y = start_y + line_idx * (line_height + line_spacing)
+            placed_lines.append((text_x, text_y, line))
+    
+    return best_font, placed_lines
+
+
+@dataclass(frozen=True)
+class CardLayout:
+    """
+    Where the cards and their songs are on a template
+    
+    The template is split into a grid of equal cards, and the songs of each
+    card go in a grid of equal cells inside a box at the same place on every
+    card. Sizes are in template pixels.
+    
+    Attributes:
+        grid_cols: Columns of cards on a page
+        grid_rows: Rows of cards on a page
+        box_x: Left edge of the song box, from the left edge of the card
+        box_y: Top edge of the song box, from the top edge of the card
+        box_width: Width of the song box
+        box_height: Height of the song box
+        inner_cols: Columns of songs in the box
+        inner_rows: Rows of songs in the box
+    """
+    grid_cols: int = GRID_COLS
+    grid_rows: int = GRID_ROWS
+    box_x: int = INNER_BOX_X_OFFSET
+    box_y: int = INNER_BOX_Y_OFFSET
+    box_width: int = INNER_BOX_WIDTH
+    box_height: int = INNER_BOX_HEIGHT
+    inner_cols: int = INNER_COLS
+    inner_rows: int = INNER_ROWS
+    
+    @property
+    def cards_per_page(self):
+        return self.grid_cols * self.grid_rows
+    
+    @property
+    def songs_per_card(self):
+        return self.inner_cols * self.inner_rows
+    
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Read a layout from the contents of a layout file
+        
+        Args:
+            data: Dict like {"cards": {"columns": 2, "rows": 4},
+                  "song_box": {"x": 45, "y": 140, "width": 650, "height": 330},
+                  "songs": {"columns": 3, "rows": 2}}; missing entries keep their defaults
+        
+        Raises:
+            ValueError: If an entry is not a positive integer (or a non-negative one for x and y)
+        """
+        if not isinstance(data, dict):
+            raise ValueError("A layout must be a JSON object")
+        fields = {}
+        for section, keys in _LAYOUT_FIELDS.items():
+            values = data.get(section, {})
+            if not isinstance(values, dict):
+                raise ValueError(f"Layout entry {section!r} must be an object")
+            for key, name in keys.items():
+                if key not in values:
+                    continue
+                value = values[key]
+                minimum = 0 if key in ("x", "y") else 1
+                if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+                    raise ValueError(f"Layout entry {section}.{key} must be an integer of at least {minimum}, "
+                                     f"got {value!r}")
+                fields[name] = value
+        return cls(**fields)
+    
+    def to_dict(self):
+        """Contents of the layout file of this layout"""
+        data = {"version": LAYOUT_VERSION}
+        for section, keys in _LAYOUT_FIELDS.items():
+            data[section] = {key: getattr(self, name) for key, name in keys.items()}
+        return data
+    
+    def compile(self, img_width, img_height):
+        """
+        Work out the boxes of every card and cell on a template of this size
+        
+        Returns:
+            PageLayout
+        """
+        card_width = img_width // self.grid_cols
+        card_height = img_height // self.grid_rows
+        inner_cell_width = self.box_width // self.inner_cols
+        inner_cell_height = self.box_height // self.inner_rows
+        
+        card_boxes = []
+        cells = []
+        for card_idx in range(self.cards_per_page):
+            x0 = (card_idx % self.grid_cols) * card_width
+            y0 = (card_idx // self.grid_cols) * card_height
+            card_boxes.append((x0, y0, card_width, card_height))
+            inner_x0 = x0 + self.box_x
+            inner_y0 = y0 + self.box_y
+            cells.append(tuple(
+                (inner_x0 + inner_col * inner_cell_width, inner_y0 + inner_row * inner_cell_height,
+                 inner_cell_width, inner_cell_height)
+                for inner_row in range(self.inner_rows)
+                for inner_col in range(self.inner_cols)
+            ))
+        return PageLayout(self, (img_width, img_height), tuple(card_boxes), tuple(cells))
+
+
+# Sections and keys of a layout file, with the CardLayout field of each
+_LAYOUT_FIELDS = {
+    "cards": {"columns": "grid_cols", "rows": "grid_rows"},
+    "song_box": {"x": "box_x", "y": "box_y", "width": "box_width", "height": "box_height"},
+    "songs": {"columns": "inner_cols", "rows": "inner_rows"},
+}
+
+DEFAULT_LAYOUT = CardLayout()
+
+
+@dataclass(frozen=True)
+class PageLayout:
+    """
+    A CardLayout compiled for a template size
+    
+    Attributes:
+        layout: The CardLayout
+        template_size: (width, height) of the template in pixels
+        card_boxes: (x0, y0, width, height) of each card, in reading order
+        cells: For each card, the (x0, y0, width, height) of each of its song cells
+    """
+    layout: CardLayout
+    template_size: Tuple[int, int]
+    card_boxes: tuple
+    cells: tuple
+    
+    def card_texts(self, cell_texts_list, card_idx):
+        """Get the texts of one card on a page, with placeholders for missing cards"""
+        layout = self.layout
+        if card_idx < len(cell_texts_list):
+            return cell_texts_list[card_idx][:layout.songs_per_card]
+        return [f"R{r+1}C{c+1}" for r in range(layout.inner_rows) for c in range(layout.inner_cols)]
+    
+    def to_dict(self):
+        return {
+            "version": LAYOUT_VERSION,
+            "layout": self.layout.to_dict(),
+            "template_size": list(self.template_size),
+            "card_boxes": [list(box) for box in self.card_boxes],
+            "cells": [[list(box) for box in card_cells] for card_cells in self.cells],
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            layout=CardLayout.from_dict(data["layout"]),
+            template_size=tuple(data["template_size"]),
+            card_boxes=tuple(tuple(box) for box in data["card_boxes"]),
+            cells=tuple(tuple(tuple(box) for box in card_cells) for card_cells in data["cells"]),
+        )
+
+
+def layout_path(template_path):
+    """Path of the layout file of a template, e.g. template.layout.json for template.jpg"""
+    return os.path.splitext(template_path)[0] + ".layout.json"
+
+
+def compiled_layout_path(template_path):
+    """Path of the compiled layout cached for a template, e.g. template.layout.cache.json for template.jpg"""
+    return os.path.splitext(template_path)[0] + ".layout.cache.json"
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+@functools.lru_cache(maxsize=16)
+def _load_layout(path, mtime_ns):
+    """Read a layout file, cached per (path, modification time)"""
+    if mtime_ns is None:
+        return DEFAULT_LAYOUT
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"Invalid layout file {path!r}: {e}")
+    return CardLayout.from_dict(data)
+
+
+def load_layout(template_path):
+    """
+    Get the CardLayout of a template
+    
+    Returns:
+        The layout in the layout file next to the template, or DEFAULT_LAYOUT if there is none
+    
+    Raises:
+        ValueError: If the layout file is invalid
+    """
+    path = os.path.abspath(layout_path(template_path))
+    return _load_layout(path, _mtime_ns(path))
+
+
+@functools.lru_cache(maxsize=16)
+def _page_layout(template_path, layout, template_size):
+    """page_layout, cached per template, layout and size"""
+    cache_path = compiled_layout_path(template_path)
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            data = json.load(f)
+        if (data.get("version") == LAYOUT_VERSION and data.get("layout") == layout.to_dict()
+                and tuple(data.get("template_size", ())) == template_size):
+            return PageLayout.from_dict(data)
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    
+    page_layout = layout.compile(*template_size)
+    # Another process may write the same file at the same time, so write it under a unique name first
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(page_layout.to_dict(), f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # A read-only template directory just means compiling again next time
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+    return page_layout
+
+
+def page_layout(template_path, img_width, img_height):
+    """
+    Get the compiled layout of a template
+    
+    Args:
+        template_path: Path to the template image
+        img_width: Template width in pixels
+        img_height: Template height in pixels
+    
+    Returns:
+        PageLayout, compiled once per process and read from the cache next to
+        the template when it is up to date
+    
+    Raises:
+        ValueError: If the layout file is invalid
+    """
+    return _page_layout(os.path.abspath(template_path), load_layout(template_path), (img_width, img_height))
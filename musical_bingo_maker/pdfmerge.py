@@ -0,0 +1,525 @@
+"""
+Join PDF files page by page without decoding or re-encoding their content
+
+Only what reportlab writes is supported: classic cross-reference tables and
+no object streams. Each input is read, copied to the output and released
+before the next one is opened, so memory does not grow with the number of
+inputs. Objects that are the same in several inputs, such as the template
+image and fonts of PDF parts written from the same deck, are written once and
+shared by the pages of all of them.
+"""
+from collections import namedtuple
+import hashlib
+import os
+
+_WHITESPACE = b"\x00\t\n\x0c\r "
+_DELIMITERS = b"()<>[]{}/%"
+
+# Page attributes that a page inherits from the page tree nodes above it
+_INHERITABLE_PAGE_KEYS = (b"Resources", b"MediaBox", b"CropBox", b"Rotate")
+
+
+class PdfName(bytes):
+    """A PDF name, stored without the leading slash"""
+
+
+class PdfRaw(bytes):
+    """A PDF token copied as it is: number, string, boolean or null"""
+
+
+PdfRef = namedtuple("PdfRef", ["num", "gen"])
+PdfStream = namedtuple("PdfStream", ["dict", "data"])
+
+
+def _name(value):
+    return PdfName(value.encode("ascii"))
+
+
+class _Parser:
+    """Parse PDF objects out of the bytes of a file"""
+    
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+    
+    def skip_whitespace(self):
+        data = self.data
+        while self.pos < len(data):
+            char = data[self.pos]
+            if char in _WHITESPACE:
+                self.pos += 1
+            elif char == 0x25:  # % starts a comment that runs to the end of the line
+                while self.pos < len(data) and data[self.pos] not in b"\r\n":
+                    self.pos += 1
+            else:
+                break
+    
+    def read_token(self):
+        """Read a run of regular characters (number, keyword)"""
+        self.skip_whitespace()
+        start = self.pos
+        while self.pos < len(self.data) and self.data[self.pos] not in _WHITESPACE + _DELIMITERS:
+            self.pos += 1
+        return self.data[start:self.pos]
+    
+    def expect(self, keyword):
+        token = self.read_token()
+        if token != keyword:
+            raise ValueError(f"Expected {keyword!r} at offset {self.pos}, found {token!r}")
+    
+    def parse_value(self):
+        self.skip_whitespace()
+        data = self.data
+        if data.startswith(b"<<", self.pos):
+            return self._parse_dict()
+        char = data[self.pos:self.pos + 1]
+        if char == b"<":
+            end = data.index(b">", self.pos)
+            value = PdfRaw(data[self.pos:end + 1])
+            self.pos = end + 1
+            return value
+        if char == b"[":
+            return self._parse_array()
+        if char == b"(":
+            return self._parse_literal_string()
+        if char == b"/":
+            self.pos += 1
+            return PdfName(self.read_token())
+        
+        token = self.read_token()
+        if not token:
+            raise ValueError(f"Unexpected {char!r} at offset {self.pos}")
+        if token.isdigit():
+            # "num gen R" is an indirect reference
+            mark = self.pos
+            generation = self.read_token()
+            if generation.isdigit() and self.read_token() == b"R":
+                return PdfRef(int(token), int(generation))
+            self.pos = mark
+        return PdfRaw(token)
+    
+    def _parse_dict(self):
+        self.pos += 2
+        result = {}
+        while True:
+            self.skip_whitespace()
+            if self.data.startswith(b">>", self.pos):
+                self.pos += 2
+                return result
+            key = self.parse_value()
+            if not isinstance(key, PdfName):
+                raise ValueError(f"Dictionary key {key!r} is not a name at offset {self.pos}")
+            result[key] = self.parse_value()
+    
+    def _parse_array(self):
+        self.pos += 1
+        result = []
+        while True:
+            self.skip_whitespace()
+            if self.data[self.pos:self.pos + 1] == b"]":
+                self.pos += 1
+                return result
+            result.append(self.parse_value())
+    
+    def _parse_literal_string(self):
+        data = self.data
+        start = self.pos
+        depth = 0
+        while True:
+            char = data[self.pos]
+            if char == 0x5C:  # backslash escapes the next character
+                self.pos += 2
+                continue
+            self.pos += 1
+            if char == 0x28:
+                depth += 1
+            elif char == 0x29:
+                depth -= 1
+                if depth == 0:
+                    return PdfRaw(data[start:self.pos])
+
+
+class PdfReader:
+    """
+    Random access to the objects of a PDF file
+    
+    Args:
+        path: Path to the PDF file, or just a name for the error messages when data is given
+        data: Contents of the file, if they are already in memory
+    """
+    
+    def __init__(self, path, data=None):
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        self.data = data
+        self.path = path
+        self.offsets = {}
+        self._objects = {}
+        self.trailer = self._read_xref()
+    
+    def _read_xref(self):
+        start = self.data.rfind(b"startxref")
+        if start < 0:
+            raise ValueError(f"{self.path}: no startxref found")
+        parser = _Parser(self.data)
+        parser.pos = start + len(b"startxref")
+        parser.pos = int(parser.read_token())
+        if parser.read_token() != b"xref":
+            raise ValueError(f"{self.path}: only cross-reference tables are supported, not streams")
+        
+        while True:
+            token = parser.read_token()
+            if token == b"trailer":
+                return parser.parse_value()
+            first, count = int(token), int(parser.read_token())
+            for num in range(first, first + count):
+                offset, generation, kind = parser.read_token(), parser.read_token(), parser.read_token()
+                if kind == b"n":
+                    self.offsets[num] = int(offset)
+    
+    def get(self, ref):
+        """Get an object (PdfStream, dict, list or token) by its reference"""
+        if ref.num not in self._objects:
+            parser = _Parser(self.data)
+            parser.pos = self.offsets[ref.num]
+            parser.read_token()
+            parser.read_token()
+            parser.expect(b"obj")
+            value = parser.parse_value()
+            parser.skip_whitespace()
+            if self.data.startswith(b"stream", parser.pos):
+                parser.pos += len(b"stream")
+                if self.data.startswith(b"\r\n", parser.pos):
+                    parser.pos += 2
+                else:
+                    parser.pos += 1
+                length = self.resolve(value[PdfName(b"Length")])
+                value = PdfStream(value, self.data[parser.pos:parser.pos + int(length)])
+            self._objects[ref.num] = value
+        return self._objects[ref.num]
+    
+    def resolve(self, value):
+        """Follow a reference, if value is one"""
+        while isinstance(value, PdfRef):
+            value = self.get(value)
+        return value
+    
+    def iter_pages(self):
+        """
+        Walk the page tree in order
+        
+        Yields:
+            Tuple (page reference, page dict with the inherited attributes filled in)
+        """
+        root = self.resolve(self.trailer[PdfName(b"Root")])
+        stack = [(root[PdfName(b"Pages")], {})]
+        while stack:
+            node_ref, inherited = stack.pop()
+            node = self.resolve(node_ref)
+            if node.get(PdfName(b"Type")) == PdfName(b"Pages"):
+                inherited = dict(inherited)
+                for key in _INHERITABLE_PAGE_KEYS:
+                    if PdfName(key) in node:
+                        inherited[PdfName(key)] = node[PdfName(key)]
+                stack.extend((kid, inherited) for kid in reversed(node[PdfName(b"Kids")]))
+            else:
+                page = dict(inherited)
+                page.update(node)
+                yield node_ref, page
+    
+    def page_tree_refs(self):
+        """References of the page tree nodes (not the pages themselves)"""
+        root = self.resolve(self.trailer[PdfName(b"Root")])
+        refs = []
+        stack = [root[PdfName(b"Pages")]]
+        while stack:
+            node_ref = stack.pop()
+            node = self.resolve(node_ref)
+            if node.get(PdfName(b"Type")) == PdfName(b"Pages"):
+                refs.append(node_ref)
+                stack.extend(node[PdfName(b"Kids")])
+        return refs
+
+
+def serialize(value):
+    """Write a parsed PDF value back as bytes"""
+    if isinstance(value, PdfName):
+        return b"/" + value
+    if isinstance(value, PdfRaw):
+        return bytes(value)
+    if isinstance(value, PdfRef):
+        return b"%d %d R" % value
+    if isinstance(value, bool):
+        return b"true" if value else b"false"
+    if isinstance(value, int):
+        return b"%d" % value
+    if isinstance(value, dict):
+        return b"<< " + b" ".join(serialize(k) + b" " + serialize(v) for k, v in value.items()) + b" >>"
+    if isinstance(value, list):
+        return b"[ " + b" ".join(serialize(v) for v in value) + b" ]"
+    if isinstance(value, PdfStream):
+        stream_dict = dict(value.dict)
+        stream_dict[PdfName(b"Length")] = len(value.data)
+        return serialize(stream_dict) + b"\nstream\n" + value.data + b"\nendstream"
+    raise TypeError(f"Cannot serialize {value!r} to PDF")
+
+
+class PdfWriter:
+    """
+    Write PDF objects to a file as they come, keeping only their offsets
+    
+    Args:
+        f: Binary file object to write to
+    """
+    
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}
+        self.next_num = 1
+        self._position = 0
+        self._write(b"%PDF-1.4\n%\x93\x8c\x8b\x9e\n")
+    
+    def _write(self, data):
+        self.f.write(data)
+        self._position += len(data)
+    
+    def reserve(self):
+        """Get a new object number to write later"""
+        num = self.next_num
+        self.next_num += 1
+        return num
+    
+    def write_object(self, num, value):
+        self.offsets[num] = self._position
+        self._write(b"%d 0 obj\n" % num + serialize(value) + b"\nendobj\n")
+    
+    def add(self, value):
+        """Write an object under a new number and return its reference"""
+        num = self.reserve()
+        self.write_object(num, value)
+        return PdfRef(num, 0)
+    
+    def close(self, root, info=None):
+        """Write the cross-reference table and the trailer"""
+        xref_offset = self._position
+        lines = [b"xref\n0 %d\n" % self.next_num, b"0000000000 65535 f \n"]
+        for num in range(1, self.next_num):
+            if num not in self.offsets:
+                raise ValueError(f"Object {num} was reserved but never written")
+            lines.append(b"%010d 00000 n \n" % self.offsets[num])
+        self._write(b"".join(lines))
+        
+        trailer = {PdfName(b"Size"): self.next_num, PdfName(b"Root"): root}
+        if info is not None:
+            trailer[PdfName(b"Info")] = info
+        self._write(b"trailer\n" + serialize(trailer) + b"\nstartxref\n%d\n%%%%EOF\n" % xref_offset)
+
+
+class _ObjectCopier:
+    """
+    Copy the objects reachable from the pages of one reader into a writer
+    
+    Objects are identified across readers by a digest of their content and of
+    everything they reference, and objects already written for an earlier
+    reader with the same digest are reused instead of copied. Pages are always
+    copied, and so is anything in a reference cycle, which has no such digest.
+    """
+    
+    def __init__(self, reader, writer, pages_ref, page_refs=(), shared=None):
+        """
+        Args:
+            reader: PdfReader to copy from
+            writer: PdfWriter to copy to
+            pages_ref: Reference of the merged page tree
+            page_refs: References of the pages of reader
+            shared: Dict of object digest to written reference, shared by the copiers of one merge
+        """
+        self.reader = reader
+        self.writer = writer
+        self.pages_ref = pages_ref
+        self.shared = {} if shared is None else shared
+        self.mapping = {}
+        self._pending = []
+        self._page_refs = set(page_refs)
+        self._tree_refs = set(reader.page_tree_refs())
+        self._digests = {}
+        
+        # Pages point back to their page tree, which is replaced by the merged one
+        for node_ref in self._tree_refs:
+            self.mapping[node_ref] = pages_ref
+    
+    def digest(self, ref):
+        """Digest of an object and of the objects it references, None if it can't be shared"""
+        if ref in self._digests:
+            return self._digests[ref]
+        if ref in self._page_refs:
+            return None
+        # Provisional value for the objects that lead back to this one while it is hashed
+        self._digests[ref] = None
+        parts = []
+        if not self._fingerprint(self.reader.get(ref), parts):
+            return None
+        digest = self._digests[ref] = hashlib.sha256(b"".join(parts)).digest()
+        return digest
+    
+    def _fingerprint(self, value, parts):
+        """Add the bytes that identify value to parts, returning False if it can't be shared"""
+        if isinstance(value, PdfRef):
+            if value in self._tree_refs:
+                parts.append(b"@pages")
+                return True
+            digest = self.digest(value)
+            if digest is None:
+                return False
+            parts.append(b"@" + digest)
+            return True
+        if isinstance(value, dict):
+            parts.append(b"<<")
+            for key, item in value.items():
+                parts.append(serialize(key))
+                if not self._fingerprint(item, parts):
+                    return False
+            parts.append(b">>")
+            return True
+        if isinstance(value, list):
+            parts.append(b"[")
+            for item in value:
+                if not self._fingerprint(item, parts):
+                    return False
+            parts.append(b"]")
+            return True
+        if isinstance(value, PdfStream):
+            if not self._fingerprint(value.dict, parts):
+                return False
+            parts.append(b"stream %d " % len(value.data))
+            parts.append(value.data)
+            return True
+        parts.append(b" " + serialize(value))
+        return True
+    
+    def ref(self, old_ref):
+        """Get the new reference of an object, queueing it to be copied unless it was already written"""
+        new_ref = self.mapping.get(old_ref)
+        if new_ref is None:
+            digest = self.digest(old_ref)
+            new_ref = self.shared.get(digest) if digest is not None else None
+            if new_ref is None:
+                new_ref = PdfRef(self.writer.reserve(), 0)
+                self._pending.append(old_ref)
+                if digest is not None:
+                    self.shared[digest] = new_ref
+            self.mapping[old_ref] = new_ref
+        return new_ref
+    
+    def translate(self, value):
+        """Renumber the references inside a value"""
+        if isinstance(value, PdfRef):
+            return self.ref(value)
+        if isinstance(value, dict):
+            return {key: self.translate(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.translate(item) for item in value]
+        if isinstance(value, PdfStream):
+            return PdfStream(self.translate(value.dict), value.data)
+        return value
+    
+    def copy_page(self, page_ref, page):
+        """Copy a page under the merged page tree, and everything it uses"""
+        page = dict(page)
+        page[PdfName(b"Parent")] = self.pages_ref
+        new_ref = self.ref(page_ref)
+        if page_ref in self._pending:
+            self._pending.remove(page_ref)
+        self.writer.write_object(new_ref.num, self.translate(page))
+        self.flush()
+        return new_ref
+    
+    def flush(self):
+        """Write every queued object"""
+        while self._pending:
+            old_ref = self._pending.pop()
+            self.writer.write_object(self.mapping[old_ref].num, self.translate(self.reader.get(old_ref)))
+
+
+class PdfMerger:
+    """
+    Append the pages of PDF files to an output as they come
+    
+    Pages and what they use are written as soon as they are added, and the page
+    tree and cross-reference table when the merger is closed, so the start of
+    the output can be sent on before the last input exists.
+    
+    Args:
+        f: Binary file object to write to
+    """
+    
+    def __init__(self, f):
+        self.writer = PdfWriter(f)
+        self.pages_ref = PdfRef(self.writer.reserve(), 0)
+        self.kids = []
+        self.info = None
+        self._shared = {}
+    
+    def add(self, reader):
+        """
+        Append the pages of a PdfReader
+        
+        Returns:
+            Number of pages added
+        """
+        pages = list(reader.iter_pages())
+        copier = _ObjectCopier(reader, self.writer, self.pages_ref, [page_ref for page_ref, _ in pages],
+                               self._shared)
+        for page_ref, page in pages:
+            self.kids.append(copier.copy_page(page_ref, page))
+        if self.info is None and PdfName(b"Info") in reader.trailer:
+            self.info = copier.ref(reader.trailer[PdfName(b"Info")])
+            copier.flush()
+        return len(pages)
+    
+    def close(self):
+        """
+        Write the page tree, the catalog and the cross-reference table
+        
+        Returns:
+            Number of pages written
+        """
+        self.writer.write_object(self.pages_ref.num, {
+            _name("Type"): _name("Pages"),
+            _name("Count"): len(self.kids),
+            _name("Kids"): self.kids,
+        })
+        root = self.writer.add({_name("Type"): _name("Catalog"), _name("Pages"): self.pages_ref})
+        self.writer.close(root, self.info)
+        return len(self.kids)
+
+
+def merge_pdfs(input_paths, output_path):
+    """
+    Concatenate the pages of several PDF files into one
+    
+    Page content, images and fonts are copied byte for byte, and those that
+    are the same in several inputs are only written once.
+    
+    Args:
+        input_paths: PDF files to join, in order
+        output_path: Path of the merged PDF
+    
+    Returns:
+        Number of pages written
+    """
+    # Write a temporary file and rename it, so the output can be one of the inputs
+    # and a failed merge leaves no truncated PDF behind
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            merger = PdfMerger(f)
+            for path in input_paths:
+                merger.add(PdfReader(path))
+            num_pages = merger.close()
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return num_pages
@@ -0,0 +1,165 @@
+"""
+Opt-in timing of the stages of a run: per-stage histograms, cProfile dumps and Chrome traces
+
+The rendering and generation code marks its stages with `with stage("name"):`.
+While no recorder is active that is a shared no-op context manager, so the
+hooks cost one global lookup per stage.
+"""
+import contextlib
+import cProfile
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+# StageRecorder collecting the spans of this process, or None when profiling is off
+_recorder = None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "start")
+    
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.recorder.spans.append((self.name, self.start, time.perf_counter() - self.start,
+                                    os.getpid(), threading.get_ident()))
+        return False
+
+
+def stage(name):
+    """Time the enclosed block as one call of stage name, if a recorder is active"""
+    if _recorder is None:
+        return _NULL_SPAN
+    return _Span(_recorder, name)
+
+
+def is_enabled():
+    return _recorder is not None
+
+
+def _percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+class StageRecorder:
+    """
+    Spans recorded while profiling, as (stage, start, duration, pid, thread id) tuples
+    
+    Times are time.perf_counter() seconds, which share a clock across the
+    processes of one machine, so spans from the render workers line up.
+    """
+    
+    def __init__(self):
+        self.spans = []
+    
+    def summary(self):
+        """
+        Aggregate the spans per stage
+        
+        Returns:
+            Dict of stage name to (count, total seconds, p50 seconds, p99 seconds),
+            in the order the stages first ran
+        """
+        durations = {}
+        for name, _, duration, _, _ in self.spans:
+            durations.setdefault(name, []).append(duration)
+        stats = {}
+        for name, values in durations.items():
+            values.sort()
+            stats[name] = (len(values), sum(values), _percentile(values, 0.5), _percentile(values, 0.99))
+        return stats
+    
+    def print_report(self, file=None):
+        """Print the count, total, p50 and p99 time of every stage"""
+        file = file or sys.stdout
+        print(f"\n=== STAGE TIMINGS ===", file=file)
+        print(f"{'stage':<12} {'count':>8} {'total (s)':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}", file=file)
+        for name, (count, total, p50, p99) in self.summary().items():
+            print(f"{name:<12} {count:>8} {total:>10.3f} {p50 * 1000:>10.3f} {p99 * 1000:>10.3f}", file=file)
+        print("=====================", file=file)
+    
+    def write_chrome_trace(self, path):
+        """Write the spans as a Chrome trace (chrome://tracing, Perfetto)"""
+        events = [
+            {"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": pid, "tid": tid}
+            for name, start, duration, pid, tid in self.spans
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+@contextlib.contextmanager
+def recording():
+    """
+    Record the stages of the enclosed block in a new StageRecorder
+    
+    A nested recording takes over until it ends; the outer one doesn't see its spans.
+    
+    Yields:
+        StageRecorder
+    """
+    global _recorder
+    previous = _recorder
+    recorder = _recorder = StageRecorder()
+    try:
+        yield recorder
+    finally:
+        _recorder = previous
+
+
+def add_spans(spans):
+    """Add spans recorded in another process to the active recorder"""
+    if _recorder is not None and spans:
+        _recorder.spans.extend(spans)
+
+
+@contextlib.contextmanager
+def profile_run(report=True, cprofile_path=None, trace_path=None, file=None):
+    """
+    Profile the enclosed block
+    
+    Args:
+        report: Print the per-stage histogram at the end
+        cprofile_path: If set, also run cProfile in this process and dump its stats here
+        trace_path: If set, write the stage spans here as a Chrome trace JSON
+        file: Where to print the report (default sys.stdout)
+    
+    Yields:
+        StageRecorder
+    """
+    profiler = cProfile.Profile() if cprofile_path else None
+    with recording() as recorder:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield recorder
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(cprofile_path)
+    if trace_path:
+        recorder.write_chrome_trace(trace_path)
+    if report:
+        recorder.print_report(file)
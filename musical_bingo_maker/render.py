@@ -0,0 +1,592 @@
+"""
+Page rendering: the template with the song titles, as raster images or vector PDF pages
+"""
+from PIL import Image, ImageDraw
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from concurrent.futures import ProcessPoolExecutor
+import collections
+import contextlib
+import functools
+import io
+import os
+import tempfile
+
+from .layout import FALLBACK_FONT_SIZE, layout_text, page_layout
+from .pdfmerge import merge_pdfs
+from .profiling import stage
+from .tilecache import TileAtlas, distinct_cells, paste_tile
+from . import profiling
+
+# Boolean variable to control colored lines and page text
+SHOW_LINES_AND_PAGE_TEXT = False
+
+# Ways of putting the song titles on the PDF pages: burned into a raster of
+# the template, or drawn as PDF text over a single shared template image
+RENDER_MODES = ("raster", "vector")
+
+# Encodings of the page images embedded in raster mode
+PAGE_IMAGE_FORMATS = ("PNG", "JPEG", "raw")
+
+DEFAULT_TEMPLATE_PATH = "template.jpg"
+DEFAULT_FONT_PATH = "JandaManateeSolid.ttf"
+
+
+@functools.lru_cache(maxsize=4)
+def _decode_template(template_path, mtime_ns):
+    """Decode a template image, cached per (path, modification time)"""
+    with Image.open(template_path) as template:
+        template.load()
+        return template.copy()
+
+
+def cached_template(template_path):
+    """
+    Get the cached decoded template, decoding it again if the file changed
+
+    The image is shared by every caller, so it must not be drawn on: crop it or
+    use load_template for a copy.
+    """
+    mtime_ns = os.stat(template_path).st_mtime_ns
+    return _decode_template(os.path.abspath(template_path), mtime_ns)
+
+
+def load_template(template_path):
+    """
+    Get a fresh copy of the template image, decoding the file only once
+
+    The decoded image is cached in memory keyed on path and modification time,
+    so a template edited while the process is running gets reloaded.
+
+    Args:
+        template_path: Path to the template image
+
+    Returns:
+        PIL Image object that the caller is free to draw on
+    """
+    return cached_template(template_path).copy()
+
+
+def template_size(template_path):
+    """Get the (width, height) in pixels of a template image"""
+    return cached_template(template_path).size
+
+
+def _draw_card_guides(draw, card_layout, main_cell_idx):
+    """Draw the card, inner box and inner grid outlines used to tune the layout"""
+    layout = card_layout.layout
+    x0, y0, cell_width, cell_height = card_layout.card_boxes[main_cell_idx]
+
+    # Cell bounding box with thick green lines
+    draw.rectangle([x0, y0, x0 + cell_width, y0 + cell_height], outline=(0, 255, 0), width=10)
+
+    # Blue inner rectangle
+    inner_x0 = x0 + layout.box_x
+    inner_y0 = y0 + layout.box_y
+    inner_x1 = inner_x0 + layout.box_width
+    inner_y1 = inner_y0 + layout.box_height
+    draw.rectangle([inner_x0, inner_y0, inner_x1, inner_y1], outline=(0, 0, 255), width=6)
+
+    # Red inner grid lines
+    inner_cell_width = layout.box_width // layout.inner_cols
+    inner_cell_height = layout.box_height // layout.inner_rows
+    for i in range(1, layout.inner_cols):
+        x = inner_x0 + i * inner_cell_width
+        draw.line([(x, inner_y0), (x, inner_y1)], fill=(255, 0, 0), width=6)
+    for j in range(1, layout.inner_rows):
+        y = inner_y0 + j * inner_cell_height
+        draw.line([(inner_x0, y), (inner_x1, y)], fill=(255, 0, 0), width=6)
+
+
+def create_image_with_text(template_path, cell_texts_list, font_path=DEFAULT_FONT_PATH, tile_cache=None):
+    """
+    Create an image with custom text in the grid cells
+
+    Args:
+        template_path: Path to the template image
+        cell_texts_list: List of lists, where each inner list contains text for each inner cell
+        font_path: Path to the font file
+        tile_cache: Optional TileCache; the titles are then pasted from cached tiles
+                    instead of being laid out and drawn, with the same pixels
+
+    Returns:
+        PIL Image object
+    """
+    # Load the image
+    image = load_template(template_path)
+    draw = ImageDraw.Draw(image)
+    card_layout = page_layout(template_path, *image.size)
+
+    for main_cell_idx, inner_cells in enumerate(card_layout.cells):
+        # Draw grid lines (only if enabled)
+        if SHOW_LINES_AND_PAGE_TEXT:
+            _draw_card_guides(draw, card_layout, main_cell_idx)
+
+        # Add text to each inner cell
+        draw_card_texts(image, draw, inner_cells, card_layout.card_texts(cell_texts_list, main_cell_idx),
+                        font_path, tile_cache)
+
+    return image
+
+
+def draw_card_texts(image, draw, inner_cells, inner_cell_texts, font_path=DEFAULT_FONT_PATH, tile_cache=None,
+                    origin=(0, 0)):
+    """
+    Draw the song titles of one card into its cells
+
+    Args:
+        image: PIL Image to draw on
+        draw: ImageDraw of image
+        inner_cells: (x0, y0, width, height) of each song cell, in template pixels
+        inner_cell_texts: Text of each cell
+        font_path: Path to the font file
+        tile_cache: Optional TileCache the titles are pasted from
+        origin: Template pixel at the top left of image, when it is a crop of the template
+    """
+    origin_x, origin_y = origin
+    for (cell_x0, cell_y0, cell_width, cell_height), inner_text in zip(inner_cells, inner_cell_texts):
+        cell_x0 -= origin_x
+        cell_y0 -= origin_y
+        if tile_cache is not None:
+            with stage("tile"):
+                tile = tile_cache.get(inner_text, cell_width, cell_height, font_path)
+            with stage("draw"):
+                paste_tile(image, tile, cell_x0, cell_y0)
+            continue
+
+        # Find the largest font size that fits and draw each wrapped line
+        with stage("fit"):
+            best_font, placed_lines = layout_text(inner_text, cell_x0, cell_y0, cell_width, cell_height,
+                                                  font_path)
+        with stage("draw"):
+            for text_x, text_y, line in placed_lines:
+                draw.text((text_x, text_y), line, font=best_font, fill=(255, 255, 255))
+
+
+def fit_image_on_page(img_width, img_height, page_size):
+    """
+    Calculate where to draw an image so it fills the page keeping its aspect ratio
+
+    Args:
+        img_width: Image width in pixels
+        img_height: Image height in pixels
+        page_size: Tuple (page_width, page_height) in points
+
+    Returns:
+        Tuple (x, y, width, height) in points
+    """
+    page_width, page_height = page_size
+    aspect_ratio = img_width / img_height
+
+    # Leave minimal margin (2 points on each side for printer safety)
+    max_width = page_width - 4
+    max_height = page_height - 4
+
+    if max_width / aspect_ratio <= max_height:
+        # Width is the limiting factor
+        scaled_width = max_width
+        scaled_height = max_width / aspect_ratio
+    else:
+        # Height is the limiting factor
+        scaled_height = max_height
+        scaled_width = max_height * aspect_ratio
+
+    # Center the image on the page
+    x = (page_width - scaled_width) / 2
+    y = (page_height - scaled_height) / 2
+    return x, y, scaled_width, scaled_height
+
+
+def render_page(template_path, cell_texts_list, page_size=A4, image_format="PNG", jpeg_quality=90,
+                png_compress_level=6, dpi=None, font_path=DEFAULT_FONT_PATH, tile_cache=None):
+    """
+    Render one page and encode it for the PDF
+
+    Args:
+        template_path: Path to the template image
+        cell_texts_list: List of lists with the text for each inner cell
+        page_size: Page size the image will be printed at
+        image_format: "PNG", "JPEG", or "raw" to hand the pixels to reportlab as they are
+        jpeg_quality: JPEG quality (1-95), only used for JPEG
+        png_compress_level: zlib level (0-9), only used for PNG
+        dpi: If set, downsample the page to this resolution at its printed size
+        font_path: Path to the font file
+        tile_cache: Optional TileCache the song titles are pasted from
+
+    Returns:
+        Tuple (image bytes, (width, height), mode)
+    """
+    if image_format not in PAGE_IMAGE_FORMATS:
+        raise ValueError(f"Unknown page image format {image_format!r}, expected one of {PAGE_IMAGE_FORMATS}")
+
+    image = create_image_with_text(template_path, cell_texts_list, font_path, tile_cache)
+    with stage("encode"):
+        return _encode_page(image, page_size, image_format, jpeg_quality, png_compress_level, dpi)
+
+
+def _encode_page(image, page_size, image_format, jpeg_quality, png_compress_level, dpi):
+    """Downsample and encode a rendered page for render_page"""
+    # Don't carry more pixels than the printer can use
+    if dpi:
+        img_width, img_height = image.size
+        printed_width = fit_image_on_page(img_width, img_height, page_size)[2]
+        target_width = max(1, round(printed_width / 72 * dpi))
+        if target_width < img_width:
+            target_height = max(1, round(img_height * target_width / img_width))
+            image = image.resize((target_width, target_height), Image.LANCZOS)
+
+    if image_format == "raw":
+        return image.tobytes(), image.size, image.mode
+
+    # Convert PIL image to bytes for reportlab
+    img_buffer = io.BytesIO()
+    if image_format == "JPEG":
+        image.convert("RGB").save(img_buffer, format='JPEG', quality=jpeg_quality)
+    else:
+        image.save(img_buffer, format='PNG', compress_level=png_compress_level)
+    return img_buffer.getvalue(), image.size, image.mode
+
+
+def page_image_reader(img_bytes, size, mode, image_format):
+    """
+    Wrap a page returned by render_page for reportlab's drawImage
+
+    JPEG data is embedded in the PDF as it is, without decoding it again.
+    """
+    if image_format == "raw":
+        return ImageReader(Image.frombytes(mode, size, img_bytes))
+    return ImageReader(io.BytesIO(img_bytes))
+
+
+@functools.lru_cache(maxsize=None)
+def register_pdf_font(font_path):
+    """
+    Register a TrueType font with reportlab once per path
+
+    Args:
+        font_path: Path to the font file
+
+    Returns:
+        Name of the registered font (Helvetica if the TrueType font fails)
+    """
+    font_name = os.path.splitext(os.path.basename(font_path))[0]
+    try:
+        pdfmetrics.registerFont(TTFont(font_name, font_path))
+    except:
+        return "Helvetica"
+    return font_name
+
+
+def draw_page_vector(c, template_path, cell_texts_list, page_size, font_path=DEFAULT_FONT_PATH):
+    """
+    Draw one page with the template as a shared image and the song titles as PDF text
+
+    The text is fitted and positioned with the same layout as create_image_with_text,
+    then mapped from template pixels to page points.
+
+    Args:
+        c: reportlab canvas to draw on
+        template_path: Path to the template image
+        cell_texts_list: List of lists with the text for each inner cell
+        page_size: Page size of the canvas
+        font_path: Path to the font file
+    """
+    img_width, img_height = template_size(template_path)
+    x, y, scaled_width, scaled_height = fit_image_on_page(img_width, img_height, page_size)
+    scale = scaled_width / img_width
+
+    # reportlab stores an image drawn from the same file name only once,
+    # so every page references the same template XObject
+    c.drawImage(template_path, x, y, width=scaled_width, height=scaled_height)
+
+    pdf_font_name = register_pdf_font(font_path)
+    c.setFillColorRGB(1, 1, 1)
+    card_layout = page_layout(template_path, img_width, img_height)
+    for main_cell_idx, inner_cells in enumerate(card_layout.cells):
+        inner_cell_texts = card_layout.card_texts(cell_texts_list, main_cell_idx)
+        for (cell_x0, cell_y0, cell_width, cell_height), inner_text in zip(inner_cells, inner_cell_texts):
+            with stage("fit"):
+                best_font, placed_lines = layout_text(inner_text, cell_x0, cell_y0, cell_width, cell_height,
+                                                      font_path)
+            if not placed_lines:
+                continue
+
+            # PIL positions lines by their top (ascender), PDF text by the baseline
+            ascent = best_font.getmetrics()[0]
+            c.setFont(pdf_font_name, getattr(best_font, "size", FALLBACK_FONT_SIZE) * scale)
+            for text_x, text_y, line in placed_lines:
+                c.drawString(x + text_x * scale, y + (img_height - text_y - ascent) * scale, line)
+
+
+# TileAtlas of a render worker process, set up by _init_worker_atlas
+_worker_atlas = None
+
+
+def _init_worker_atlas(cells, font_path):
+    """Process pool initializer: draw the titles of the deck into this worker's TileAtlas"""
+    global _worker_atlas
+    _worker_atlas = TileAtlas()
+    _worker_atlas.prerender(cells, font_path)
+
+
+def _with_worker_atlas(task):
+    """A render_page task that pastes from this worker's TileAtlas, if it has one and no other tile cache"""
+    if task[-1] is None and _worker_atlas is not None:
+        return task[:-1] + (_worker_atlas,)
+    return task
+
+
+def _render_page_task(task):
+    """Process pool entry point for render_page"""
+    return render_page(*_with_worker_atlas(task))
+
+
+def _render_page_task_profiled(task):
+    """Process pool entry point for render_page that also returns the stage spans of the worker"""
+    with profiling.recording() as recorder:
+        page = render_page(*_with_worker_atlas(task))
+    return page, recorder.spans
+
+
+def _collect_worker_spans(results):
+    """Unwrap the results of _render_page_task_profiled, adding their spans to this process' recorder"""
+    for page, spans in results:
+        profiling.add_spans(spans)
+        yield page
+
+
+def bounded_map(executor, fn, iterable, max_pending):
+    """
+    Like executor.map, but only keeps max_pending tasks in flight
+
+    Results are yielded in order, and the input is consumed lazily, so a
+    slow consumer holds back the producer instead of piling up results.
+    """
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _rendered_pages(stack, template_path, text_variations, page_size, workers, render_mode, image_format,
+                    jpeg_quality, png_compress_level, dpi, font_path, tile_cache, text_atlas=True):
+    """
+    Iterate over the pages ready to be drawn on a canvas, rendering raster pages (in a pool if workers > 1)
+
+    Without a tile_cache, and unless text_atlas is False, raster pages paste the
+    titles from a TileAtlas. When the pages are a list, its distinct titles are
+    drawn into the atlas before the first page (by every worker, for a pool);
+    otherwise each title is drawn on first use. The process pool, if any, is
+    shut down when stack closes.
+    """
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode {render_mode!r}, expected one of {RENDER_MODES}")
+    if render_mode == "vector":
+        # Vector pages are cheap to draw and must go through the single canvas
+        return iter(text_variations)
+
+    atlas_cells = None
+    if text_atlas and tile_cache is None:
+        atlas_cells = []
+        if isinstance(text_variations, (list, tuple)):
+            card_layout = page_layout(template_path, *template_size(template_path))
+            atlas_cells = distinct_cells(card_layout, text_variations)
+        if workers <= 1:
+            tile_cache = TileAtlas()
+            with stage("atlas"):
+                tile_cache.prerender(atlas_cells, font_path)
+
+    tasks = ((template_path, cell_texts_list, page_size, image_format, jpeg_quality, png_compress_level, dpi,
+              font_path, tile_cache)
+             for cell_texts_list in text_variations)
+    if workers <= 1:
+        return map(_render_page_task, tasks)
+
+    if atlas_cells is not None:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker_atlas,
+                                       initargs=(atlas_cells, font_path))
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    stack.callback(executor.shutdown)
+    if profiling.is_enabled():
+        return _collect_worker_spans(bounded_map(executor, _render_page_task_profiled, tasks, 2 * workers))
+    return bounded_map(executor, _render_page_task, tasks, 2 * workers)
+
+
+def _draw_rendered_page(c, template_path, rendered_page, page_number, page_size, render_mode, image_format,
+                        font_path):
+    """Draw a page from _rendered_pages on the current page of the canvas"""
+    with stage("pdf"):
+        if render_mode == "vector":
+            draw_page_vector(c, template_path, rendered_page, page_size, font_path)
+        else:
+            # Add the image to the PDF, placed by the template size in case it was downsampled
+            img_bytes, size, mode = rendered_page
+            x, y, scaled_width, scaled_height = fit_image_on_page(*template_size(template_path), page_size)
+            reader = page_image_reader(img_bytes, size, mode, image_format)
+            c.drawImage(reader, x, y, width=scaled_width, height=scaled_height)
+            # reportlab's JPEG readers reference themselves through a bound method; break
+            # the cycle so the decoded pixels are freed now rather than at the next GC
+            reader.__dict__.pop("jpeg_fh", None)
+
+    # Add page title in bottom right corner (only if enabled)
+    if SHOW_LINES_AND_PAGE_TEXT:
+        c.setFont("Helvetica-Bold", 12)
+        title_text = f"Page {page_number}"
+        title_width = c.stringWidth(title_text, "Helvetica-Bold", 12)
+        c.drawString(page_size[0] - title_width - 10, 10, title_text)
+
+
+def create_pdf_with_images(template_path, text_variations, output_pdf_path, page_size=A4, workers=1,
+                           render_mode="raster", image_format="PNG", jpeg_quality=90, png_compress_level=6,
+                           dpi=None, font_path=DEFAULT_FONT_PATH, verbose=True, part_size=None, tile_cache=None,
+                           first_page=1, text_atlas=True):
+    """
+    Create a PDF with multiple images, each with different text
+
+    Args:
+        template_path: Path to the template image
+        text_variations: List (or any iterable, e.g. a generator) of text variations, where each
+                        variation is a list of lists (one list per main cell, containing text for inner cells)
+        output_pdf_path: Path for the output PDF
+        page_size: Page size for the PDF (default A4)
+        workers: Number of processes rendering pages in parallel (default 1, no pool).
+                 Pages are still added to the PDF in order, so the output is the same.
+        render_mode: "raster" to draw the text into a full-page image, or "vector" to
+                     embed the template once and draw the text as PDF text
+        image_format: Encoding of the raster pages: "PNG", "JPEG" or "raw"
+        jpeg_quality: JPEG quality (1-95) for JPEG pages
+        png_compress_level: zlib level (0-9) for PNG pages
+        dpi: If set, downsample raster pages to this resolution at their printed size
+        font_path: Path to the font file
+        verbose: Print the progress of each page
+        part_size: If set, write the PDF in temporary parts of this many pages and merge
+                   them at the end, so memory stays flat however many pages there are
+        tile_cache: Optional TileCache of song title tiles for raster pages, shared by the
+                    worker processes and by later runs
+        first_page: Number printed on the first page, when the pages are a shard of a larger deck
+        text_atlas: Without a tile_cache, draw each distinct song title of raster pages once
+                    into a TileAtlas and paste it, rather than drawing every title on every page
+    """
+    total_pages = len(text_variations) if hasattr(text_variations, "__len__") else None
+
+    with contextlib.ExitStack() as stack:
+        rendered_pages = _rendered_pages(stack, template_path, text_variations, page_size, workers, render_mode,
+                                         image_format, jpeg_quality, png_compress_level, dpi, font_path,
+                                         tile_cache, text_atlas)
+        if part_size:
+            output_dir = os.path.dirname(os.path.abspath(output_pdf_path))
+            parts_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix=".musical-bingo-parts-",
+                                                                       dir=output_dir))
+
+        c = None
+        part_paths = []
+        pages_in_canvas = 0
+        for i, rendered_page in enumerate(rendered_pages):
+            if verbose:
+                print(f"Processing page {i+1}/{total_pages or '?'}...")
+
+            if c is None or pages_in_canvas == part_size:
+                # Start the output, or the next part once the current one is full
+                if c is not None:
+                    with stage("pdf_save"):
+                        c.save()
+                if part_size:
+                    part_paths.append(os.path.join(parts_dir, f"part-{len(part_paths):06d}.pdf"))
+                    c = canvas.Canvas(part_paths[-1], pagesize=page_size)
+                else:
+                    c = canvas.Canvas(output_pdf_path, pagesize=page_size)
+                pages_in_canvas = 0
+            elif pages_in_canvas:
+                # Start a new page after the previous image
+                c.showPage()
+
+            _draw_rendered_page(c, template_path, rendered_page, first_page + i, page_size, render_mode,
+                                image_format, font_path)
+            pages_in_canvas += 1
+
+        if c is None:
+            # No pages: still write a valid (blank) document
+            c = canvas.Canvas(output_pdf_path, pagesize=page_size)
+            part_paths = []
+        with stage("pdf_save"):
+            c.save()
+        if part_paths:
+            with stage("pdf_merge"):
+                merge_pdfs(part_paths, output_pdf_path)
+
+    if verbose:
+        print(f"PDF created successfully: {output_pdf_path}")
+
+
+def page_pdf(template_path, cell_texts_list, page_number=1, page_size=A4, render_mode="raster", image_format="PNG",
+             jpeg_quality=90, png_compress_level=6, dpi=None, font_path=DEFAULT_FONT_PATH, tile_cache=None):
+    """
+    Render one page as a complete one-page PDF in memory
+
+    Args:
+        template_path: Path to the template image
+        cell_texts_list: List of lists with the text for each inner cell
+        page_number: Number of the page in the whole document, for the page title
+        Other arguments: As for create_pdf_with_images
+
+    Returns:
+        Bytes of the PDF
+    """
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode {render_mode!r}, expected one of {RENDER_MODES}")
+    if render_mode == "vector":
+        rendered_page = cell_texts_list
+    else:
+        rendered_page = render_page(template_path, cell_texts_list, page_size, image_format, jpeg_quality,
+                                    png_compress_level, dpi, font_path, tile_cache)
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=page_size)
+    _draw_rendered_page(c, template_path, rendered_page, page_number, page_size, render_mode, image_format,
+                        font_path)
+    with stage("pdf_save"):
+        c.save()
+    return buffer.getvalue()
+
+
+def write_page_pdfs(template_path, text_variations, output_paths, page_numbers=None, page_size=A4, workers=1,
+                    render_mode="raster", image_format="PNG", jpeg_quality=90, png_compress_level=6, dpi=None,
+                    font_path=DEFAULT_FONT_PATH, verbose=True, tile_cache=None, text_atlas=True):
+    """
+    Write each page to a PDF file of its own, e.g. to keep them as fragments of a larger document
+
+    Each file is written under a temporary name and renamed into place, so an
+    interrupted run never leaves a truncated page behind.
+
+    Args:
+        template_path: Path to the template image
+        text_variations: Pages, as for create_pdf_with_images
+        output_paths: Path of the PDF of each page
+        page_numbers: Number of each page in the whole document, for progress and the
+                      page titles (default 1, 2, ...)
+        Other arguments: As for create_pdf_with_images
+    """
+    output_paths = list(output_paths)
+    if page_numbers is None:
+        page_numbers = range(1, len(output_paths) + 1)
+
+    with contextlib.ExitStack() as stack:
+        rendered_pages = _rendered_pages(stack, template_path, text_variations, page_size, workers, render_mode,
+                                         image_format, jpeg_quality, png_compress_level, dpi, font_path,
+                                         tile_cache, text_atlas)
+        for output_path, page_number, rendered_page in zip(output_paths, page_numbers, rendered_pages):
+            if verbose:
+                print(f"Rendering page {page_number}...")
+            tmp_path = output_path + ".tmp"
+            c = canvas.Canvas(tmp_path, pagesize=page_size)
+            _draw_rendered_page(c, template_path, rendered_page, page_number, page_size, render_mode,
+                                image_format, font_path)
+            with stage("pdf_save"):
+                c.save()
+            os.replace(tmp_path, output_path)
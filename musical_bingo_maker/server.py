@@ -0,0 +1,567 @@
+"""
+Deck generation service: an asyncio HTTP server with a warm pool of render workers
+
+    python -m musical_bingo_maker.server --port 8080 --workers 4
+
+POST /jobs with a JSON body (see parse_job_request) queues a deck. Jobs run in
+order of priority, then of arrival, and their pages are rendered by worker
+processes that stay up between jobs with the template, layout and fonts
+already loaded, and that keep the titles they have fitted. GET /jobs/<id>
+reports the progress of a job, and GET /jobs/<id>/pdf streams its PDF while it
+is being written: every page is sent as soon as it is rendered, and the page
+tree and cross-reference table follow the last one. If a worker process dies,
+the jobs it was rendering fail, the pool is started again for the next ones,
+and GET /health reports the restart.
+
+Only the standard library is used for HTTP; keep the server on localhost or
+behind a reverse proxy.
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import itertools
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit
+
+from .cards import CARDS_PER_PAGE, DeckConfig, generate, iter_pages, new_seed
+from .cli import DEFAULT_SONGS_PATH, load_song_pools
+from .layout import MAX_FONT_SIZE, MIN_FONT_SIZE, SONGS_PER_CARD, load_font, load_layout, page_layout
+from .pdfmerge import PdfMerger, PdfReader
+from .render import (
+    DEFAULT_FONT_PATH,
+    DEFAULT_TEMPLATE_PATH,
+    PAGE_IMAGE_FORMATS,
+    RENDER_MODES,
+    load_template,
+    page_pdf,
+    register_pdf_font,
+    template_size,
+)
+from .tilecache import DEFAULT_TILE_CACHE_BYTES, TileAtlas, TileCache
+
+DEFAULT_PORT = 8080
+
+# Largest request body accepted, in bytes
+MAX_REQUEST_BYTES = 1 << 20
+
+# Largest chunk of a PDF read from its spool file and sent at once, in bytes
+STREAM_CHUNK_BYTES = 1 << 20
+
+JOB_STATES = ("queued", "running", "done", "failed")
+
+# Song title tiles kept by each render worker, across jobs
+WORKER_ATLAS_TILES = 4096
+
+# TileAtlas of a render worker process, set up by _warm_worker
+_worker_atlas = None
+
+
+def _warm_worker(template_path, font_path):
+    """Load everything a render worker needs once, when the worker process starts"""
+    global _worker_atlas
+    _worker_atlas = TileAtlas(max_tiles=WORKER_ATLAS_TILES)
+    load_template(template_path)
+    page_layout(template_path, *template_size(template_path))
+    register_pdf_font(font_path)
+    for size in range(MIN_FONT_SIZE, MAX_FONT_SIZE + 1):
+        load_font(font_path, size)
+
+
+def _render_page_pdf(task):
+    """Process pool entry point for page_pdf"""
+    template_path, cell_texts_list, page_number, options = task
+    if options["tile_cache"] is None:
+        # Titles the worker drew for earlier pages and jobs are pasted again
+        options = dict(options, tile_cache=_worker_atlas)
+    return page_pdf(template_path, cell_texts_list, page_number, **options)
+
+
+def _ping():
+    return os.getpid()
+
+
+class Job:
+    """
+    A deck being generated, and the PDF written so far
+
+    Attributes:
+        id: Job id
+        config: DeckConfig of the deck
+        options: Render options, as keyword arguments of page_pdf
+        priority: Jobs with a higher priority run first
+        state: One of JOB_STATES
+        pages_done: Pages written to the PDF so far
+        error: Why the job failed, if it did
+        path: Temporary file the PDF is spooled to, so finished jobs don't hold their PDF in memory
+        size: Bytes of the PDF written so far
+    """
+
+    def __init__(self, job_id, config, options, priority, spool_dir=None):
+        self.id = job_id
+        self.config = config
+        self.options = options
+        self.priority = priority
+        self.state = "queued"
+        self.pages_done = 0
+        self.error = None
+        fd, self.path = tempfile.mkstemp(prefix=f"job{job_id}-", suffix=".pdf", dir=spool_dir)
+        self._file = os.fdopen(fd, "wb")
+        self.size = 0
+        self.times = {"created": time.time()}
+        self._updated = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.state in ("done", "failed")
+
+    def write(self, data):
+        """Append to the PDF; PdfMerger writes through this"""
+        self._file.write(data)
+        # Readers open the file on their own, so they must see every byte counted in size
+        self._file.flush()
+        self.size += len(data)
+        self._notify()
+
+    def set_state(self, state, error=None):
+        self.state = state
+        self.error = error
+        if self.finished:
+            self._file.close()
+        self.times[{"running": "started", "done": "finished", "failed": "finished"}[state]] = time.time()
+        self._notify()
+
+    def discard(self):
+        """Delete the spooled PDF; streams that already opened it can still finish"""
+        self._file.close()
+        with contextlib.suppress(OSError):
+            os.remove(self.path)
+
+    def _notify(self):
+        # Wake up everyone waiting for this update, and start a new one
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def wait_for_output(self, size):
+        """Wait until the PDF is longer than size bytes or the job is finished"""
+        while self.size <= size and not self.finished:
+            await self._updated.wait()
+
+    def status(self, queue_position=None):
+        """JSON-ready summary of the job"""
+        status = {
+            "id": self.id,
+            "state": self.state,
+            "priority": self.priority,
+            "seed": self.config.seed,
+            "pages_done": self.pages_done,
+            "total_pages": self.config.num_sheets,
+            "pdf_bytes": self.size,
+            "times": self.times,
+            "links": {"self": f"/jobs/{self.id}", "pdf": f"/jobs/{self.id}/pdf"},
+        }
+        if queue_position is not None:
+            status["queue_position"] = queue_position
+        if self.error is not None:
+            status["error"] = self.error
+        return status
+
+
+def parse_job_request(data, canciones=None, canciones_ganadoras=None, max_sheets=1000, cards_per_page=CARDS_PER_PAGE):
+    """
+    Check the body of a POST /jobs request
+
+    Fields (all optional):
+        canciones, canciones_ganadoras: Song pools (default: those the server was started with)
+        sheets: Number of pages (default 15)
+        seed: Seed of the deck (default: a new one, reported in the job status)
+        balanced: Use every song of each pool evenly (see DeckConfig.balanced)
+        priority: Integer, higher runs first (default 0)
+        render_mode, image_format, jpeg_quality, png_compress_level, dpi: As for create_pdf_with_images
+
+    Returns:
+        Tuple (config, options, priority)
+
+    Raises:
+        ValueError: If a field is missing or invalid, or if the song pools
+            cannot produce enough unique cards for the deck
+    """
+    if not isinstance(data, dict):
+        raise ValueError("The request body must be a JSON object")
+
+    def integer(name, default, minimum=None, maximum=None):
+        value = data.get(name, default)
+        if value is None and default is None:
+            return None
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError(f"{name!r} must be an integer")
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            raise ValueError(f"{name!r} must be between {minimum} and {maximum}")
+        return value
+
+    def songs(name, default):
+        value = data.get(name, default)
+        if not isinstance(value, list) or not value or not all(isinstance(song, str) for song in value):
+            raise ValueError(f"{name!r} must be a non-empty list of song titles")
+        return value
+
+    def boolean(name, default):
+        value = data.get(name, default)
+        if not isinstance(value, bool):
+            raise ValueError(f"{name!r} must be true or false")
+        return value
+
+    def choice(name, default, choices):
+        value = data.get(name, default)
+        if value not in choices:
+            raise ValueError(f"{name!r} must be one of {choices}")
+        return value
+
+    seed = integer("seed", None)
+    config = DeckConfig(
+        canciones=songs("canciones", canciones),
+        canciones_ganadoras=songs("canciones_ganadoras", canciones_ganadoras),
+        num_sheets=integer("sheets", 15, 1, max_sheets),
+        seed=new_seed() if seed is None else seed,
+        balanced=boolean("balanced", False),
+        cards_per_page=cards_per_page,
+    )
+    # Check the song pools now, so the client gets a 400 rather than a failed job
+    iter_pages(config, pages=())
+    options = {
+        "render_mode": choice("render_mode", "raster", RENDER_MODES),
+        "image_format": choice("image_format", "PNG", PAGE_IMAGE_FORMATS),
+        "jpeg_quality": integer("jpeg_quality", 90, 1, 95),
+        "png_compress_level": integer("png_compress_level", 6, 0, 9),
+        "dpi": integer("dpi", None, 1, 2400),
+    }
+    return config, options, integer("priority", 0)
+
+
+class JobServer:
+    """
+    Queue, run and serve deck generation jobs
+
+    Args:
+        template_path: Template of every deck
+        font_path: Font of every deck
+        workers: Render worker processes
+        concurrent_jobs: Jobs generated at the same time; their pages share the workers
+        canciones, canciones_ganadoras: Default song pools of the requests
+        max_sheets: Largest deck accepted
+        keep_jobs: Finished jobs kept, with their PDF, before the oldest are forgotten
+        tile_cache: Optional TileCache shared by the workers
+        spool_dir: Directory of the PDFs of the jobs (default: the system's temporary directory)
+
+    Attributes:
+        pool_restarts: Times the worker pool broke, because a worker died, and was started again
+        pool_error: Why the worker pool last broke, if it did
+    """
+
+    def __init__(self, template_path=DEFAULT_TEMPLATE_PATH, font_path=DEFAULT_FONT_PATH, workers=1,
+                 concurrent_jobs=2, canciones=None, canciones_ganadoras=None, max_sheets=1000, keep_jobs=100,
+                 tile_cache=None, spool_dir=None):
+        self.template_path = template_path
+        self.font_path = font_path
+        self.workers = workers
+        self.concurrent_jobs = concurrent_jobs
+        self.canciones = canciones
+        self.canciones_ganadoras = canciones_ganadoras
+        self.max_sheets = max_sheets
+        self.keep_jobs = keep_jobs
+        self.tile_cache = tile_cache
+        self.spool_dir = spool_dir
+        self.jobs = collections.OrderedDict()
+        self._ids = itertools.count(1)
+        self._queue = None
+        self._pool = None
+        self._runners = []
+        self.pool_restarts = 0
+        self.pool_error = None
+
+        layout = load_layout(template_path)
+        if layout.songs_per_card != SONGS_PER_CARD:
+            raise ValueError(f"The layout of {template_path!r} has {layout.songs_per_card} songs per card, "
+                             f"but cards have {SONGS_PER_CARD}")
+        self.cards_per_page = layout.cards_per_page
+
+    async def start(self):
+        """Start the worker processes, wait until they are warm, and start taking jobs"""
+        self._queue = asyncio.PriorityQueue()
+        self._pool = self._new_pool()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _ping) for _ in range(self.workers)))
+        self._runners = [asyncio.ensure_future(self._run_jobs()) for _ in range(self.concurrent_jobs)]
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker,
+                                   initargs=(self.template_path, self.font_path))
+
+    def _restart_pool(self, pool, error):
+        """Replace a broken worker pool, unless another job already has"""
+        if pool is not self._pool:
+            return
+        pool.shutdown(wait=False)
+        self._pool = self._new_pool()
+        self.pool_restarts += 1
+        self.pool_error = f"{type(error).__name__}: {error}"
+
+    async def stop(self):
+        for runner in self._runners:
+            runner.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+        self._pool.shutdown(wait=False)
+        for job in self.jobs.values():
+            job.discard()
+        self.jobs.clear()
+
+    def submit(self, data):
+        """
+        Queue a job from the body of a POST /jobs request
+
+        Raises:
+            ValueError: If the request is invalid
+        """
+        config, options, priority = parse_job_request(data, self.canciones, self.canciones_ganadoras,
+                                                       self.max_sheets, self.cards_per_page)
+        job = Job(str(next(self._ids)), config, options, priority, self.spool_dir)
+        self.jobs[job.id] = job
+        self._queue.put_nowait((-priority, int(job.id), job))
+        return job
+
+    def queue_position(self, job):
+        """Number of queued jobs that will start before a queued job"""
+        if job.state != "queued":
+            return None
+        key = (-job.priority, int(job.id))
+        return sum(1 for other in self.jobs.values()
+                   if other.state == "queued" and (-other.priority, int(other.id)) < key)
+
+    async def _run_jobs(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                await self._run_job(job)
+            except Exception as e:
+                job.set_state("failed", f"{type(e).__name__}: {e}")
+            self._forget_old_jobs()
+
+    async def _run_job(self, job):
+        loop = asyncio.get_running_loop()
+        job.set_state("running")
+        try:
+            deck = await loop.run_in_executor(None, generate, job.config)
+        except ValueError as e:
+            job.set_state("failed", str(e))
+            return
+
+        options = dict(job.options, font_path=self.font_path, tile_cache=self.tile_cache)
+        merger = PdfMerger(job)
+        # Keep every worker busy, but only hold the rendered pages of a few pages per worker
+        pending = collections.deque()
+        pool = self._pool
+        try:
+            for page_number, page in enumerate(deck.pages, 1):
+                task = (self.template_path, page, page_number, options)
+                pending.append(loop.run_in_executor(pool, _render_page_pdf, task))
+                if len(pending) >= 2 * self.workers:
+                    self._add_page(job, merger, await pending.popleft())
+            while pending:
+                self._add_page(job, merger, await pending.popleft())
+        except BrokenProcessPool as e:
+            self._restart_pool(pool, e)
+            job.set_state("failed", "A render worker stopped unexpectedly")
+            return
+        finally:
+            for future in pending:
+                future.cancel()
+        merger.close()
+        job.set_state("done")
+
+    def _add_page(self, job, merger, pdf_bytes):
+        merger.add(PdfReader(f"page {job.pages_done + 1}", pdf_bytes))
+        job.pages_done += 1
+        if job.pages_done == 1:
+            job.times["first_page"] = time.time()
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.keep_jobs)]:
+            self.jobs.pop(job_id).discard()
+
+    async def handle(self, reader, writer):
+        """Serve one HTTP request, then close the connection"""
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length") or 0)
+            if length > MAX_REQUEST_BYTES:
+                await _send_json(writer, 413, {"error": "Request body too large"})
+                return
+            body = await reader.readexactly(length) if length else b""
+            await self._route(method.upper(), urlsplit(target).path.rstrip("/"), body, writer)
+        except (ValueError, asyncio.IncompleteReadError):
+            with contextlib.suppress(ConnectionError):
+                await _send_json(writer, 400, {"error": "Malformed request"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _route(self, method, path, body, writer):
+        parts = [part for part in path.split("/") if part]
+        if parts == ["health"] and method == "GET":
+            states = collections.Counter(job.state for job in self.jobs.values())
+            await _send_json(writer, 200, {"workers": self.workers, "pool_restarts": self.pool_restarts,
+                                           "pool_error": self.pool_error,
+                                           "jobs": {state: states[state] for state in JOB_STATES}})
+        elif parts == ["jobs"] and method == "POST":
+            try:
+                job = self.submit(json.loads(body.decode("utf-8") or "{}"))
+            except ValueError as e:
+                await _send_json(writer, 400, {"error": str(e)})
+                return
+            await _send_json(writer, 202, job.status(self.queue_position(job)))
+        elif parts == ["jobs"] and method == "GET":
+            await _send_json(writer, 200, [job.status(self.queue_position(job)) for job in self.jobs.values()])
+        elif len(parts) in (2, 3) and parts[0] == "jobs" and method == "GET":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                await _send_json(writer, 404, {"error": f"No job {parts[1]!r}"})
+            elif len(parts) == 2:
+                await _send_json(writer, 200, job.status(self.queue_position(job)))
+            elif parts[2] == "pdf":
+                await _stream_pdf(writer, job)
+            else:
+                await _send_json(writer, 404, {"error": "Not found"})
+        else:
+            await _send_json(writer, 404, {"error": "Not found"})
+
+
+_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large"}
+
+
+async def _send_json(writer, status, data):
+    body = json.dumps(data).encode("utf-8")
+    writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+
+async def _stream_pdf(writer, job):
+    """Send the PDF of a job with chunked encoding as it grows, from its first byte"""
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/pdf\r\nTransfer-Encoding: chunked\r\n"
+                 b"Connection: close\r\n\r\n")
+    sent = 0
+    # Keep the spooled PDF open, so the stream can finish if the job is forgotten meanwhile
+    with open(job.path, "rb") as f:
+        while True:
+            await job.wait_for_output(sent)
+            if job.size > sent:
+                chunk = f.read(min(job.size - sent, STREAM_CHUNK_BYTES))
+                writer.write(b"%x\r\n" % len(chunk) + chunk + b"\r\n")
+                sent += len(chunk)
+                await writer.drain()
+            elif job.finished:
+                break
+    if job.state == "done":
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+    # A failed job ends the stream without its last chunk, so the client can tell it is incomplete
+
+
+async def serve(server, host="127.0.0.1", port=DEFAULT_PORT, ready=None):
+    """
+    Run a JobServer until cancelled or sent SIGTERM
+
+    Args:
+        server: JobServer
+        host: Address to listen on
+        port: Port to listen on (0 for any free port)
+        ready: Function called with the port once the server is listening
+    """
+    # Stop on SIGTERM as on Ctrl+C, so the workers are shut down and the spooled PDFs deleted
+    # (not on Windows, nor when the loop runs outside the main thread)
+    with contextlib.suppress(NotImplementedError, RuntimeError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    await server.start()
+    listener = await asyncio.start_server(server.handle, host, port)
+    try:
+        if ready is not None:
+            ready(listener.sockets[0].getsockname()[1])
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.stop()
+
+
+def main(argv=None):
+    """Entry point of the musical-bingo-server command"""
+    parser = argparse.ArgumentParser(description="Generate musical bingo decks on request over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="render worker processes (default: one per CPU)")
+    parser.add_argument("--concurrent-jobs", type=int, default=2,
+                        help="jobs generated at the same time (default: 2)")
+    parser.add_argument("--songs", default=DEFAULT_SONGS_PATH,
+                        help=f"default song pools of the requests (default: {DEFAULT_SONGS_PATH}, if it exists)")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE_PATH,
+                        help=f"template image (default: {DEFAULT_TEMPLATE_PATH})")
+    parser.add_argument("--font", default=DEFAULT_FONT_PATH, help=f"TrueType font (default: {DEFAULT_FONT_PATH})")
+    parser.add_argument("--max-sheets", type=int, default=1000, help="largest deck accepted (default: 1000)")
+    parser.add_argument("--keep-jobs", type=int, default=100,
+                        help="finished jobs kept for download (default: 100)")
+    parser.add_argument("--tile-cache", metavar="DIR", help="share a tile cache in DIR between the workers")
+    parser.add_argument("--spool-dir", metavar="DIR",
+                        help="directory of the PDFs of the jobs (default: the system's temporary directory)")
+    args = parser.parse_args(argv)
+
+    canciones = canciones_ganadoras = None
+    if os.path.exists(args.songs):
+        canciones, canciones_ganadoras = load_song_pools(args.songs)
+    try:
+        server = JobServer(
+            template_path=args.template,
+            font_path=args.font,
+            workers=args.workers,
+            concurrent_jobs=args.concurrent_jobs,
+            canciones=canciones,
+            canciones_ganadoras=canciones_ganadoras,
+            max_sheets=args.max_sheets,
+            keep_jobs=args.keep_jobs,
+            tile_cache=TileCache(args.tile_cache, DEFAULT_TILE_CACHE_BYTES) if args.tile_cache else None,
+            spool_dir=args.spool_dir,
+        )
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    def ready(port):
+        print(f"Listening on http://{args.host}:{port} with {args.workers} workers", flush=True)
+
+    with contextlib.suppress(KeyboardInterrupt, asyncio.CancelledError):
+        asyncio.run(serve(server, args.host, args.port, ready))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""
+Game simulation: how many songs are called before the first card is complete, and how often cards tie
+
+The host calls every song of the pools once, in random order, and a card is
+complete once all of its songs have been called. GameSimulator keeps an
+inverted index from each song to the cards that have it and a countdown of the
+songs each card still misses, so a call only touches the cards with that song.
+
+With NumPy installed, simulate plays a batch of games at once instead: the
+call on which a card is complete is the latest call of its songs, so the first
+complete cards of every game in the batch come out of a few array operations.
+"""
+import random
+from collections import Counter
+from dataclasses import dataclass, field
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .cards import derive_seed, new_seed
+
+# Card positions of the games played at once by the NumPy path (cards * games)
+_BATCH_ELEMENTS = 1 << 21
+
+# Numbers of tied cards listed one by one in print_simulation_report
+_LISTED_WINNERS = 5
+
+
+@dataclass
+class SimulationReport:
+    """
+    Results of many simulated games of a deck
+    
+    Attributes:
+        games: Number of games played
+        num_cards: Number of cards in the deck
+        num_songs: Number of songs called in a whole game
+        first_win_calls: Number of songs called until the first card was complete, mapped to the number of games
+        first_winners: Number of cards complete on that same call, mapped to the number of games
+        winning_card_first: Games in which the card with all the canciones_ganadoras was among the first complete
+    """
+    games: int = 0
+    num_cards: int = 0
+    num_songs: int = 0
+    first_win_calls: Counter = field(default_factory=Counter)
+    first_winners: Counter = field(default_factory=Counter)
+    winning_card_first: int = 0
+    
+    @property
+    def tie_games(self):
+        """Games in which more than one card was complete on the first winning call"""
+        return sum(games for winners, games in self.first_winners.items() if winners > 1)
+    
+    @property
+    def tie_probability(self):
+        return self.tie_games / self.games if self.games else 0.0
+    
+    @property
+    def mean_first_win(self):
+        """Average number of songs called until the first card was complete"""
+        played = sum(self.first_win_calls.values())
+        return sum(calls * games for calls, games in self.first_win_calls.items()) / played if played else 0.0
+    
+    def first_win_percentile(self, fraction):
+        """
+        Number of calls by which the first card was complete in at least a fraction of the games
+        
+        Args:
+            fraction: Between 0 and 1, e.g. 0.5 for the median
+        """
+        played = sum(self.first_win_calls.values())
+        seen = 0
+        for calls in sorted(self.first_win_calls):
+            seen += self.first_win_calls[calls]
+            if seen >= fraction * played:
+                return calls
+        return 0
+
+
+class GameSimulator:
+    """
+    Play games of bingo against a deck
+    
+    Card locations are (page, card) tuples numbered from 1, as in DeckReport.
+    """
+    
+    def __init__(self, pages, canciones=(), canciones_ganadoras=()):
+        """
+        Args:
+            pages: List of pages, where each page is a list of cards,
+                   and each card is a list of songs
+            canciones: Songs of the canciones pool
+            canciones_ganadoras: Songs of the winning card
+        
+        The songs called are those of both pools and any other song on the cards.
+        """
+        self.locations = []
+        self.songs = list(dict.fromkeys(list(canciones_ganadoras) + list(canciones)))
+        self._song_ids = {song: song_id for song_id, song in enumerate(self.songs)}
+        self._card_songs = []
+        for page_idx, page in enumerate(pages, 1):
+            for card_idx, card in enumerate(page, 1):
+                self.locations.append((page_idx, card_idx))
+                self._card_songs.append(tuple(sorted({self._song_id(song) for song in card})))
+        
+        # Inverted index: the cards with each song
+        self._index = [[] for _ in self.songs]
+        for card, song_ids in enumerate(self._card_songs):
+            for song_id in song_ids:
+                self._index[song_id].append(card)
+        
+        winner_songs = tuple(sorted({self._song_ids[song] for song in canciones_ganadoras}))
+        self.winner_cards = [card for card, song_ids in enumerate(self._card_songs)
+                             if winner_songs and song_ids == winner_songs]
+    
+    def _song_id(self, song):
+        song_id = self._song_ids.get(song)
+        if song_id is None:
+            song_id = self._song_ids[song] = len(self.songs)
+            self.songs.append(song)
+        return song_id
+    
+    @property
+    def num_cards(self):
+        return len(self._card_songs)
+    
+    def _play_ids(self, song_ids, until_first):
+        """play with song ids and card indices"""
+        remaining = [len(card_songs) for card_songs in self._card_songs]
+        called = set()
+        completions = []
+        for call, song_id in enumerate(song_ids, 1):
+            if song_id in called:
+                continue
+            called.add(song_id)
+            complete = []
+            for card in self._index[song_id]:
+                remaining[card] -= 1
+                if not remaining[card]:
+                    complete.append(card)
+            if complete:
+                completions.append((call, complete))
+                if until_first:
+                    break
+        return completions
+    
+    def play(self, order, until_first=True):
+        """
+        Play one game
+        
+        Args:
+            order: Songs in the order they are called; a song called again is ignored
+            until_first: Stop at the first call that completes a card
+        
+        Returns:
+            List of (call number from 1, locations of the cards it completed) for
+            each call that completed a card, in order
+        """
+        song_ids = [self._song_ids[song] for song in order if song in self._song_ids]
+        return [(call, [self.locations[card] for card in cards])
+                for call, cards in self._play_ids(song_ids, until_first)]
+    
+    def simulate(self, games, seed=None):
+        """
+        Play many games, each calling all the songs in a random order
+        
+        Args:
+            games: Number of games to play
+            seed: Seed of the orders of the songs, for reproducible results
+                  (NumPy, when installed, draws different orders than the random module)
+        
+        Returns:
+            SimulationReport
+        """
+        rng_seed = derive_seed(new_seed() if seed is None else seed, "games")
+        report = SimulationReport(games=games, num_cards=self.num_cards, num_songs=len(self.songs))
+        if not self._card_songs or games <= 0:
+            return report
+        if np is not None:
+            self._simulate_batches(report, np.random.default_rng(rng_seed))
+        else:
+            self._simulate_games(report, random.Random(rng_seed))
+        return report
+    
+    def _simulate_games(self, report, rng):
+        """simulate with the countdown of each card, one game at a time"""
+        winner_cards = set(self.winner_cards)
+        order = list(range(len(self.songs)))
+        for _ in range(report.games):
+            rng.shuffle(order)
+            call, cards = self._play_ids(order, until_first=True)[0]
+            report.first_win_calls[call] += 1
+            report.first_winners[len(cards)] += 1
+            if winner_cards.intersection(cards):
+                report.winning_card_first += 1
+    
+    def _simulate_batches(self, report, rng):
+        """simulate with NumPy, a batch of games at a time"""
+        num_songs = len(self.songs)
+        width = max(len(song_ids) for song_ids in self._card_songs)
+        # Cards with fewer songs repeat their first one, which doesn't change their latest call
+        columns = [np.array([song_ids[min(column, len(song_ids) - 1)] for song_ids in self._card_songs],
+                            dtype=np.intp)
+                   for column in range(width)]
+        winner_rows = np.array(self.winner_cards, dtype=np.intp)
+        dtype = np.uint8 if num_songs <= 1 << 8 else np.uint16 if num_songs <= 1 << 16 else np.uint32
+        batch_size = max(1, min(report.games, _BATCH_ELEMENTS // self.num_cards))
+        calls = np.tile(np.arange(num_songs, dtype=dtype), (batch_size, 1))
+        first_win_calls = np.zeros(num_songs + 1, dtype=np.int64)
+        first_winners = np.zeros(self.num_cards + 1, dtype=np.int64)
+        
+        for start in range(0, report.games, batch_size):
+            size = min(batch_size, report.games - start)
+            # Call (from 0) of each song in each game, one column per game
+            song_calls = np.ascontiguousarray(rng.permuted(calls[:size], axis=1).T)
+            card_calls = song_calls[columns[0]]
+            for column in columns[1:]:
+                np.maximum(card_calls, song_calls[column], out=card_calls)
+            first = card_calls.min(axis=0)
+            is_first = card_calls == first
+            first_win_calls += np.bincount(first.astype(np.intp) + 1, minlength=num_songs + 1)
+            first_winners += np.bincount(np.count_nonzero(is_first, axis=0), minlength=self.num_cards + 1)
+            if winner_rows.size:
+                report.winning_card_first += int(np.count_nonzero(is_first[winner_rows].any(axis=0)))
+        
+        report.first_win_calls.update({call: int(games) for call, games in enumerate(first_win_calls) if games})
+        report.first_winners.update({winners: int(games) for winners, games in enumerate(first_winners) if games})
+
+
+def simulate_deck(deck, games, seed=None):
+    """
+    Play many random games against a Deck
+    
+    Args:
+        deck: Deck to play
+        games: Number of games
+        seed: Seed of the games (default: derived from the seed of the deck, if it has one)
+    
+    Returns:
+        SimulationReport
+    """
+    if seed is None and deck.seed is not None:
+        seed = derive_seed(deck.seed, "simulation")
+    simulator = GameSimulator(deck.pages, deck.canciones, deck.canciones_ganadoras)
+    return simulator.simulate(games, seed)
+
+
+def print_simulation_report(report):
+    """Print the distribution of the first win and how often cards tie for it"""
+    print(f"\n=== GAME SIMULATION ===")
+    print(f"Games played: {report.games} ({report.num_cards} cards, {report.num_songs} songs called per game)")
+    if not report.first_win_calls:
+        print("=======================")
+        return
+    print(f"Songs called until the first complete card: average {report.mean_first_win:.1f}, "
+          f"median {report.first_win_percentile(0.5)}, "
+          f"10% of games by {report.first_win_percentile(0.1)}, 90% by {report.first_win_percentile(0.9)} "
+          f"(fastest {min(report.first_win_calls)}, slowest {max(report.first_win_calls)})")
+    print(f"Games with a tie for the first complete card: {report.tie_games} ({report.tie_probability * 100:.1f}%)")
+    print(f"Cards complete on the first winning call:")
+    for winners in range(1, _LISTED_WINNERS + 1):
+        games = report.first_winners.get(winners, 0)
+        print(f"  {winners}: {games} games ({games / report.games * 100:.1f}%)")
+    more = sum(games for winners, games in report.first_winners.items() if winners > _LISTED_WINNERS)
+    if more:
+        print(f"  more than {_LISTED_WINNERS}: {more} games ({more / report.games * 100:.1f}%), "
+              f"up to {max(report.first_winners)}")
+    print(f"Winning card among the first complete: {report.winning_card_first} games "
+          f"({report.winning_card_first / report.games * 100:.1f}%)")
+    print("=======================")
@@ -0,0 +1,133 @@
+"""
+Fast text measurement from cached glyph advances, kerning pairs and ink extents
+"""
+from PIL import ImageFont
+import functools
+
+# Estimates closer than this many pixels to the limit are checked with a real getbbox;
+# the error of the estimate is well under a pixel, this leaves room for overhangs
+BORDERLINE_MARGIN = 3
+
+
+class GlyphMetrics:
+    """
+    Measure strings of one font by adding up cached per-glyph values
+    
+    The ink width of a string, as font.getbbox reports it, is the pen position of
+    its last glyph plus that glyph's right ink edge, minus the left ink edge of
+    the first glyph. The pen position is the sum of the advances of the glyphs
+    before it and the kerning of each pair, all of which are cached, so measuring
+    a string costs dictionary lookups instead of a FreeType layout.
+    """
+    
+    def __init__(self, font):
+        """
+        Args:
+            font: PIL FreeTypeFont
+        """
+        self.font = font
+        self._advances = {}
+        self._kerning = {}
+        self._ink = {}
+        self._word_pens = {}
+    
+    def advance(self, char):
+        """Horizontal advance of a single glyph"""
+        advance = self._advances.get(char)
+        if advance is None:
+            advance = self._advances[char] = self.font.getlength(char)
+        return advance
+    
+    def kerning(self, left, right):
+        """Adjustment of the advance between two glyphs"""
+        pair = left + right
+        kerning = self._kerning.get(pair)
+        if kerning is None:
+            kerning = self._kerning[pair] = self.font.getlength(pair) - self.advance(left) - self.advance(right)
+        return kerning
+    
+    def ink(self, char):
+        """(left, right) ink edges of a glyph relative to its origin, None if it has no ink"""
+        if char not in self._ink:
+            bbox = self.font.getbbox(char)
+            self._ink[char] = (bbox[0], bbox[2]) if bbox[2] > bbox[0] else None
+        return self._ink[char]
+    
+    def pen(self, word):
+        """Pen position after drawing word from 0"""
+        pen = self._word_pens.get(word)
+        if pen is None:
+            pen = self.advance(word[0])
+            for left, right in zip(word, word[1:]):
+                pen += self.kerning(left, right) + self.advance(right)
+            self._word_pens[word] = pen
+        return pen
+    
+    def width(self, text, pen=None):
+        """
+        Estimate the ink width of text
+        
+        Args:
+            text: Non-empty string
+            pen: Pen position after text, if already known
+        
+        Returns:
+            Estimated width, or None if text starts or ends with a glyph without
+            ink, where the estimate doesn't hold
+        """
+        first_ink = self.ink(text[0])
+        last_ink = self.ink(text[-1])
+        if first_ink is None or last_ink is None:
+            return None
+        if pen is None:
+            pen = self.pen(text)
+        return pen - self.advance(text[-1]) + last_ink[1] - first_ink[0]
+    
+    def exact_width(self, text):
+        """
+        Measure the ink width of text with font.getbbox
+        
+        This is the width the estimates stand in for, and what fits falls back
+        to near the limit. Fonts laid out with Raqm get no GlyphMetrics (see
+        glyph_metrics), so their callers always measure them with getbbox too.
+        
+        Args:
+            text: Non-empty string
+        
+        Returns:
+            Width in pixels from the left to the right ink edge
+        """
+        bbox = self.font.getbbox(text)
+        return bbox[2] - bbox[0]
+    
+    def fits(self, text, max_width, pen=None):
+        """
+        Check whether text is at most max_width wide, exactly as font.getbbox would
+        
+        Args:
+            text: Non-empty string
+            max_width: Maximum width in pixels
+            pen: Pen position after text, if already known
+        """
+        estimate = self.width(text, pen)
+        if estimate is None or abs(estimate - max_width) <= BORDERLINE_MARGIN:
+            return self.exact_width(text) <= max_width
+        return estimate <= max_width
+
+
+@functools.lru_cache(maxsize=256)
+def glyph_metrics(font):
+    """
+    Get the GlyphMetrics of a font, shared by every caller
+    
+    Args:
+        font: PIL font
+    
+    Returns:
+        GlyphMetrics, or None for fonts that have to be measured with getbbox:
+        bitmap fonts, and fonts laid out with Raqm, whose shaping (ligatures,
+        contextual forms) isn't a sum of glyph pairs
+    """
+    if not isinstance(font, ImageFont.FreeTypeFont) or font.layout_engine != ImageFont.Layout.BASIC:
+        return None
+    return GlyphMetrics(font)
@@ -0,0 +1,376 @@
+"""
+Persistent cache of rendered song title tiles, shared by runs and processes
+
+A tile holds the alpha masks of the lines of one song title laid out in an
+inner cell, with their offsets from the top-left corner of the cell. Pasting
+white through the masks, line by line, gives the same pixels as drawing the
+text, so pages can be put together from tiles, and a title is only laid out
+and drawn once per font and cell size.
+"""
+from PIL import Image, ImageDraw, ImageFont, features
+import PIL
+import collections
+import functools
+import hashlib
+import math
+import os
+import struct
+import tempfile
+import threading
+import zlib
+
+from .layout import layout_text
+
+# Part of every key: bump it when the text layout or the tile encoding changes
+TILE_FORMAT_VERSION = 1
+
+DEFAULT_TILE_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "musical-bingo-maker", "tiles",
+)
+DEFAULT_TILE_CACHE_BYTES = 256 * 1024 * 1024
+
+# Evicting trims the cache down to this fraction of its size limit
+_EVICT_TO = 0.8
+
+# Pixels around each line's bounding box in the mask it is drawn into, before cropping to the ink
+_TILE_MARGIN = 2
+
+_HEADER = struct.Struct("<4sHH")
+_LINE_HEADER = struct.Struct("<iiIII")
+_MAGIC = b"MBTL"
+
+TileLine = collections.namedtuple("TileLine", ["x", "y", "mask"])
+TileLine.__doc__ = "Alpha mask of one line of a title and its offset from the cell's top-left corner"
+
+
+@functools.lru_cache(maxsize=16)
+def _file_digest(path, mtime_ns, size):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """SHA-256 of a file, recomputed only when the file changes ("missing" if it can't be read)"""
+    try:
+        stat = os.stat(path)
+        return _file_digest(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        # For fonts, layout falls back to the default font, which doesn't depend on the path
+        return "missing"
+
+
+@functools.lru_cache(maxsize=None)
+def renderer_version():
+    """
+    Versions of the libraries that lay out and rasterize the titles
+    
+    Another Pillow or FreeType can draw the same text with different pixels,
+    and fonts are laid out with Raqm when Pillow has it, so a shared cache
+    must not mix their tiles.
+    """
+    version = f"Pillow {PIL.__version__}, FreeType {ImageFont.core.freetype2_version}"
+    if features.check_feature("raqm"):
+        version += f", Raqm {features.version_feature('raqm')}"
+    return version
+
+
+def tile_key(text, cell_width, cell_height, font_path):
+    """Content address of the tile of text in a cell of this size and font, drawn by this renderer_version"""
+    key = (f"{TILE_FORMAT_VERSION}\0{renderer_version()}\0{file_digest(font_path)}\0"
+           f"{cell_width}x{cell_height}\0{text}")
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def render_tile(text, cell_width, cell_height, font_path):
+    """
+    Lay out text in a cell and draw each line into an alpha mask
+    
+    Lines get a mask each because they can overlap (descenders over accents),
+    and blending the overlap twice into the page rounds differently than
+    blending a combined mask once.
+    
+    Args:
+        text: Text of the cell
+        cell_width: Cell width in pixels
+        cell_height: Cell height in pixels
+        font_path: Path to the font file
+    
+    Returns:
+        Tile: tuple of TileLine, empty if there is nothing to draw
+    """
+    best_font, placed_lines = layout_text(text, 0, 0, cell_width, cell_height, font_path)
+    tile = []
+    for text_x, text_y, line in placed_lines:
+        # Room for the line from its anchor with a margin for antialiasing. The anchor
+        # keeps the fractional part of its position on the page (it has to stay positive
+        # for that), so the glyphs rasterize the same
+        left, top, right, bottom = best_font.getbbox(line)
+        left, top = min(left, 0), min(top, 0)
+        x0 = math.floor(text_x) + left - _TILE_MARGIN
+        y0 = math.floor(text_y) + top - _TILE_MARGIN
+        mask = Image.new("L", (right - left + 2 * _TILE_MARGIN + 1, bottom - top + 2 * _TILE_MARGIN + 1), 0)
+        ImageDraw.Draw(mask).text((text_x - x0, text_y - y0), line, font=best_font, fill=255)
+        
+        ink = mask.getbbox()
+        if ink is not None:
+            tile.append(TileLine(x0 + ink[0], y0 + ink[1], mask.crop(ink)))
+    return tuple(tile)
+
+
+def paste_tile(image, tile, cell_x0, cell_y0, color=(255, 255, 255)):
+    """Paste color through the masks of a tile onto image, at the cell's top-left corner"""
+    for x, y, mask in tile:
+        image.paste(color, (cell_x0 + x, cell_y0 + y), mask)
+
+
+def _encode_tile(tile):
+    chunks = [_HEADER.pack(_MAGIC, TILE_FORMAT_VERSION, len(tile))]
+    for x, y, mask in tile:
+        pixels = zlib.compress(mask.tobytes(), 1)
+        chunks.append(_LINE_HEADER.pack(x, y, mask.size[0], mask.size[1], len(pixels)))
+        chunks.append(pixels)
+    return b"".join(chunks)
+
+
+def _decode_tile(data):
+    magic, version, num_lines = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != TILE_FORMAT_VERSION:
+        raise ValueError("Not a tile of this version")
+    tile = []
+    offset = _HEADER.size
+    for _ in range(num_lines):
+        x, y, width, height, length = _LINE_HEADER.unpack_from(data, offset)
+        offset += _LINE_HEADER.size
+        pixels = zlib.decompress(data[offset:offset + length])
+        offset += length
+        tile.append(TileLine(x, y, Image.frombytes("L", (width, height), pixels)))
+    return tuple(tile)
+
+
+class TileCache:
+    """
+    Content-addressed tiles on disk, with a small in-memory layer in front
+    
+    Each tile is a file named by its key, written to a temporary file and
+    renamed into place, so several processes (render workers, concurrent runs)
+    can share a directory without locks: readers see whole files or nothing,
+    and a tile written twice is the same either way. Hits refresh the file's
+    modification time, and eviction deletes the least recently used files once
+    the directory grows past max_bytes.
+    """
+    
+    def __init__(self, directory=DEFAULT_TILE_CACHE_DIR, max_bytes=DEFAULT_TILE_CACHE_BYTES, memory_items=4096):
+        """
+        Args:
+            directory: Directory of the tile files, created if needed
+            max_bytes: Size limit of the directory
+            memory_items: Tiles kept decoded in memory by each process
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        # Guards the in-memory layer and the counters, for threads sharing the cache
+        self._lock = threading.Lock()
+        self._written_bytes = 0
+    
+    def __getstate__(self):
+        # Worker processes get the settings, not the decoded tiles
+        state = self.__dict__.copy()
+        state["_memory"] = collections.OrderedDict()
+        del state["_lock"]
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".tile")
+    
+    def get(self, text, cell_width, cell_height, font_path):
+        """
+        Get the tile of text in a cell, rendering and storing it if it isn't cached
+        
+        Args:
+            text: Text of the cell
+            cell_width: Cell width in pixels
+            cell_height: Cell height in pixels
+            font_path: Path to the font file
+        
+        Returns:
+            Tile: tuple of TileLine
+        """
+        memory_key = (text, cell_width, cell_height, font_path)
+        with self._lock:
+            tile = self._memory.get(memory_key)
+            if tile is not None:
+                self._memory.move_to_end(memory_key)
+                self.hits += 1
+                return tile
+        
+        key = tile_key(text, cell_width, cell_height, font_path)
+        tile = self._read(key)
+        rendered = tile is None
+        if rendered:
+            tile = render_tile(text, cell_width, cell_height, font_path)
+            self._write(key, tile)
+        
+        with self._lock:
+            if rendered:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._memory[memory_key] = tile
+            if len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+        return tile
+    
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                tile = _decode_tile(f.read())
+            os.utime(path)
+        except (OSError, ValueError, struct.error, zlib.error):
+            # Missing, evicted meanwhile, or unreadable: render it again
+            return None
+        return tile
+    
+    def _write(self, key, tile):
+        path = self._path(key)
+        data = _encode_tile(tile)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            # A read-only or full cache only costs the rendering
+            return
+        
+        self._written_bytes += len(data)
+        if self._written_bytes > self.max_bytes // 8:
+            self.evict()
+    
+    def evict(self):
+        """
+        Delete the least recently used tiles until the cache is under its size limit
+        
+        Returns:
+            Number of tiles deleted
+        """
+        self._written_bytes = 0
+        entries = []
+        total = 0
+        try:
+            shards = list(os.scandir(self.directory))
+        except OSError:
+            return 0
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            try:
+                for entry in os.scandir(shard.path):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            except OSError:
+                continue
+        if total <= self.max_bytes:
+            return 0
+        
+        deleted = 0
+        entries.sort()
+        target = self.max_bytes * _EVICT_TO
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                deleted += 1
+            except OSError:
+                # Another process got there first
+                pass
+            total -= size
+        return deleted
+
+
+def distinct_cells(card_layout, pages):
+    """
+    The different (text, cell width, cell height) of the song cells of some pages
+    
+    Args:
+        card_layout: PageLayout of the template
+        pages: Pages, each a list of cards, each a list of songs
+    
+    Returns:
+        List of (text, cell_width, cell_height), in order of first appearance
+    """
+    cells = {}
+    for page in pages:
+        for card_idx, inner_cells in enumerate(card_layout.cells):
+            for (_, _, cell_width, cell_height), text in zip(inner_cells, card_layout.card_texts(page, card_idx)):
+                cells.setdefault((text, cell_width, cell_height), None)
+    return list(cells)
+
+
+class TileAtlas:
+    """
+    Tiles of song titles kept in memory only, each drawn once per process
+    
+    A deck repeats a few dozen titles over thousands of cells, so the pages are
+    faster to build by pasting the masks of tiles drawn once than by drawing
+    every title again. prerender draws the titles of a deck before its pages
+    are rendered; a title missing from the atlas is drawn on first use.
+    get has the same signature as TileCache.get, so either can be handed to
+    the renderers. Threads may share an atlas: at worst a title is drawn twice.
+    """
+    
+    def __init__(self, max_tiles=None):
+        """
+        Args:
+            max_tiles: If set, the atlas starts over once it holds this many tiles,
+                       for long-lived processes that see many song pools
+        """
+        self.max_tiles = max_tiles
+        self._tiles = {}
+    
+    def __len__(self):
+        return len(self._tiles)
+    
+    def get(self, text, cell_width, cell_height, font_path):
+        """Get the tile of text in a cell, drawing it if it isn't in the atlas yet"""
+        key = (text, cell_width, cell_height, font_path)
+        tile = self._tiles.get(key)
+        if tile is None:
+            tile = render_tile(text, cell_width, cell_height, font_path)
+            if self.max_tiles is not None and len(self._tiles) >= self.max_tiles:
+                self._tiles.clear()
+            self._tiles[key] = tile
+        return tile
+    
+    def prerender(self, cells, font_path):
+        """
+        Draw the tiles of some cells ahead of the pages
+        
+        Args:
+            cells: (text, cell_width, cell_height) of each cell, e.g. from distinct_cells
+            font_path: Path to the font file
+        """
+        for text, cell_width, cell_height in cells:
+            self.get(text, cell_width, cell_height, font_path)
@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+from musical_bingo_maker import DeckConfig, load_song_pools
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_PATH = os.path.join(ROOT, "template.jpg")
+FONT_PATH = os.path.join(ROOT, "JandaManateeSolid.ttf")
+SONGS_PATH = os.path.join(ROOT, "songs.json")
+
+
+@pytest.fixture(scope="session")
+def song_pools():
+    """(canciones, canciones_ganadoras) of the example songs.json"""
+    return load_song_pools(SONGS_PATH)
+
+
+@pytest.fixture
+def config(song_pools):
+    canciones, canciones_ganadoras = song_pools
+    return DeckConfig(canciones, canciones_ganadoras, num_sheets=6, seed=1)
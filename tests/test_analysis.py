@@ -0,0 +1,79 @@
+from dataclasses import replace
+
+import pytest
+
+from musical_bingo_maker import (
+    CompactDeck,
+    analyze_deck,
+    analyze_pages,
+    check_for_duplicate_cards,
+    generate,
+    verify_deck,
+)
+from musical_bingo_maker import analysis
+
+GANADORAS = ["G1", "G2", "G3"]
+
+PAGES = [
+    [["G1", "G2", "G3"], ["G1", "a", "b"], ["b", "a", "G1"]],
+    [["a", "a", "b"], ["a", "b", "b"], ["G3", "G2", "G1"]],
+]
+
+
+def test_report_of_handmade_pages():
+    report = analyze_pages(PAGES, ["a", "b", "c"], GANADORAS)
+    assert report.total_cards == 6
+    # Same songs in another order, and the same songs with other repetitions
+    assert report.duplicate_groups == [[(1, 1), (2, 3)], [(1, 2), (1, 3)], [(2, 1), (2, 2)]]
+    assert report.duplicate_songs == [GANADORAS, ["G1", "a", "b"], ["a", "b"]]
+    assert report.exact_duplicate_groups == [[(1, 1), (2, 3)], [(1, 2), (1, 3)]]
+    assert report.unique_cards == 3
+    assert report.winner_locations == [(1, 1), (2, 3)]
+    assert report.internal_duplicates == {(2, 1): ["a"], (2, 2): ["b"]}
+    assert report.song_counts["a"] == 5 and report.song_counts["G1"] == 4
+    assert (report.min_songs_per_card, report.max_songs_per_card) == (2, 3)
+    assert report.pool_usage() == ({"G1", "G2", "G3"}, {"a", "b"}, 8, 10)
+    assert report.usage_spread() == {"canciones_ganadoras": (2, 4), "canciones": (5, 5)}
+    assert not report.ok
+
+
+def test_check_for_duplicate_cards(capsys):
+    assert not check_for_duplicate_cards(PAGES, verbose=False)
+    assert check_for_duplicate_cards([PAGES[0][:2]], verbose=False)
+    assert capsys.readouterr().out == ""
+
+
+def test_generated_deck_passes_verification(config):
+    deck = generate(config)
+    report = analyze_deck(deck)
+    assert report.ok and report.all_unique
+    assert report.total_cards == config.num_sheets * config.cards_per_page
+    assert report.winner_locations == [(1, 1)]
+    assert verify_deck(deck, report, verbose=False)
+
+
+def test_batch_analysis_of_handmade_pages():
+    pytest.importorskip("numpy")
+    songs = ["G1", "G2", "G3", "a", "b", "c"]
+    ids = [[songs.index(song) for song in card] for page in PAGES for card in page]
+    assert analysis.analyze_ids(ids, songs, 3, ["a", "b", "c"], GANADORAS) == \
+        analyze_pages(PAGES, ["a", "b", "c"], GANADORAS)
+
+
+@pytest.mark.parametrize("balanced", [False, True])
+def test_batch_analysis_matches_analyze_pages(config, monkeypatch, balanced):
+    pytest.importorskip("numpy")
+    deck = generate(replace(config, num_sheets=15, balanced=balanced))
+    # Repeat some cards, one with its songs in another order
+    deck.pages[3][2] = list(reversed(deck.pages[0][5]))
+    deck.pages[4][1] = list(deck.pages[0][5])
+    deck.pages[5][0] = list(deck.pages[0][0])
+    expected = analyze_pages(deck.pages, deck.canciones, deck.canciones_ganadoras)
+    assert expected.exact_duplicate_groups and expected.winner_count == 2
+
+    assert analyze_deck(CompactDeck.from_deck(deck)) == expected
+    monkeypatch.setattr(analysis, "BATCH_ANALYSIS_CARDS", 0)
+    report = analyze_deck(deck)
+    assert report == expected
+    # The summaries list songs in the same order too
+    assert list(report.song_counts) == list(expected.song_counts)
@@ -0,0 +1,56 @@
+import random
+from dataclasses import replace
+
+import pytest
+
+from musical_bingo_maker import early_cards, generate, repair_early_cards
+
+
+@pytest.fixture
+def deck_and_call_order(config):
+    config = replace(config, num_sheets=15)
+    pool = config.canciones[:config.max_canciones]
+    # Half the fillers are called before the last canciones_ganadoras, so many cards are early
+    call_order = pool[:len(pool) // 2] + config.canciones_ganadoras + pool[len(pool) // 2:]
+    return config, generate(config), call_order
+
+
+def test_early_cards_are_complete_before_the_winning_card(deck_and_call_order):
+    config, deck, call_order = deck_and_call_order
+    called = set(call_order[:call_order.index(config.canciones_ganadoras[-1]) + 1])
+    cards = {(page, card): songs for page, cards in enumerate(deck.pages, 1)
+             for card, songs in enumerate(cards, 1)}
+    expected = [location for location, songs in cards.items()
+                if set(songs) <= called and set(songs) != set(config.canciones_ganadoras)]
+    assert expected
+    assert early_cards(deck.pages, call_order, config.canciones_ganadoras) == expected
+
+
+def test_repair_leaves_a_unique_deck_without_early_cards(deck_and_call_order):
+    config, deck, call_order = deck_and_call_order
+    before = early_cards(deck.pages, call_order, config.canciones_ganadoras)
+    repaired = repair_early_cards(deck.pages, call_order, config.canciones, config.canciones_ganadoras,
+                                  random.Random(1), config.max_canciones)
+    assert repaired == before
+    assert early_cards(deck.pages, call_order, config.canciones_ganadoras) == []
+
+    cards = [card for page in deck.pages for card in page]
+    assert len({tuple(sorted(card)) for card in cards}) == len(cards)
+    # Replacements come from the pool the deck was dealt from
+    allowed = set(config.canciones[:config.max_canciones]) | set(config.canciones_ganadoras)
+    assert all(set(card) <= allowed for card in cards)
+
+
+def test_repair_compares_cards_as_multisets():
+    # Both ways of repairing the early card have the songs of the other card, but not as many of each
+    pages = [[["G1", "G2", "a", "a", "b", "b"], ["G1", "G2", "late", "late", "a", "b"]]]
+    call_order = ["a", "b", "G1", "G2", "late"]
+    assert repair_early_cards(pages, call_order, ["a", "b", "late"], ["G1", "G2"], random.Random(1)) == [(1, 1)]
+    assert early_cards(pages, call_order, ["G1", "G2"]) == []
+    assert sorted(pages[0][0]) != sorted(pages[0][1])
+
+
+def test_repair_fails_when_no_card_is_left():
+    pages = [[["G1", "a"], ["G1", "late"]]]
+    with pytest.raises(ValueError):
+        repair_early_cards(pages, ["a", "G1", "late"], ["a", "late"], ["G1"], random.Random(1))
@@ -0,0 +1,124 @@
+import collections
+import itertools
+import json
+from dataclasses import replace
+
+import pytest
+
+from musical_bingo_maker import CompactDeck, compact_deck, generate, iter_pages, load_deck, shard_pages
+from musical_bingo_maker import compact
+from musical_bingo_maker.cards import deck_sampler
+
+
+def all_cards(pages):
+    return [card for page in pages for card in page]
+
+
+def test_generate_is_reproducible(config):
+    assert generate(config).pages == generate(config).pages
+
+
+def test_over_capacity_deck_fails_before_the_first_page(config):
+    config = replace(config, canciones=config.canciones[:4], num_sheets=100)
+    with pytest.raises(ValueError, match="Cannot make 100 sheets"):
+        deck_sampler(config, config.seed)
+    # Raised by the call itself, not when the first page is taken
+    with pytest.raises(ValueError):
+        iter_pages(config)
+
+
+def test_largest_deck_the_pools_allow_is_generated(config):
+    config = replace(config, canciones=config.canciones[:4], num_sheets=1)
+    while True:
+        try:
+            deck_sampler(replace(config, num_sheets=config.num_sheets + 1), config.seed)
+        except ValueError:
+            break
+        config = replace(config, num_sheets=config.num_sheets + 1)
+    cards = [card for page in generate(config).pages for card in page]
+    assert len({tuple(sorted(card)) for card in cards}) == len(cards)
+
+
+@pytest.mark.parametrize("num_shards", [2, 3, 6])
+def test_shards_make_the_serial_deck(config, num_shards):
+    pages = []
+    for shard in range(num_shards):
+        pages += generate(config, shard_pages(config.num_sheets, shard, num_shards)).pages
+    assert pages == generate(config).pages
+
+
+def test_batch_cards_match_serial_cards(config):
+    pytest.importorskip("numpy")
+    from musical_bingo_maker.batch import sample_cards
+
+    ids, songs = sample_cards(config)
+    assert [[songs[song_id] for song_id in card] for card in ids.tolist()] == all_cards(generate(config).pages)
+
+
+@pytest.mark.parametrize("balanced", [False, True])
+def test_cards_are_unique_with_one_winner(config, balanced):
+    config = replace(config, num_sheets=15, balanced=balanced)
+    cards = all_cards(generate(config).pages)
+    assert len({tuple(sorted(card)) for card in cards}) == len(cards)
+    if balanced:
+        assert all(len(set(card)) == len(card) for card in cards)
+
+    ganadoras = set(config.canciones_ganadoras)
+    winners = [card for card in cards if ganadoras <= set(card)]
+    assert winners == [cards[0]]
+    assert all(3 <= len(ganadoras & set(card)) <= 5 for card in cards[1:])
+
+
+def test_balanced_spread_is_at_most_one(config):
+    config = replace(config, num_sheets=15, balanced=True)
+    usage = collections.Counter(itertools.chain.from_iterable(all_cards(generate(config).pages)))
+    for pool in (config.canciones_ganadoras, config.canciones[:config.max_canciones]):
+        counts = [usage[song] for song in pool]
+        assert max(counts) - min(counts) <= 1
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_compact_deck_round_trips(config, tmp_path, use_mmap):
+    deck = generate(config)
+    path = str(tmp_path / "deck.mbd")
+    CompactDeck.from_deck(deck).save(path)
+    loaded = load_deck(path, use_mmap=use_mmap)
+    restored = loaded.to_deck()
+    assert restored.pages == deck.pages
+    assert restored.canciones == deck.canciones
+    assert restored.canciones_ganadoras == deck.canciones_ganadoras
+    assert restored.seed == deck.seed
+    assert loaded.to_deck(range(3, 5)).pages == deck.pages[2:4]
+
+
+def test_compact_deck_generates_the_same_cards(config):
+    assert compact_deck(config).to_deck().pages == generate(config).pages
+    assert compact_deck(config, range(2, 4)).to_deck().pages == generate(config, range(2, 4)).pages
+
+
+def test_load_deck_rejects_other_files(tmp_path):
+    path = tmp_path / "not-a-deck"
+    path.write_bytes(b"%PDF-1.4\n")
+    with pytest.raises(ValueError):
+        load_deck(str(path))
+
+
+@pytest.mark.parametrize("damage", [
+    lambda metadata: metadata.pop("seed"),
+    lambda metadata: metadata["canciones"].append(1000),
+    lambda metadata: metadata.update(songs=None),
+])
+def test_load_deck_rejects_damaged_metadata(config, tmp_path, damage):
+    path = tmp_path / "deck.mbd"
+    CompactDeck.from_deck(generate(config)).save(str(path))
+    data = path.read_bytes()
+    *fields, metadata_size = compact._HEADER.unpack_from(data)
+    start = compact._HEADER.size
+    metadata = json.loads(data[start:start + metadata_size])
+    ids = data[start + metadata_size + -(start + metadata_size) % compact._ALIGNMENT:]
+    damage(metadata)
+    damaged = json.dumps(metadata).encode("utf-8")
+    header = compact._HEADER.pack(*fields, len(damaged))
+    path.write_bytes(header + damaged + bytes(-(start + len(damaged)) % compact._ALIGNMENT) + ids)
+    with pytest.raises(ValueError, match="is not a musical bingo deck"):
+        load_deck(str(path))
@@ -0,0 +1,26 @@
+import pytest
+
+from musical_bingo_maker.cli import build_parser
+
+
+@pytest.mark.parametrize("option, value", [
+    ("--jpeg-quality", "0"),
+    ("--jpeg-quality", "96"),
+    ("--png-compress-level", "-1"),
+    ("--png-compress-level", "10"),
+    ("--dpi", "0"),
+    ("--dpi", "2401"),
+    ("--dpi", "high"),
+])
+def test_out_of_range_image_options_are_rejected(option, value, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        build_parser().parse_args([option, value])
+    assert exit_info.value.code == 2
+    assert option in capsys.readouterr().err
+
+
+def test_image_options_at_their_limits():
+    args = build_parser().parse_args(["--jpeg-quality", "95", "--png-compress-level", "0", "--dpi", "2400"])
+    assert (args.jpeg_quality, args.png_compress_level, args.dpi) == (95, 0, 2400)
+    args = build_parser().parse_args([])
+    assert (args.jpeg_quality, args.png_compress_level, args.dpi) == (90, 6, None)
@@ -0,0 +1,70 @@
+from dataclasses import replace
+
+import pytest
+
+from conftest import FONT_PATH, TEMPLATE_PATH
+from musical_bingo_maker import create_pdf_with_images, generate, main, merge_pdfs
+from musical_bingo_maker.pdfmerge import PdfName, PdfReader, PdfRef, PdfStream
+
+PDF_OPTIONS = {"dpi": 40, "png_compress_level": 1, "verbose": False}
+
+
+def write_page_pdfs(config, directory, **options):
+    """Write the pages of a two-page deck to a PDF each"""
+    deck = generate(replace(config, num_sheets=2))
+    paths = []
+    for page_number, page in enumerate(deck.pages, 1):
+        path = str(directory / f"page{page_number}.pdf")
+        create_pdf_with_images(TEMPLATE_PATH, [page], path, font_path=FONT_PATH, first_page=page_number,
+                               **dict(PDF_OPTIONS, **options))
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def page_pdfs(config, tmp_path):
+    return write_page_pdfs(config, tmp_path)
+
+
+def image_objects(reader):
+    """Numbers of the image XObjects of a PDF"""
+    images = []
+    for num in reader.offsets:
+        value = reader.get(PdfRef(num, 0))
+        if isinstance(value, PdfStream) and value.dict.get(PdfName(b"Subtype")) == PdfName(b"Image"):
+            images.append(num)
+    return images
+
+
+def page_images(reader):
+    """References of the image XObjects each page uses"""
+    pages = []
+    for _, page in reader.iter_pages():
+        xobjects = reader.resolve(reader.resolve(page[PdfName(b"Resources")]).get(PdfName(b"XObject"), {}))
+        pages.append(set(xobjects.values()))
+    return pages
+
+
+def test_merge_shares_the_template_of_vector_pages(config, tmp_path):
+    paths = write_page_pdfs(config, tmp_path, render_mode="vector")
+    assert [len(image_objects(PdfReader(path))) for path in paths] == [1, 1]
+    merged_path = str(tmp_path / "merged.pdf")
+    assert merge_pdfs(paths, merged_path) == 2
+    merged = PdfReader(merged_path)
+    images = image_objects(merged)
+    assert len(images) == 1
+    assert page_images(merged) == [{PdfRef(images[0], 0)}] * 2
+
+
+def test_merge_into_one_of_the_inputs(page_pdfs):
+    assert main(["--merge", *page_pdfs, "--output", page_pdfs[0], "--quiet"]) == 0
+    assert len(list(PdfReader(page_pdfs[0]).iter_pages())) == 2
+
+
+def test_merge_reports_a_missing_input(page_pdfs, tmp_path, capsys):
+    output_path = tmp_path / "merged.pdf"
+    assert main(["--merge", page_pdfs[0], str(tmp_path / "missing.pdf"), "--output", str(output_path)]) == 1
+    assert capsys.readouterr().err.startswith("Error: ")
+    assert not output_path.exists()
+    # Nor a temporary file
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["page1.pdf", "page2.pdf"]
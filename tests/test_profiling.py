@@ -0,0 +1,53 @@
+import io
+import json
+import os
+import pstats
+from dataclasses import replace
+
+from conftest import FONT_PATH, TEMPLATE_PATH
+from musical_bingo_maker import create_pdf_with_images, generate
+from musical_bingo_maker.profiling import is_enabled, profile_run, recording, stage
+
+
+def test_stages_are_free_when_not_recording():
+    assert not is_enabled()
+    assert stage("draw") is stage("encode")
+
+
+def test_recording_collects_spans_per_stage():
+    with recording() as recorder:
+        assert is_enabled()
+        for _ in range(3):
+            with stage("fit"):
+                pass
+        with recording() as inner:
+            with stage("draw"):
+                pass
+        with stage("encode"):
+            pass
+    assert not is_enabled()
+    assert [name for name, *_ in recorder.spans] == ["fit", "fit", "fit", "encode"]
+    assert [name for name, *_ in inner.spans] == ["draw"]
+    summary = recorder.summary()
+    assert list(summary) == ["fit", "encode"]
+    count, total, p50, p99 = summary["fit"]
+    assert count == 3 and 0 <= p50 <= p99 <= total
+
+
+def test_profile_run_of_a_deck(config, tmp_path):
+    deck = generate(replace(config, num_sheets=1))
+    cprofile_path = str(tmp_path / "run.prof")
+    trace_path = str(tmp_path / "run.json")
+    report = io.StringIO()
+    with profile_run(cprofile_path=cprofile_path, trace_path=trace_path, file=report) as recorder:
+        create_pdf_with_images(TEMPLATE_PATH, deck.pages, str(tmp_path / "deck.pdf"), font_path=FONT_PATH,
+                               dpi=40, verbose=False)
+    stages = set(recorder.summary())
+    assert {"draw", "encode", "pdf_save"} <= stages
+    assert all(name in report.getvalue() for name in stages)
+
+    with open(trace_path) as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == len(recorder.spans)
+    assert all(event["ph"] == "X" and event["pid"] == os.getpid() for event in events)
+    assert pstats.Stats(cprofile_path).total_calls > 0
@@ -0,0 +1,119 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+import pytest
+
+from conftest import FONT_PATH, TEMPLATE_PATH
+from musical_bingo_maker import (
+    TileAtlas,
+    TileCache,
+    build_incremental,
+    create_image_with_text,
+    create_pdf_with_images,
+    generate,
+    merge_pdfs,
+    page_layout,
+    render_card,
+)
+from musical_bingo_maker.render import bounded_map, cached_template, load_template, template_size, write_page_pdfs
+from musical_bingo_maker.tilecache import distinct_cells
+
+# Small raster pages keep the PDF tests quick; every build of a test uses the same settings
+PDF_OPTIONS = {"dpi": 40, "png_compress_level": 1, "verbose": False}
+
+
+@pytest.fixture
+def deck(config):
+    return generate(replace(config, num_sheets=2))
+
+
+def page_pixels(pdf_path):
+    """Rasterized pages of a PDF, as raw RGB bytes"""
+    pymupdf = pytest.importorskip("pymupdf")
+    with pymupdf.open(pdf_path) as document:
+        return [page.get_pixmap(dpi=30).samples for page in document]
+
+
+def assert_same_pixels(image, expected):
+    assert image.size == expected.size
+    assert image.tobytes() == expected.tobytes()
+
+
+@pytest.mark.parametrize("kind", ["atlas", "tile_cache"])
+def test_pasted_tiles_match_drawn_text(deck, tmp_path, kind):
+    tile_cache = TileAtlas() if kind == "atlas" else TileCache(str(tmp_path))
+    for page in deck.pages:
+        expected = create_image_with_text(TEMPLATE_PATH, page, FONT_PATH)
+        # Twice, so the second time is pasted from the tiles stored the first time
+        for _ in range(2):
+            assert_same_pixels(create_image_with_text(TEMPLATE_PATH, page, FONT_PATH, tile_cache), expected)
+
+
+def test_prerendered_atlas_matches_drawn_text(deck):
+    card_layout = page_layout(TEMPLATE_PATH, *template_size(TEMPLATE_PATH))
+    atlas = TileAtlas()
+    atlas.prerender(distinct_cells(card_layout, deck.pages), FONT_PATH)
+    for page in deck.pages:
+        assert_same_pixels(create_image_with_text(TEMPLATE_PATH, page, FONT_PATH, atlas),
+                           create_image_with_text(TEMPLATE_PATH, page, FONT_PATH))
+
+
+@pytest.mark.parametrize("kind", ["drawn", "atlas"])
+def test_single_card_matches_its_page(deck, kind):
+    tile_cache = TileAtlas() if kind == "atlas" else None
+    page = deck.pages[0]
+    image = create_image_with_text(TEMPLATE_PATH, page, FONT_PATH)
+    card_layout = page_layout(TEMPLATE_PATH, *image.size)
+    for card_idx, (x0, y0, width, height) in enumerate(card_layout.card_boxes):
+        card = render_card(TEMPLATE_PATH, page[card_idx], card_idx, FONT_PATH, tile_cache)
+        assert_same_pixels(card, image.crop((x0, y0, x0 + width, y0 + height)))
+
+
+def test_merged_pages_match_full_build(deck, tmp_path):
+    full_path = str(tmp_path / "full.pdf")
+    create_pdf_with_images(TEMPLATE_PATH, deck.pages, full_path, font_path=FONT_PATH, **PDF_OPTIONS)
+    page_paths = [str(tmp_path / f"page{page_number}.pdf") for page_number in range(1, len(deck.pages) + 1)]
+    write_page_pdfs(TEMPLATE_PATH, deck.pages, page_paths, font_path=FONT_PATH, **PDF_OPTIONS)
+    merged_path = str(tmp_path / "merged.pdf")
+    assert merge_pdfs(page_paths, merged_path) == len(deck.pages)
+    assert page_pixels(merged_path) == page_pixels(full_path)
+
+
+def test_incremental_build_matches_full_build(deck, tmp_path):
+    full_path = str(tmp_path / "full.pdf")
+    create_pdf_with_images(TEMPLATE_PATH, deck.pages, full_path, font_path=FONT_PATH, **PDF_OPTIONS)
+    incremental_path = str(tmp_path / "incremental.pdf")
+    assert build_incremental(TEMPLATE_PATH, deck, incremental_path, font_path=FONT_PATH, **PDF_OPTIONS) == [1, 2]
+    assert page_pixels(incremental_path) == page_pixels(full_path)
+    # Nothing changed, so the second build reuses every page
+    assert build_incremental(TEMPLATE_PATH, deck, incremental_path, font_path=FONT_PATH, **PDF_OPTIONS) == []
+    assert page_pixels(incremental_path) == page_pixels(full_path)
+
+
+def test_bounded_map_keeps_few_tasks_in_flight():
+    consumed = []
+
+    def items():
+        for item in range(10):
+            consumed.append(item)
+            yield item
+
+    with ThreadPoolExecutor(2) as executor:
+        results = bounded_map(executor, lambda item: item * item, items(), 3)
+        assert next(results) == 0 and consumed == [0, 1, 2]
+        assert list(results) == [item * item for item in range(1, 10)]
+
+
+def test_cached_template_is_decoded_again_when_the_file_changes(tmp_path):
+    path = str(tmp_path / "template.png")
+    shutil.copy(TEMPLATE_PATH, path)
+    template = cached_template(path)
+    assert cached_template(path) is template
+    assert load_template(path) is not template and template_size(path) == template.size
+
+    template.resize((10, 20)).save(path)
+    # A modification time of its own, even where the clock is coarse
+    os.utime(path, ns=(1, 1))
+    assert cached_template(path).size == template_size(path) == (10, 20)
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import signal
+
+import pytest
+
+from conftest import FONT_PATH, TEMPLATE_PATH
+from musical_bingo_maker.server import JobServer, parse_job_request, serve
+
+
+async def request(port, method, path, body=None):
+    """Send one HTTP request to the server and return (status, body), reading chunked bodies to the end"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = b"" if body is None else json.dumps(body).encode("utf-8")
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\n"
+                 f"Connection: close\r\n\r\n".encode("latin-1") + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding") == "chunked":
+        content = b""
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            if size == 0:
+                break
+            content += (await reader.readexactly(size + 2))[:-2]
+    else:
+        content = await reader.readexactly(int(headers["content-length"]))
+    writer.close()
+    return status, content
+
+
+@pytest.mark.parametrize("field, value", [
+    ("sheets", 0),
+    ("sheets", "3"),
+    ("balanced", "false"),
+    ("balanced", 1),
+    ("render_mode", "ink"),
+    ("canciones", []),
+])
+def test_invalid_job_requests_are_rejected(song_pools, field, value):
+    canciones, canciones_ganadoras = song_pools
+    with pytest.raises(ValueError):
+        parse_job_request({field: value}, canciones, canciones_ganadoras)
+
+
+@pytest.mark.parametrize("balanced", [False, True])
+def test_decks_larger_than_the_song_pools_are_rejected(song_pools, balanced):
+    canciones, canciones_ganadoras = song_pools
+    data = {"canciones": canciones[:8], "sheets": 100, "balanced": balanced}
+    with pytest.raises(ValueError, match="Cannot make 100"):
+        parse_job_request(data, canciones, canciones_ganadoras)
+    config, _, _ = parse_job_request(dict(data, sheets=1), canciones, canciones_ganadoras)
+    assert config.num_sheets == 1
+
+
+def test_job_lifecycle(song_pools, tmp_path):
+    canciones, canciones_ganadoras = song_pools
+    server = JobServer(TEMPLATE_PATH, FONT_PATH, workers=1, concurrent_jobs=1, canciones=canciones,
+                       canciones_ganadoras=canciones_ganadoras, max_sheets=4, keep_jobs=1, spool_dir=str(tmp_path))
+    ports = []
+
+    async def scenario():
+        serving = asyncio.ensure_future(serve(server, "127.0.0.1", 0, ports.append))
+        while not ports and not serving.done():
+            await asyncio.sleep(0.05)
+        port = ports[0]
+        try:
+            status, body = await request(port, "GET", "/health")
+            assert status == 200 and json.loads(body)["workers"] == 1
+
+            status, body = await request(port, "POST", "/jobs", {"sheets": 5})
+            assert status == 400
+            status, body = await request(port, "POST", "/jobs", {"sheets": 2, "canciones": ["a"], "balanced": True})
+            assert status == 400 and "Cannot make 2" in json.loads(body)["error"]
+
+            status, body = await request(port, "POST", "/jobs", {"sheets": 2, "seed": 7, "dpi": 40})
+            assert status == 202
+            job = json.loads(body)
+            assert job["state"] == "queued" and job["seed"] == 7
+
+            # The stream starts before the job is done and ends with the whole PDF
+            status, pdf = await request(port, "GET", job["links"]["pdf"])
+            assert status == 200
+            assert pdf.startswith(b"%PDF") and pdf.rstrip().endswith(b"%%EOF")
+
+            status, body = await request(port, "GET", job["links"]["self"])
+            finished = json.loads(body)
+            assert finished["state"] == "done"
+            assert finished["pages_done"] == finished["total_pages"] == 2
+            assert finished["pdf_bytes"] == len(pdf)
+
+            # keep_jobs=1: the next finished job replaces the first one, whose spooled PDF is deleted
+            status, body = await request(port, "POST", "/jobs", {"sheets": 1, "dpi": 40})
+            second = json.loads(body)
+            status, _ = await request(port, "GET", second["links"]["pdf"])
+            assert status == 200
+            status, _ = await request(port, "GET", job["links"]["self"])
+            assert status == 404
+            assert len(os.listdir(str(tmp_path))) == 1
+        finally:
+            serving.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await serving
+
+    asyncio.run(scenario())
+    # Stopping the server deletes the PDFs of the jobs it still kept
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_a_dead_worker_fails_its_job_and_the_pool_is_restarted(song_pools, tmp_path):
+    canciones, canciones_ganadoras = song_pools
+    server = JobServer(TEMPLATE_PATH, FONT_PATH, workers=1, concurrent_jobs=1, canciones=canciones,
+                       canciones_ganadoras=canciones_ganadoras, max_sheets=4, spool_dir=str(tmp_path))
+    ports = []
+
+    async def wait_for(port, job, state):
+        while True:
+            status, body = await request(port, "GET", job["links"]["self"])
+            if json.loads(body)["state"] == state:
+                return
+            await asyncio.sleep(0.05)
+
+    async def scenario():
+        serving = asyncio.ensure_future(serve(server, "127.0.0.1", 0, ports.append))
+        while not ports and not serving.done():
+            await asyncio.sleep(0.05)
+        port = ports[0]
+        try:
+            for pid in list(server._pool._processes):
+                os.kill(pid, signal.SIGKILL)
+            status, body = await request(port, "POST", "/jobs", {"sheets": 1, "dpi": 40})
+            await asyncio.wait_for(wait_for(port, json.loads(body), "failed"), 30)
+            status, body = await request(port, "GET", "/health")
+            health = json.loads(body)
+            assert health["pool_restarts"] == 1 and "BrokenProcessPool" in health["pool_error"]
+
+            status, body = await request(port, "POST", "/jobs", {"sheets": 1, "dpi": 40})
+            await asyncio.wait_for(wait_for(port, json.loads(body), "done"), 30)
+        finally:
+            serving.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await serving
+
+    asyncio.run(scenario())
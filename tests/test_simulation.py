@@ -0,0 +1,50 @@
+import pytest
+
+from musical_bingo_maker import GameSimulator, generate, simulate_deck
+from musical_bingo_maker import simulation
+
+# Card (1, 1) has the canciones_ganadoras x and y. Of the 6 orders of the 3 songs, the 4 that
+# call x and y or y and z first complete a card on call 2; the other 2 complete both on call 3
+PAGES = [[["x", "y"], ["y", "z"]]]
+
+
+@pytest.fixture(params=["numpy", "random"])
+def engine(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(simulation, "np", None)
+    return request.param
+
+
+def test_play_reports_each_completing_call():
+    simulator = GameSimulator(PAGES, ["z"], ["x", "y"])
+    assert simulator.winner_cards == [0]
+    assert simulator.play(["x", "z", "y"]) == [(3, [(1, 1), (1, 2)])]
+    assert simulator.play(["y", "x", "x", "z"], until_first=False) == [(2, [(1, 1)]), (4, [(1, 2)])]
+    # Songs of neither the pools nor the cards aren't counted as calls
+    assert simulator.play(["unknown", "y", "z"]) == [(2, [(1, 2)])]
+
+
+def test_simulate_matches_the_exact_distribution(engine):
+    games = 6000
+    report = GameSimulator(PAGES, ["z"], ["x", "y"]).simulate(games, seed=1)
+    assert (report.games, report.num_cards, report.num_songs) == (games, 2, 3)
+    assert set(report.first_win_calls) == {2, 3}
+    assert sum(report.first_win_calls.values()) == sum(report.first_winners.values()) == games
+    assert report.first_winners[2] == report.first_win_calls[3] == report.tie_games
+    assert report.tie_probability == pytest.approx(1 / 3, abs=0.03)
+    assert report.winning_card_first / games == pytest.approx(2 / 3, abs=0.03)
+    assert report.mean_first_win == pytest.approx(2 + 1 / 3, abs=0.03)
+    assert report.first_win_percentile(0.5) == 2 and report.first_win_percentile(1) == 3
+
+
+def test_simulate_deck_is_reproducible(config, engine):
+    deck = generate(config)
+    report = simulate_deck(deck, 200)
+    assert report == simulate_deck(deck, 200)
+    assert report.num_cards == deck.num_cards
+    assert sum(report.first_win_calls.values()) == 200
+    # A card has 6 songs, and the winning card needs every canciones_ganadoras
+    assert min(report.first_win_calls) >= 6
+    assert max(report.first_win_calls) <= report.num_songs
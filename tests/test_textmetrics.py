@@ -0,0 +1,55 @@
+import pytest
+from PIL import ImageFont, features
+
+from conftest import FONT_PATH
+from musical_bingo_maker.layout import _wrap_text_bbox, load_font, wrap_text
+from musical_bingo_maker.textmetrics import BORDERLINE_MARGIN, glyph_metrics
+
+SIZES = [12, 31, 64]
+
+
+def texts(song_pools):
+    """Titles, their words and their prefixes, including ones that start or end with a space"""
+    canciones, canciones_ganadoras = song_pools
+    titles = canciones + canciones_ganadoras + ["Ñandú vs. ¿Qué?", "AVAVAV", "fi fl ff", "(x)"]
+    words = [word for title in titles for word in title.split()]
+    prefixes = [title[:end] for title in titles for end in range(1, len(title) + 1)]
+    return titles + words + prefixes
+
+
+def bbox_width(font, text):
+    bbox = font.getbbox(text)
+    return bbox[2] - bbox[0]
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_fits_agrees_with_getbbox(song_pools, size):
+    font = load_font(FONT_PATH, size)
+    metrics = glyph_metrics(font)
+    for text in texts(song_pools):
+        exact = bbox_width(font, text)
+        assert metrics.exact_width(text) == exact
+        estimate = metrics.width(text)
+        if estimate is not None:
+            assert abs(estimate - exact) < BORDERLINE_MARGIN
+        for max_width in (exact - 1, exact, exact + 1, exact // 2, 2 * exact):
+            assert metrics.fits(text, max_width) == (exact <= max_width), (text, max_width)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_wrap_text_matches_bbox_wrapping(song_pools, size):
+    font = load_font(FONT_PATH, size)
+    canciones, canciones_ganadoras = song_pools
+    for title in canciones + canciones_ganadoras:
+        for max_width in (50, 120, 200, 400):
+            assert wrap_text(title, font, max_width) == _wrap_text_bbox(title, font, max_width)
+
+
+def test_bitmap_fonts_have_no_glyph_metrics():
+    assert glyph_metrics(ImageFont.load_default_imagefont()) is None
+
+
+@pytest.mark.skipif(not features.check_feature("raqm"), reason="Pillow is built without Raqm")
+def test_raqm_fonts_have_no_glyph_metrics():
+    font = ImageFont.truetype(FONT_PATH, 20, layout_engine=ImageFont.Layout.RAQM)
+    assert glyph_metrics(font) is None